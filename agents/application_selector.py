@@ -1,13 +1,22 @@
 # agents/application_selector.py
 
-from typing import Any
+from typing import Any, Optional
 from agents.base import BaseAgent
+from agents.schemas import AppSelection
 from app.config import settings
+from utils.app_index import AppIndex, app_index
+from utils.response_cache import CachePolicy
 from utils.driver_utils import get_installed_packages
 
 class ApplicationSelectorAgent(BaseAgent):
-    def __init__(self, api_key: str):
-        self.available_apps = get_installed_packages()
+    consumes = ("task", "feedback", "error")
+    produces = ("selected_application", "feedback")
+    response_schema = AppSelection
+    # The choice only depends on the task and the candidate apps, so repeated tasks reuse it.
+    cache_policy = CachePolicy(allow_chat=True)
+
+    def __init__(self, api_key: str, serial: Optional[str] = None):
+        self.serial = serial
         super().__init__(
             name="ApplicationSelectorAgent",
             prompt_key="application_selector",
@@ -16,10 +25,40 @@ class ApplicationSelectorAgent(BaseAgent):
             use_chat=True
         )
 
+    @property
+    def app_index(self) -> AppIndex:
+        return app_index(self.serial)
+
+    def _candidates(self, task: str) -> str:
+        """The installed apps closest to the task, one "package: label" per line."""
+        try:
+            matches = self.app_index.search(task)
+            apps = [app for app, _ in matches] or sorted(self.app_index.apps.values(), key=lambda app: app.package)
+            if apps:
+                return "\n".join(app.describe() for app in apps)
+        except Exception as e:
+            print(f"App index unavailable ({e}); listing all packages")
+        return "\n".join(get_installed_packages(self.serial))
+
+    def _resolve_locally(self, task: str, history: list[dict[str, Any]]) -> Optional[AppSelection]:
+        """An unambiguous match from the app index, unless an app was already opened for this task."""
+        if any(str(msg["content"]).startswith("Application selected:") for msg in history if msg["type"] == "feedback"):
+            return None
+        try:
+            app = self.app_index.resolve(task)
+        except Exception as e:
+            print(f"App index unavailable: {e}")
+            return None
+        if app is None:
+            return None
+        return AppSelection(reasoning=f"The task names '{app.label}', matched locally to {app.package}.",
+                            package=app.package)
+
     def generate_response(self, history: list[dict[str, Any]], expectation: str) -> dict:
         """
         Analyze the task.
-        Return the suitable application.
+        Return the suitable application: resolved locally when the task clearly
+        names an installed app, otherwise chosen by the model from the top candidates.
         """
         task = self._get_latest_by_type(history, "task")
         feedback = self._get_latest_by_type(history, "feedback")
@@ -28,30 +67,28 @@ class ApplicationSelectorAgent(BaseAgent):
         if not task:
             raise ValueError("Missing required context: task")
 
-        feedback_section = ""
-        if feedback:
-            feedback_section += f"Previous feedback: {feedback}\n"
-        if error:
-            feedback_section += f"Previous error: {error}\n"
-
-        prompt = self.fill_prompt(
-            task=task,
-            available_apps=self.available_apps,
-            feedback_section=feedback_section,
-            expectation=expectation
-        )
+        selection = self._resolve_locally(task, history)
+        if selection is not None:
+            print(f"Application resolved locally: {selection.package}")
+        else:
+            feedback_section = ""
+            if feedback:
+                feedback_section += f"Previous feedback: {feedback}\n"
+            if error:
+                feedback_section += f"Previous error: {error}\n"
+
+            prompt = self.fill_prompt(
+                task=task,
+                available_apps=self._candidates(task),
+                feedback_section=feedback_section,
+                expectation=expectation
+            )
 
-        response = self.run_chat(prompt)
+            selection = self.parse_response(self.run_chat(prompt))
 
         return {
             "type": "selected_application",
             "sender": self.name,
-            "content": response.strip()
+            "content": selection.model_dump_json(),
+            "data": selection
         }
-
-    def _get_latest_by_type(self, history: list[dict[str, Any]], msg_type: str) -> str | None:
-        """Return latest message content of a specific type."""
-        for msg in reversed(history):
-            if msg["type"] == msg_type:
-                return msg["content"]
-        return None
\ No newline at end of file
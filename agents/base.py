@@ -1,47 +1,99 @@
 # agents/base.py
 
+import asyncio
+import json
 import os
+import threading
+import time
 import yaml
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+from app.chatroom import latest_content
 from app.config import settings
-from google import genai
-from google.genai import types
 from PIL import ImageFile
-from pydantic import TypeAdapter
+from pydantic import BaseModel, TypeAdapter
+from agents.schemas import ResponseParseError, parse_model, parse_stats
+from utils.api_usage import UsageStats, rate_limiter, usage_stats
+from utils.image_prep import ORIGINAL, ImagePolicy, PreparedImage, image_prep_stats, prepare_image
+from utils.response_cache import CachePolicy, cache_enabled_for, cache_key, image_fingerprint, response_cache
+from utils.token_utils import record_prompt_usage
+from utils.tracing import annotate, span
 
-# Load prompt templates
-PROMPTS = {}
-for filename in os.listdir(settings.PROMPT_DIR):
-    if filename.endswith(".yaml") or filename.endswith(".yml"):
-        prompt_key = os.path.splitext(filename)[0]
-        with open(os.path.join(settings.PROMPT_DIR, filename), "r") as f:
-            print(f"Loading prompt template: {filename}")
-            PROMPTS[prompt_key] = yaml.safe_load(f)
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
+
+_prompts: dict[str, dict] = {}
+_prompts_lock = threading.Lock()
+
+
+def load_prompt(prompt_key: str) -> dict:
+    """The parsed PROMPT_DIR/<prompt_key>.yaml template, read once per process."""
+    with _prompts_lock:
+        if prompt_key not in _prompts:
+            for extension in (".yaml", ".yml"):
+                path = os.path.join(settings.PROMPT_DIR, prompt_key + extension)
+                if os.path.exists(path):
+                    with open(path, "r") as f:
+                        _prompts[prompt_key] = yaml.safe_load(f)
+                    break
+            else:
+                raise KeyError(f"No prompt template '{prompt_key}' in {settings.PROMPT_DIR}")
+        return _prompts[prompt_key]
 
 
 class BaseAgent(ABC):
+    # Message types this agent reads from history and adds to it (including what the
+    # orchestrator derives from its response). Used to decide which selected agents
+    # can run concurrently within one step.
+    consumes: tuple[str, ...] = ()
+    produces: tuple[str, ...] = ()
+    # Seconds before a concurrent call is cancelled; None disables the limit.
+    timeout: float | None = settings.AGENT_TIMEOUT_SECONDS
+    # Pydantic model the model's JSON output is constrained to and validated into.
+    response_schema: type[BaseModel] | None = None
+    # How this agent's responses are cached when RESPONSE_CACHE_ENABLED is on; None uses CachePolicy()
+    cache_policy: CachePolicy | None = None
+    # How images are downscaled and encoded for this agent's vision calls; None sends full-size PNG
+    image_policy: ImagePolicy | None = None
+
     def __init__(self, name: str, prompt_key: str, api_key: str, model: str = settings.DEFAULT_MODEL, use_chat: bool = True):
         self.name = name
         self.prompt_key = prompt_key
         self.api_key = api_key
         self.model_id = model
         self.use_chat = use_chat
-        self.prompt_template = PROMPTS[prompt_key]["prompt"]
-        self.system_instruction = PROMPTS[prompt_key].get("system")
-
-        # Gemini client setup
-        self.client = genai.Client(api_key=self.api_key)
-        self.chat = None
-
-        if self.use_chat:
-            config = types.GenerateContentConfig()
-            if self.system_instruction:
-                config.system_instruction = self.system_instruction
-            self.chat = self.client.chats.create(
+        prompt = load_prompt(prompt_key)
+        self.prompt_template = prompt["prompt"]
+        self.system_instruction = prompt.get("system")
+
+        # The Gemini client and chat session are created on first use (see `client` and `chat`).
+        self._client: "genai.Client | None" = None
+        self._chat = None
+        # Calls, latency and tokens of this instance (also added to the process-wide usage_stats)
+        self.usage = UsageStats()
+        # Cache key of the last response served from or stored in the response cache
+        self._last_cache_key: Optional[str] = None
+        # Latency of the last model request, excluding rate-limit waits
+        self._last_model_seconds: Optional[float] = None
+
+    @property
+    def client(self) -> "genai.Client":
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    @property
+    def chat(self):
+        """The agent's chat session (None unless use_chat), opened on first use."""
+        if self._chat is None and self.use_chat:
+            from google.genai import types
+            self._chat = self.client.chats.create(
                 model=self.model_id,
-                config=config
+                config=self._generate_config() or types.GenerateContentConfig()
             )
+        return self._chat
 
     def fill_prompt(self, **kwargs) -> str:
         """Fill the prompt template using task-specific values."""
@@ -51,30 +103,236 @@ class BaseAgent(ABC):
         """Send a message using chat interface."""
         if not self.chat:
             raise ValueError("Chat mode not initialized.")
-        response = self.chat.send_message(message)
-        return response.text
+        with span(self.name, "agent", call="chat", model=self.model_id, prompt_chars=len(message)):
+            cached, key = self._cache_lookup(message, chat=True)
+            if cached is not None:
+                self._record_chat_turn(message, cached)
+                return cached
+            response = self._call_model(lambda: self.chat.send_message(message))
+            self._cache_store(key, response)
+            return response.text
 
     def run_generate(self, message: str) -> str:
         """Send a one-shot generation request (stateless)."""
-        response = self.client.models.generate_content(
-            model=self.model_id,
-            contents=message,
-            config=types.GenerateContentConfig(
-                system_instruction=self.system_instruction
-            ) if self.system_instruction else None
-        )
-        return response.text
+        with span(self.name, "agent", call="generate", model=self.model_id, prompt_chars=len(message)):
+            cached, key = self._cache_lookup(message)
+            if cached is not None:
+                return cached
+            response = self._call_model(lambda: self.client.models.generate_content(
+                model=self.model_id,
+                contents=message,
+                config=self._generate_config()
+            ), prompt=message)
+            self._cache_store(key, response)
+            return response.text
 
     def run_image(self, message: str, image: ImageFile) -> str:
         """Send a one-shot generation request (stateless)."""
-        response = self.client.models.generate_content(
-            model=self.model_id,
-            contents=[message, image],
-            config=types.GenerateContentConfig(
-                system_instruction=self.system_instruction
-            ) if self.system_instruction else None
+        with span(self.name, "agent", call="image", model=self.model_id, prompt_chars=len(message)):
+            cached, key = self._cache_lookup(message, image=image)
+            if cached is not None:
+                return cached
+            image_part, prepared = self._image_part(image)
+            response = self._call_model(lambda: self.client.models.generate_content(
+                model=self.model_id,
+                contents=[message, image_part],
+                config=self._generate_config()
+            ))
+            image_prep_stats.record(prepared, self._last_model_seconds)
+            self._cache_store(key, response)
+            return response.text
+
+    async def arun_chat(self, message: str) -> str:
+        """
+        Async variant of run_chat.
+        The turn is sent with the session's history and recorded back into the
+        same chat session, so sync and async turns share one conversation.
+        """
+        if not self.chat:
+            raise ValueError("Chat mode not initialized.")
+        with span(self.name, "agent", call="chat", model=self.model_id, prompt_chars=len(message)):
+            cached, key = self._cache_lookup(message, chat=True)
+            if cached is not None:
+                self._record_chat_turn(message, cached)
+                return cached
+            from google.genai import types
+            user_content = types.UserContent(parts=[types.Part.from_text(text=message)])
+            response = await self._acall_model(lambda: self.client.aio.models.generate_content(
+                model=self.model_id,
+                contents=[*self.chat.get_history(curated=True), user_content],
+                config=self._generate_config()
+            ))
+            candidate = response.candidates[0].content if response.candidates else None
+            self.chat.record_history(
+                user_input=user_content,
+                model_output=[candidate] if candidate else [],
+                is_valid=candidate is not None
+            )
+            self._cache_store(key, response)
+            return response.text
+
+    async def arun_generate(self, message: str) -> str:
+        """Async variant of run_generate."""
+        with span(self.name, "agent", call="generate", model=self.model_id, prompt_chars=len(message)):
+            cached, key = self._cache_lookup(message)
+            if cached is not None:
+                return cached
+            response = await self._acall_model(lambda: self.client.aio.models.generate_content(
+                model=self.model_id,
+                contents=message,
+                config=self._generate_config()
+            ), prompt=message)
+            self._cache_store(key, response)
+            return response.text
+
+    async def arun_image(self, message: str, image: ImageFile) -> str:
+        """Async variant of run_image."""
+        with span(self.name, "agent", call="image", model=self.model_id, prompt_chars=len(message)):
+            cached, key = self._cache_lookup(message, image=image)
+            if cached is not None:
+                return cached
+            image_part, prepared = await asyncio.to_thread(self._image_part, image)
+            response = await self._acall_model(lambda: self.client.aio.models.generate_content(
+                model=self.model_id,
+                contents=[message, image_part],
+                config=self._generate_config()
+            ))
+            image_prep_stats.record(prepared, self._last_model_seconds)
+            self._cache_store(key, response)
+            return response.text
+
+    def _effective_image_policy(self) -> ImagePolicy:
+        return self.image_policy if settings.IMAGE_PREP_ENABLED and self.image_policy is not None else ORIGINAL
+
+    def _image_part(self, image: ImageFile) -> tuple["types.Part", PreparedImage]:
+        """The image prepared with this agent's image policy, as an inline part to send."""
+        from google.genai import types
+        prepared = prepare_image(image, self._effective_image_policy())
+        annotate(image_policy=prepared.policy.name, image_bytes=len(prepared.data),
+                 image_size=f"{prepared.size[0]}x{prepared.size[1]}")
+        return types.Part.from_bytes(data=prepared.data, mime_type=prepared.mime_type), prepared
+
+    # RESPONSE CACHE
+
+    def _cache_lookup(self, message: str, image: Any = None, chat: bool = False) -> tuple[Optional[str], Optional[str]]:
+        """
+        (cached response or None, key to store the response under). The key is
+        None when this call is not cached: the cache is off, the agent's policy
+        disables it, or it is a chat turn and the policy doesn't allow chat.
+        """
+        self._last_cache_key = None
+        cache = response_cache()
+        policy = self.cache_policy or CachePolicy()
+        if cache is None or not policy.enabled or not cache_enabled_for(self.name) or (chat and not policy.allow_chat):
+            return None, None
+        if chat:
+            # A chat turn's answer depends on the whole conversation so far.
+            history = [content.model_dump(mode="json", exclude_none=True) for content in self.chat.get_history(curated=True)]
+            message = json.dumps(history, ensure_ascii=False) + message
+        schema = json.dumps(self.response_schema.model_json_schema(), sort_keys=True) if self.response_schema else None
+        # The same frame sent under another image policy is a different request.
+        image_key = f"{image_fingerprint(image)}:{self._effective_image_policy().key}" if image is not None else None
+        key = cache_key(self.model_id, self.system_instruction, message, image_key, schema)
+        cached = cache.get(key, self.name, policy)
+        if cached is not None:
+            self._last_cache_key = key
+            annotate(cached=True)
+        return cached, key
+
+    def _cache_store(self, key: Optional[str], response: Any) -> None:
+        cache = response_cache()
+        text = getattr(response, "text", None)
+        if key is None or cache is None or not text:
+            return
+        metadata = getattr(response, "usage_metadata", None)
+        cache.put(
+            key, self.name, self.model_id, text, self.cache_policy or CachePolicy(),
+            prompt_tokens=getattr(metadata, "prompt_token_count", None) or 0,
+            output_tokens=getattr(metadata, "candidates_token_count", None) or 0
+        )
+        self._last_cache_key = key
+
+    def _record_chat_turn(self, message: str, text: str) -> None:
+        """Add a turn answered from the cache to the chat session, as if the model had answered it."""
+        from google.genai import types
+        self.chat.record_history(
+            user_input=types.UserContent(parts=[types.Part.from_text(text=message)]),
+            model_output=[types.ModelContent(parts=[types.Part.from_text(text=text)])],
+            is_valid=True
+        )
+
+    def _call_model(self, request: Callable[[], Any], prompt: Optional[str] = None) -> Any:
+        """
+        Send one model request within the model's rate limit, recording latency and tokens.
+        `prompt` is the whole text of a text-only request, used to calibrate token estimates.
+        """
+        limiter = rate_limiter(self.model_id)
+        waited = limiter.acquire()
+        start = time.perf_counter()
+        response = None
+        try:
+            response = request()
+            return response
+        finally:
+            limiter.release()
+            self._record_usage(time.perf_counter() - start, waited, response, prompt)
+
+    async def _acall_model(self, request: Callable[[], Awaitable[Any]], prompt: Optional[str] = None) -> Any:
+        """Async variant of _call_model."""
+        limiter = rate_limiter(self.model_id)
+        waited = await limiter.aacquire()
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await request()
+            return response
+        finally:
+            limiter.release()
+            self._record_usage(time.perf_counter() - start, waited, response, prompt)
+
+    def _record_usage(self, seconds: float, waited: float, response: Any, prompt: Optional[str] = None) -> None:
+        self._last_model_seconds = seconds
+        for stats in (self.usage, usage_stats):
+            stats.record(self.name, seconds, waited, response, ok=response is not None)
+        metadata = getattr(response, "usage_metadata", None)
+        if prompt is not None:
+            # The reported count also covers the system instruction.
+            record_prompt_usage(f"{self.system_instruction or ''}\n{prompt}",
+                                getattr(metadata, "prompt_token_count", None) or 0, self.model_id)
+        annotate(
+            waited_ms=round(waited * 1000, 1),
+            prompt_tokens=getattr(metadata, "prompt_token_count", None) or 0,
+            output_tokens=getattr(metadata, "candidates_token_count", None) or 0
         )
-        return response.text
+
+    def _generate_config(self) -> "types.GenerateContentConfig | None":
+        from google.genai import types
+        if not self.system_instruction and self.response_schema is None:
+            return None
+        config = types.GenerateContentConfig(system_instruction=self.system_instruction)
+        if self.response_schema is not None:
+            config.response_mime_type = "application/json"
+            config.response_schema = self.response_schema
+        return config
+
+    def parse_response(self, text: str) -> BaseModel:
+        """Validate a response into this agent's response_schema, counting failures."""
+        try:
+            parsed = parse_model(self.response_schema, text)
+        except ResponseParseError:
+            parse_stats.record(self.name, ok=False)
+            # Don't serve an unusable answer again.
+            cache = response_cache()
+            if cache is not None and self._last_cache_key is not None:
+                cache.invalidate(self._last_cache_key)
+            print(f"{self.name} response failed validation; parse stats: {parse_stats.snapshot()}")
+            raise
+        parse_stats.record(self.name, ok=True)
+        return parsed
+
+    def _get_latest_by_type(self, history: list[dict[str, Any]], msg_type: str) -> Any:
+        """Return latest message content of a specific type (indexed for ChatRoom histories)."""
+        return latest_content(history, msg_type)
 
     def count_tokens(self, message: str) -> int:
         """Count tokens before sending a request (optional for trimming)."""
@@ -87,4 +345,13 @@ class BaseAgent(ABC):
     
     @abstractmethod
     def generate_response(self, history: list[dict[str, Any]], expectation: str) -> dict:
-        pass
\ No newline at end of file
+        pass
+
+    async def agenerate_response(self, history: list[dict[str, Any]], expectation: str) -> dict:
+        """
+        Async variant of generate_response.
+        Agents without a native implementation run the blocking call on a worker
+        thread; on cancellation that thread finishes in the background and its
+        result is discarded.
+        """
+        return await asyncio.to_thread(self.generate_response, history, expectation)
\ No newline at end of file
@@ -2,9 +2,14 @@
 
 from typing import Any
 from agents.base import BaseAgent
+from agents.schemas import ActionPlan
 from app.config import settings
 
 class ChainOfThoughtAgent(BaseAgent):
+    consumes = ("task", "screen_coordinates", "feedback", "page_summary", "error")
+    produces = ("action_plan",)
+    response_schema = ActionPlan
+
     def __init__(self, api_key: str):
         super().__init__(
             name="ChainOfThoughtAgent",
@@ -42,17 +47,11 @@ class ChainOfThoughtAgent(BaseAgent):
             page_summary=page_summary
         )
 
-        response = self.run_chat(prompt)
+        plan = self.parse_response(self.run_chat(prompt))
 
         return {
             "type": "action_plan",
             "sender": self.name,
-            "content": response.strip()
+            "content": f"{plan.reasoning.strip()}\n{plan.next_action.strip()}",
+            "data": plan
         }
-
-    def _get_latest_by_type(self, history: list[dict[str, Any]], msg_type: str) -> str | None:
-        """Return latest message content of a specific type."""
-        for msg in reversed(history):
-            if msg["type"] == msg_type:
-                return msg["content"]
-        return None
\ No newline at end of file
@@ -2,10 +2,15 @@
 
 from typing import Any
 from agents.base import BaseAgent
+from agents.schemas import CodeSnippet
 from app.config import settings
 from utils.sanitizer import sanitize_json, sanitize_code
 
 class CodeVerifierAgent(BaseAgent):
+    consumes = ("task", "screen_coordinates", "action_plan", "page_summary", "code_snippet", "error")
+    produces = ("code_snippet", "error")
+    response_schema = CodeSnippet
+
     def __init__(self, api_key: str):
         super().__init__(
             name="CodeVerifierAgent",
@@ -41,17 +46,11 @@ class CodeVerifierAgent(BaseAgent):
             expectation=expectation
         )
 
-        verified_code = self.run_generate(prompt)
+        snippet = self.parse_response(self.run_generate(prompt))
 
         return {
             "type": "code_snippet",
             "sender": self.name,
-            "content": verified_code.strip()
+            "content": snippet.code.strip(),
+            "data": snippet
         }
-
-    def _get_latest_by_type(self, history: list[dict[str, Any]], msg_type: str) -> str | None:
-        """Return latest message content of a specific type."""
-        for msg in reversed(history):
-            if msg["type"] == msg_type:
-                return msg["content"]
-        return None
\ No newline at end of file
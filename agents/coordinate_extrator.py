@@ -1,58 +1,210 @@
 # agents/coordinate_extractor.py
 
-from PIL import Image
+import asyncio
+import re
 from typing import Any
 from agents.base import BaseAgent
 from app.config import settings
-from utils.coordinate_utils import create_grid_overlay, grid_to_coordinates, sanitize_grid_coordinates, replace_json_with_coordinates
+from utils.coordinate_cache import CoordinateCache
+from agents.schemas import CellSelection, ResolvedCoordinates
+from utils.coordinate_utils import create_grid_overlay, grid_to_coordinates
+from utils.hierarchy_locator import locate_element
+from utils.image_prep import ImagePolicy
+from utils.sanitizer import sanitize_app_selection
+from utils.screenshot import load_screenshot
 
 
 class CoordinateExtractorAgent(BaseAgent):
+    consumes = ("task", "screen_image", "page_summary", "selected_application")
+    produces = ("proposed_screen_coordinates", "screen_coordinates")
+    response_schema = CellSelection
+    # The model answers with cell numbers, which grid_to_coordinates maps on the full-size
+    # grid, so downscaling the image leaves the device coordinates exact; only the labels
+    # have to stay legible, hence lossless.
+    image_policy = ImagePolicy(
+        "grid",
+        max_long_edge=settings.GRID_IMAGE_MAX_EDGE,
+        format=settings.GRID_IMAGE_FORMAT,
+        lossless=True
+    )
+
     def __init__(self, api_key: str):
         super().__init__(
             name="CoordinateExtractorAgent",
             prompt_key="coordinate_extractor",
             api_key=api_key,
             model=settings.DEFAULT_IMAGE_EXTRACTION_MODEL,
-            use_chat=False 
+            use_chat=False
         )
+        self.coordinate_cache = CoordinateCache(
+            path=settings.COORDINATE_CACHE_PATH,
+            ttl_seconds=settings.COORDINATE_CACHE_TTL_SECONDS,
+            max_entries=settings.COORDINATE_CACHE_MAX_ENTRIES,
+            threshold=settings.COORDINATE_CACHE_THRESHOLD,
+            verify_mode=settings.COORDINATE_CACHE_VERIFY
+        ) if settings.COORDINATE_CACHE_ENABLED else None
+        # The coordinate cache entry behind the latest extracted coordinates, if any (see code_ran)
+        self.last_cache_hit: dict | None = None
 
     def generate_response(self, history: list[dict[str, Any]], expectation: str) -> dict:
         """
         Generate the required coordinates based on the current screen image and task.
         """
+        request = self._prepare(history, expectation)
+        if "content" in request:
+            return request
+
+        extracted = self.run_image(request["prompt"], image=request["grid_data"]["grid_image"])
+        return self._finish(request, extracted)
+
+    async def agenerate_response(self, history: list[dict[str, Any]], expectation: str) -> dict:
+        """Async variant of generate_response using the async Gemini client."""
+        request = await asyncio.to_thread(self._prepare, history, expectation)
+        if "content" in request:
+            return request
+
+        extracted = await self.arun_image(request["prompt"], image=request["grid_data"]["grid_image"])
+        return self._finish(request, extracted)
+
+    def _prepare(self, history: list[dict[str, Any]], expectation: str) -> dict:
+        """
+        Build the grid image and prompt for the vision call.
+        Returns a finished proposed_screen_coordinates message when the target is
+        found in the accessibility hierarchy or the coordinate cache.
+        """
         task = self._get_latest_by_type(history, "task")
         screen_image = self._get_latest_by_type(history, "screen_image")
         page_summary = self._get_latest_by_type(history, "page_summary") or ""
 
-        grid_data = create_grid_overlay(screen_image)
-        
-
         if not task or not screen_image:
             raise ValueError("Missing task or screen image in history.")
-        
+
+        screen = load_screenshot(screen_image)
+        self.last_cache_hit = None
+        app_package = self._current_app_package(history)
+
+        located = self._locate_in_hierarchy(screen, expectation)
+        if located is not None:
+            return located
+
+        fingerprint = None
+        if self.coordinate_cache is not None:
+            fingerprint = screen.fingerprint
+            cached = self.coordinate_cache.lookup(app_package, fingerprint, expectation, image=screen.image)
+            print(f"Coordinate cache: {self.coordinate_cache.stats()}")
+            if cached is not None:
+                self.last_cache_hit = cached
+                resolved = ResolvedCoordinates(
+                    reasoning=f"Coordinates reused from cache for: {expectation}",
+                    cell_numbers=cached["cell_numbers"],
+                    coordinates=cached["coordinates"]
+                )
+                return {
+                    "type": "proposed_screen_coordinates",
+                    "sender": self.name,
+                    "content": resolved.render(),
+                    "data": resolved
+                }
+
+        grid_data = create_grid_overlay(
+            screen,
+            output_dir="screenshot_grids" if settings.SAVE_GRID_IMAGES else None
+        )
+        if not grid_data["success"]:
+            raise ValueError(f"Grid overlay failed: {grid_data['error']}")
+
         filled_prompt = self.fill_prompt(
             task=task, expectation=expectation,
             page_summary=page_summary
         )
 
-        extracted = self.run_image(filled_prompt, image=Image.open(grid_data["grid_image_path"]))
+        return {
+            "expectation": expectation,
+            "screen": screen,
+            "app_package": app_package,
+            "fingerprint": fingerprint,
+            "grid_data": grid_data,
+            "prompt": filled_prompt
+        }
 
-        cell_number = sanitize_grid_coordinates(extracted)
+    def _locate_in_hierarchy(self, screen, expectation: str) -> dict | None:
+        """Exact element bounds from the UiAutomator2 tree, or None to fall back to vision."""
+        if not settings.HIERARCHY_LOCATOR_ENABLED or not expectation:
+            return None
+        xml = screen.hierarchy
+        if not xml:
+            return None
+        try:
+            match = locate_element(xml, expectation)
+        except Exception as e:
+            print(f"Hierarchy locator failed: {e}")
+            return None
+        if match is None:
+            return None
 
-        coordinates = grid_to_coordinates(cell_numbers=cell_number, grid_data=grid_data)
+        resolved = ResolvedCoordinates(
+            reasoning=f"Found {match['element'].describe()} in the view hierarchy for: {expectation}",
+            coordinates=match["center"]
+        )
+        return {
+            "type": "proposed_screen_coordinates",
+            "sender": self.name,
+            "content": resolved.render(),
+            "data": resolved
+        }
 
-        response = replace_json_with_coordinates(extracted, coordinates, cell_number)
+    def _finish(self, request: dict, extracted: str) -> dict:
+        selection = self.parse_response(extracted)
+        cell_numbers = selection.cell_numbers
+
+        coordinates = grid_to_coordinates(cell_numbers=cell_numbers, grid_data=request["grid_data"])
+        resolved = ResolvedCoordinates(
+            reasoning=selection.reasoning,
+            cell_numbers=cell_numbers,
+            coordinates=coordinates if coordinates != (0, 0) else None
+        )
+
+        # A model answer: nothing in this step came from the cache.
+        self.last_cache_hit = None
+        if request["fingerprint"] is not None and resolved.coordinates is not None:
+            self.coordinate_cache.store(
+                request["app_package"], request["fingerprint"], request["expectation"],
+                cell_numbers, coordinates, image=request["screen"].image
+            )
 
         return {
             "type": "proposed_screen_coordinates",
             "sender": self.name,
-            "content": response.strip()
+            "content": resolved.render(),
+            "data": resolved
         }
 
-    def _get_latest_by_type(self, history: list[dict[str, Any]], msg_type: str) -> str | None:
-        """Return latest message content of a specific type."""
-        for msg in reversed(history):
-            if msg["type"] == msg_type:
-                return msg["content"]
-        return None
\ No newline at end of file
+    def code_ran(self, code: str, failed: bool) -> bool:
+        """
+        Called after generated code ran. If `code` uses the coordinates of the last
+        cache hit (both numbers appear in it), the hit is settled: its entry is
+        dropped if the code failed, and it is forgotten either way. A hit stays
+        pending (usually for the next step's code) until such code runs or a new
+        extraction replaces it. Returns True if the entry was dropped.
+        """
+        hit = self.last_cache_hit
+        if self.coordinate_cache is None or hit is None:
+            return False
+        if not all(re.search(rf"(?<![\d.]){value}(?![\d.])", code) for value in hit["coordinates"]):
+            return False
+        self.last_cache_hit = None
+        if not failed:
+            return False
+        self.coordinate_cache.invalidate(hit["id"])
+        print(f"Invalidated cached coordinates entry {hit['id']}")
+        return True
+
+    def _current_app_package(self, history: list[dict[str, Any]]) -> str:
+        """Package of the most recently selected application, or "unknown"."""
+        selection = self._get_latest_by_type(history, "selected_application")
+        if selection:
+            try:
+                return sanitize_app_selection(selection) or "unknown"
+            except Exception:
+                pass
+        return "unknown"
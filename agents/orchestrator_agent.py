@@ -1,41 +1,43 @@
 # agents/orchestrator_agent.py
 
 from agents.base import BaseAgent
+from agents.schemas import AgentSelection
 from app.config import settings
+from utils.history_utils import HistoryCompactor
 
 
 class OrchestratorAgent(BaseAgent):
+    response_schema = AgentSelection
+
     def __init__(self, api_key: str):
         super().__init__(
             name="OrchestratorAgent",
             prompt_key="orchestrator_agent",
             api_key=api_key,
             model=settings.DEFAULT_CHAT_MODEL,
-            use_chat=True
+            use_chat=False
         )
+        self.compactor = HistoryCompactor(token_budget=settings.ORCHESTRATOR_HISTORY_TOKENS)
 
     def generate_response(self, history: list[dict], expectation: str = "") -> dict:
         """
         Analyze full chat history and return list of agents to activate next.
         Output format: dict with `next_agents` key.
         """
-        task = next((msg["content"] for msg in reversed(history) if msg["type"] == "task"), "Unknown task")
+        task = self._get_latest_by_type(history, "task") or "Unknown task"
 
-        full_history = "\n".join(
-            f"[{msg['sender']}] ({msg['type']}): {msg['content']}"
-            for msg in history if msg["type"]!="screen_image" 
-        )
+        full_history = self.compactor.render(history)
 
         prompt = self.fill_prompt(
             task=task,
             history=full_history
         )
         
-        response = self.run_chat(prompt)
-
+        selection = self.parse_response(self.run_generate(prompt))
 
         return {
             "type": "agent_selection",
             "sender": self.name,
-            "content": response.strip()
+            "content": selection.model_dump_json(),
+            "data": selection
         }
\ No newline at end of file
@@ -1,11 +1,26 @@
 # agents/page_summarizer.py
 
+import asyncio
 from typing import Any
 from agents.base import BaseAgent
+from agents.schemas import PageSummary
 from app.config import settings
-from PIL import Image
+from utils.image_prep import ImagePolicy
+from utils.screen_fingerprint import ScreenSummaryCache
+from utils.screenshot import load_screenshot
 
 class PageSummarizerAgent(BaseAgent):
+    consumes = ("task", "screen_image")
+    produces = ("page_summary",)
+    response_schema = PageSummary
+    # Reading the screen doesn't need full resolution or lossless pixels.
+    image_policy = ImagePolicy(
+        "summary",
+        max_long_edge=settings.SUMMARY_IMAGE_MAX_EDGE,
+        format=settings.SUMMARY_IMAGE_FORMAT,
+        quality=settings.SUMMARY_IMAGE_QUALITY
+    )
+
     def __init__(self, api_key: str):
         super().__init__(
             name="PageSummarizerAgent",
@@ -14,32 +29,80 @@ class PageSummarizerAgent(BaseAgent):
             model=settings.DEFAULT_IMAGE_READING_MODEL,
             use_chat=False
         )
+        self.summary_cache = ScreenSummaryCache(
+            max_entries=settings.PAGE_SUMMARY_CACHE_SIZE,
+            threshold=settings.PAGE_SUMMARY_CACHE_THRESHOLD,
+            exact=settings.PAGE_SUMMARY_CACHE_EXACT
+        ) if settings.PAGE_SUMMARY_CACHE_ENABLED else None
 
     def generate_response(self, history: list[dict[str, Any]], expectation: str) -> dict:
         """
         Generate a human-readable summary of everything that happened.
         """
+        request = self._prepare(history, expectation)
+        if "content" in request:
+            return request
+
+        summary = self.run_image(request["prompt"], image=request["screen"].image)
+        return self._finish(request, summary)
+
+    async def agenerate_response(self, history: list[dict[str, Any]], expectation: str) -> dict:
+        """Async variant of generate_response using the async Gemini client."""
+        request = await asyncio.to_thread(self._prepare, history, expectation)
+        if "content" in request:
+            return request
+
+        summary = await self.arun_image(request["prompt"], image=request["screen"].image)
+        return self._finish(request, summary)
+
+    def _prepare(self, history: list[dict[str, Any]], expectation: str) -> dict:
+        """
+        Resolve the screen and prompt for a summary call.
+        Returns a finished page_summary message when the summary cache hits.
+        """
         task = self._get_latest_by_type(history, "task")
         if not task:
             raise ValueError("Missing task for summarization.")
 
         current_screen = self._get_latest_by_type(history, "screen_image")
-        
+
         if not current_screen:
             raise ValueError("Missing screen image for summarization.")
+        screen = load_screenshot(current_screen)
 
-        prompt = self.fill_prompt(task=task, expectation=expectation)
-        summary = self.run_image(prompt, image=Image.open(current_screen))
+        fingerprint = content = None
+        if self.summary_cache is not None:
+            fingerprint = screen.fingerprint
+            content = screen.content_hash if self.summary_cache.exact else None
+            cached = self.summary_cache.get(fingerprint, task, expectation, content)
+            print(f"Page summary cache: {self.summary_cache.stats()}")
+            if cached is not None:
+                return {
+                    "type": "page_summary",
+                    "sender": self.name,
+                    "content": cached
+                }
 
         return {
-            "type": "page_summary",
-            "sender": self.name,
-            "content": summary.strip()
+            "task": task,
+            "expectation": expectation,
+            "screen": screen,
+            "fingerprint": fingerprint,
+            "content": content,
+            "prompt": self.fill_prompt(task=task, expectation=expectation)
         }
 
+    def _finish(self, request: dict, response: str) -> dict:
+        page = self.parse_response(response)
+        summary = page.summary.strip()
+        if page.page_type:
+            summary += f"\nPage Type: {page.page_type}"
+        if request["fingerprint"] is not None:
+            self.summary_cache.put(request["fingerprint"], request["task"], request["expectation"], summary,
+                                   request["content"])
 
-    def _get_latest_by_type(self, history: list[dict[str, Any]], msg_type: str) -> str | None:
-        for msg in reversed(history):
-            if msg["type"] == msg_type:
-                return msg["content"]
-        return None
\ No newline at end of file
+        return {
+            "type": "page_summary",
+            "sender": self.name,
+            "content": summary
+        }
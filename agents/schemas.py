@@ -0,0 +1,124 @@
+# agents/schemas.py
+
+import json
+import re
+import threading
+from typing import Optional, TypeVar
+
+from pydantic import BaseModel, Field, ValidationError
+
+
+class AgentCall(BaseModel):
+    name: str = Field(description="Name of the agent to run next.")
+    expectation: str = Field(default="", description="What we expect this agent to do or return.")
+
+
+class AgentSelection(BaseModel):
+    next_agents: list[AgentCall] = Field(description="Agents to run next, in order.")
+
+
+class AppSelection(BaseModel):
+    reasoning: str = Field(default="", description="Why this application fits the task.")
+    package: Optional[str] = Field(default=None, description="Package name to launch, or null if no app fits.")
+
+
+class ActionPlan(BaseModel):
+    reasoning: str = Field(description="Step-by-step reasoning about the screen, goal and errors.")
+    next_action: str = Field(description="Exactly one action command, e.g. CLICK: \"Send\" or TASK_COMPLETED.")
+
+
+class CellSelection(BaseModel):
+    reasoning: str = Field(default="", description="Which grid cells contain the element and why.")
+    cell_numbers: list[int] = Field(description="Grid cell numbers covering the element; empty if not found.")
+
+
+class CodeSnippet(BaseModel):
+    reasoning: str = Field(default="", description="Short notes on the approach or the fix.")
+    code: str = Field(description="Python code to execute, without Markdown fences.")
+
+
+class PageSummary(BaseModel):
+    summary: str = Field(description="Natural-language summary of the current screen.")
+    page_type: Optional[str] = Field(default=None, description="Page type tag, if clearly identifiable.")
+
+
+class TaskSummary(BaseModel):
+    summary: str = Field(description="Short summary of what was accomplished for the user.")
+
+
+class UserQuestion(BaseModel):
+    message: str = Field(description="Friendly message telling the user what is blocked and what we need.")
+
+
+class ResolvedCoordinates(BaseModel):
+    """CoordinateExtractorAgent output once grid cells are mapped to screen pixels."""
+    reasoning: str = ""
+    cell_numbers: list[int] = []
+    coordinates: Optional[tuple[int, int]] = None
+
+    def render(self) -> str:
+        """Message text for the chatroom: the reasoning plus a JSON block other agents read."""
+        block = json.dumps({"cell_numbers": self.cell_numbers, "coordinates": self.coordinates})
+        return f"{self.reasoning.strip()}\n```json\n{block}\n```".strip()
+
+
+class ResponseParseError(ValueError):
+    """A model response did not validate against the agent's response schema."""
+
+
+Model = TypeVar("Model", bound=BaseModel)
+
+_FENCE = re.compile(r"```(?:json)?\s*([\s\S]+?)```", re.IGNORECASE)
+
+
+def parse_model(schema: type[Model], text: str) -> Model:
+    """
+    Validate a model response into `schema`.
+
+    Schema-constrained responses are plain JSON; a fenced ```json block is
+    accepted too, for responses produced without the constraint.
+    """
+    text = (text or "").strip()
+    candidates = [text] + [block.strip() for block in _FENCE.findall(text)]
+    error: Exception | None = None
+    for candidate in candidates:
+        try:
+            return schema.model_validate_json(candidate)
+        except (ValidationError, json.JSONDecodeError) as e:
+            error = e
+    raise ResponseParseError(f"Response does not match {schema.__name__}: {error}")
+
+
+class ParseStats:
+    """Per-agent counts of schema-validated and failed responses."""
+
+    def __init__(self):
+        self._counts: dict[str, list[int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, agent: str, ok: bool) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(agent, [0, 0])
+            counts[0 if ok else 1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            per_agent = {
+                agent: {"parsed": ok, "failed": failed, "failure_rate": round(failed / (ok + failed), 3)}
+                for agent, (ok, failed) in self._counts.items()
+            }
+        parsed = sum(stats["parsed"] for stats in per_agent.values())
+        failed = sum(stats["failed"] for stats in per_agent.values())
+        return {
+            "parsed": parsed,
+            "failed": failed,
+            "failure_rate": round(failed / (parsed + failed), 3) if parsed + failed else 0.0,
+            "agents": per_agent
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+parse_stats = ParseStats()
@@ -2,17 +2,24 @@
 
 from typing import Any
 from agents.base import BaseAgent
+from agents.schemas import TaskSummary
 from app.config import settings
+from utils.history_utils import HistoryCompactor
 
 class SummarizerAgent(BaseAgent):
+    consumes = ("*",)
+    produces = ("summary",)
+    response_schema = TaskSummary
+
     def __init__(self, api_key: str):
         super().__init__(
             name="SummarizerAgent",
             prompt_key="summarizer",
             api_key=api_key,
             model=settings.DEFAULT_CHAT_MODEL,
-            use_chat=True
+            use_chat=False
         )
+        self.compactor = HistoryCompactor(token_budget=settings.SUMMARIZER_HISTORY_TOKENS)
 
     def generate_response(self, history: list[dict[str, Any]], expectation: str) -> dict:
         """
@@ -22,22 +29,14 @@ class SummarizerAgent(BaseAgent):
         if not task:
             raise ValueError("Missing task for summarization.")
 
-        full_history = "\n".join(
-            f"[{msg['sender']}] ({msg['type']}): {msg['content']}"
-            for msg in history if msg["type"]!="screen_image" 
-        )
+        full_history = self.compactor.render(history)
 
         prompt = self.fill_prompt(task=task, history = full_history, expectation=expectation)   
-        summary = self.run_chat(prompt)
+        summary = self.parse_response(self.run_generate(prompt))
 
         return {
             "type": "summary",
             "sender": self.name,
-            "content": summary.strip()
+            "content": summary.summary.strip(),
+            "data": summary
         }
-
-    def _get_latest_by_type(self, history: list[dict[str, Any]], msg_type: str) -> str | None:
-        for msg in reversed(history):
-            if msg["type"] == msg_type:
-                return msg["content"]
-        return None
\ No newline at end of file
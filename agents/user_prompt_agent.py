@@ -2,9 +2,14 @@
 
 from typing import Any
 from agents.base import BaseAgent
+from agents.schemas import UserQuestion
 from app.config import settings
 
 class UserPromptAgent(BaseAgent):
+    consumes = ("task", "screen_coordinates", "page_summary", "error", "agent_selection")
+    produces = ("user_prompt",)
+    response_schema = UserQuestion
+
     def __init__(self, api_key: str):
         super().__init__(
             name="UserPromptAgent",
@@ -34,16 +39,11 @@ class UserPromptAgent(BaseAgent):
             page_summary=page_summary
         )
 
-        message = self.run_chat(prompt)
+        question = self.parse_response(self.run_chat(prompt))
 
         return {
             "type": "user_prompt",
             "sender": self.name,
-            "content": message.strip()
+            "content": question.message.strip(),
+            "data": question
         }
-
-    def _get_latest_by_type(self, history: list[dict[str, Any]], msg_type: str) -> str | None:
-        for msg in reversed(history):
-            if msg["type"] == msg_type:
-                return msg["content"]
-        return None
\ No newline at end of file
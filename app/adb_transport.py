@@ -0,0 +1,160 @@
+# app/adb_transport.py
+
+import re
+import struct
+import time
+from typing import Optional
+
+import adbutils
+import numpy as np
+from PIL import Image
+
+from app.config import settings
+
+# Operations AppiumController can route through ADB (see ADB_OPERATIONS).
+ADB_OPERATIONS = frozenset({"screenshot", "tap", "swipe", "text", "key", "launch"})
+
+
+def parse_operations(value: str) -> frozenset:
+    """Parse a comma-separated ADB_OPERATIONS value ("all" for every operation)."""
+    names = {name.strip().lower() for name in (value or "").split(",") if name.strip()}
+    if "all" in names:
+        return ADB_OPERATIONS
+    unknown = names - ADB_OPERATIONS
+    if unknown:
+        print(f"Ignoring unknown ADB operations: {', '.join(sorted(unknown))}")
+    return frozenset(names & ADB_OPERATIONS)
+
+
+def _screencap_layout(raw: bytes | bytearray) -> tuple[int, int, int]:
+    """(width, height, header size) of raw `screencap` output, validated."""
+    if len(raw) < 12:
+        raise ValueError("screencap returned no data")
+    width, height, pixel_format = struct.unpack_from("<III", raw)
+    pixels = width * height * 4
+    header = len(raw) - pixels
+    if header not in (12, 16) or pixel_format != 1:
+        raise ValueError(f"Unexpected screencap output ({width}x{height}, format {pixel_format}, {len(raw)} bytes)")
+    return width, height, header
+
+
+def decode_screencap(raw: bytes | bytearray) -> Image.Image:
+    """
+    Decode raw `screencap` output: a little-endian width/height/format header
+    (plus a colour-space word on Android 9+) followed by RGBA_8888 pixels.
+    """
+    width, height, header = _screencap_layout(raw)
+    image = Image.frombuffer("RGBA", (width, height), memoryview(raw)[header:], "raw", "RGBA", 0, 1)
+    return image.convert("RGB")
+
+
+def screencap_low_res(raw: bytes | bytearray, factor: int = 8, crop_top: float = 0.04) -> np.ndarray:
+    """
+    Grayscale frame sampled every `factor` pixels straight from raw `screencap`
+    output, status bar cropped: the change-detection counterpart of
+    low_res_frame() that never builds the full-size image.
+    """
+    width, height, header = _screencap_layout(raw)
+    step = max(int(factor), 1)
+    rgba = np.frombuffer(raw, dtype=np.uint8, count=width * height * 4, offset=header).reshape(height, width, 4)
+    sampled = rgba[::step, ::step, :3].astype(np.int16)
+    gray = (sampled[..., 0] * 77 + sampled[..., 1] * 150 + sampled[..., 2] * 29) >> 8
+    return gray[int(gray.shape[0] * crop_top):]
+
+
+def escape_input_text(text: str) -> str:
+    """
+    Encode text as the `input text` argument: spaces become %s. Shell quoting
+    is left to adbutils, which quotes every argument of a list command once.
+    """
+    if not text.isascii():
+        raise ValueError("`input text` only supports ASCII text")
+    return text.replace(" ", "%s")
+
+
+class AdbTransport:
+    """
+    Screenshots and input events straight over ADB, bypassing the Appium server.
+
+    Holds one adbutils device handle for the session. Screenshots use raw
+    `screencap` (no on-device PNG encoding, no base64/JSON), input uses
+    `input tap|swipe|text|keyevent`, and app launches use `am start -W`, which
+    returns once the launch activity has drawn.
+    """
+
+    def __init__(self, serial: str, host: str = settings.ADB_SERVER_HOST, port: int = settings.ADB_SERVER_PORT,
+                 timeout: float = 20.0):
+        self.serial = serial
+        self.timeout = timeout
+        self.client = adbutils.AdbClient(host=host, port=port)
+        self.device = self.client.device(serial)
+        self._launch_activities: dict[str, str] = {}
+
+    def _shell(self, *args: str) -> str:
+        return self.device.shell(list(args), timeout=self.timeout)
+
+    def screencap(self) -> Image.Image:
+        return decode_screencap(self.screencap_raw())
+
+    def screencap_raw(self) -> bytearray:
+        """Undecoded `screencap` output (see decode_screencap / screencap_low_res)."""
+        # Read the ~10 MB frame from the socket directly: shell() joins 4 KB chunks quadratically.
+        connection = self.device.shell("screencap", stream=True)
+        try:
+            sock = connection.conn
+            sock.settimeout(self.timeout)
+            raw = bytearray()
+            while True:
+                chunk = sock.recv(1 << 20)
+                if not chunk:
+                    break
+                raw += chunk
+        finally:
+            connection.close()
+        return raw
+
+    def tap(self, x: int, y: int) -> None:
+        self._shell("input", "tap", str(int(x)), str(int(y)))
+
+    def swipe(self, start_x: int, start_y: int, end_x: int, end_y: int, duration_ms: int = 250) -> None:
+        self._shell("input", "swipe", *(str(int(v)) for v in (start_x, start_y, end_x, end_y, duration_ms)))
+
+    def text(self, text: str) -> None:
+        if text:
+            self._shell("input", "text", escape_input_text(text))
+
+    def keyevent(self, keycode: int) -> None:
+        self._shell("input", "keyevent", str(int(keycode)))
+
+    def launch_activity(self, package: str) -> Optional[str]:
+        """The launcher activity of `package` (e.g. "com.app/.MainActivity"), cached per package."""
+        if package not in self._launch_activities:
+            output = self._shell("cmd", "package", "resolve-activity", "--brief",
+                                 "-c", "android.intent.category.LAUNCHER", package)
+            lines = [line.strip() for line in output.splitlines() if "/" in line]
+            if not lines:
+                return None
+            self._launch_activities[package] = lines[-1]
+        return self._launch_activities[package]
+
+    def start_app(self, package: str) -> dict:
+        """
+        Launch `package` with `am start -W` and report the launch time.
+        Raises RuntimeError if the package has no launcher activity or the start fails.
+        """
+        component = self.launch_activity(package)
+        if component is None:
+            raise RuntimeError(f"No launcher activity found for {package}")
+        start = time.perf_counter()
+        output = self._shell("am", "start", "-W", "-n", component)
+        if "Error" in output or "Status: ok" not in output:
+            raise RuntimeError(f"am start failed for {component}: {output.strip()}")
+        total = re.search(r"TotalTime:\s*(\d+)", output)
+        return {
+            "component": component,
+            "total_time_ms": int(total.group(1)) if total else None,
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+
+    def __repr__(self) -> str:
+        return f"<AdbTransport {self.serial}>"
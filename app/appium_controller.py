@@ -2,8 +2,7 @@ import subprocess
 import os
 import time
 from datetime import datetime
-from typing import Optional, Dict, Any
-from PIL import Image
+from typing import Optional, Dict, Any, Tuple
 
 from appium import webdriver
 from appium.options.android import UiAutomator2Options
@@ -13,20 +12,37 @@ from selenium.webdriver.common.actions import interaction
 from selenium.webdriver.common.actions.action_builder import ActionBuilder
 from selenium.webdriver.common.actions.pointer_input import PointerInput
 
+from app.adb_transport import AdbTransport, decode_screencap, parse_operations, screencap_low_res
+from app.config import settings
+from app.gestures import FOCUS_PAUSE_MS, GestureBatch, keyboard_step, perform_gestures
+from utils.screen_fingerprint import frame_change_ratio, low_res_frame
+from utils.screenshot import Screenshot
+from utils.tracing import trace_methods
+
+# Every public command is timed as a "device" span; batch() only builds a GestureBatch.
+@trace_methods("device", exclude=("batch",))
 class AppiumController:
     """
     Simplified Vision-Based Mobile Automation Controller
     Contains only core Appium interaction methods for coordinate-based automation
     """
     
-    def __init__(self, appium_server_url: str = "http://127.0.0.1:4723", platform: str = "android"):
+    def __init__(self, appium_server_url: str = "http://127.0.0.1:4723", platform: str = "android",
+                 device_name: Optional[str] = None, system_port: Optional[int] = None,
+                 screenshot_dir: str = "screenshots"):
         self.appium_server_url = appium_server_url
         self.platform = platform.lower()
         self.driver: Optional[webdriver.Remote] = None
-        self.device_name: Optional[str] = self._get_connected_device()
+        self.device_name: Optional[str] = device_name or self._get_connected_device()
+        # UiAutomator2 server port on the host; must be unique per parallel session
+        self.system_port = system_port
+
+        # Operations sent straight over ADB instead of through the Appium server
+        self.adb_operations = parse_operations(settings.ADB_OPERATIONS)
+        self.adb: Optional[AdbTransport] = None
         
         # Screenshot setup
-        self.screenshot_dir = "screenshots"
+        self.screenshot_dir = screenshot_dir
         self.screenshot_counter = 0
         os.makedirs(self.screenshot_dir, exist_ok=True)
         
@@ -71,7 +87,10 @@ class AppiumController:
                 options = UiAutomator2Options()
                 options.platform_name = 'Android'
                 options.device_name = self.device_name
+                options.udid = self.device_name
                 options.automation_name = 'UiAutomator2'
+                if self.system_port:
+                    options.system_port = self.system_port
                 options.no_reset = True
                 options.auto_grant_permissions = True
                 options.disable_window_animation = True
@@ -114,40 +133,199 @@ class AppiumController:
 
     # SCREENSHOT METHODS  
 
-    def take_screenshot(self, filename: Optional[str] = None) -> Dict[str, Any]:
-        """Take a screenshot for vision analysis."""
+    def take_screenshot(self, filename: Optional[str] = None, persist: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Take a screenshot for vision analysis.
+
+        The frame is kept in memory as a Screenshot object; it is written to disk
+        in the background only when `persist` (default: PERSIST_SCREENSHOTS) is set.
+        """
         if not self.driver:
             return {"success": False, "error": "No active session"}
         
         try:
-            if not filename:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                self.screenshot_counter += 1
-                filename = f"screenshot_{timestamp}_{self.screenshot_counter:03d}.png"
-            
-            screenshot_path = os.path.join(self.screenshot_dir, filename)
-            screenshot = self.driver.get_screenshot_as_png()
+            filename = filename or self._next_screenshot_filename()
             
-            with open(screenshot_path, 'wb') as f:
-                f.write(screenshot)
-            
-            with Image.open(screenshot_path) as img:
-                img_width, img_height = img.size
+            screenshot = self._capture_frame(with_hierarchy=True)
+            img_width, img_height = screenshot.size
+
+            screenshot_path = None
+            if settings.PERSIST_SCREENSHOTS if persist is None else persist:
+                screenshot_path = os.path.join(self.screenshot_dir, filename)
+                screenshot.persist(screenshot_path)
             
             result = {
                 "success": True,
+                "screenshot": screenshot,
                 "screenshot_path": screenshot_path,
                 "filename": filename,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": screenshot.timestamp,
                 "image_dimensions": {"width": img_width, "height": img_height}
             }
             
-            print(f"Screenshot saved: {filename}")
+            print(f"Screenshot captured: {filename}")
             return result
             
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _next_screenshot_filename(self) -> str:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.screenshot_counter += 1
+        return f"screenshot_{timestamp}_{self.screenshot_counter:03d}.png"
+
+    def _adb_for(self, operation: str) -> Optional[AdbTransport]:
+        """The ADB transport if `operation` is routed through ADB (Android only), else None."""
+        if operation not in self.adb_operations or self.platform != "android":
+            return None
+        if self.adb is None:
+            self.adb = AdbTransport(self.device_name)
+        return self.adb
+
+    def _capture_frame(self, with_hierarchy: bool = False) -> Screenshot:
+        """
+        Grab the current screen as an in-memory Screenshot. With `with_hierarchy`,
+        its view hierarchy can be read later (see _attach_hierarchy).
+        """
+        frame = None
+        adb = self._adb_for("screenshot")
+        if adb is not None:
+            try:
+                frame = Screenshot(image=adb.screencap())
+            except Exception as e:
+                print(f"ADB screencap failed, using Appium: {e}")
+        if frame is None:
+            frame = Screenshot(png=self.driver.get_screenshot_as_png())
+        if with_hierarchy:
+            self._attach_hierarchy(frame)
+        return frame
+
+    def _attach_hierarchy(self, frame: Screenshot) -> None:
+        """
+        Let `frame.hierarchy` fetch the page source when first read (only the
+        hierarchy locator reads it), so frames nobody locates on cost no extra
+        round trip. Only with the locator on.
+        """
+        if not settings.HIERARCHY_LOCATOR_ENABLED or self.platform != "android":
+            return
+        frame.defer_hierarchy(self._load_hierarchy)
+
+    def _load_hierarchy(self, frame: Screenshot) -> Optional[str]:
+        """
+        The page source, if the screen still shows `frame`: a screen captured right
+        after the fetch is compared with the frame, so the locator never matches
+        against a later screen than the one the agents saw.
+        """
+        if not self.driver:
+            return None
+        try:
+            xml = self.driver.page_source
+            data, raw = self._poll_screen()
+            now = low_res_frame(decode_screencap(data) if raw else data, settings.SETTLE_DOWNSCALE)
+            change = frame_change_ratio(low_res_frame(frame.image, settings.SETTLE_DOWNSCALE), now)
+        except Exception as e:
+            print(f"Could not fetch the view hierarchy: {e}")
+            return None
+        if change > settings.SETTLE_CHANGE_THRESHOLD:
+            print(f"Screen changed since the frame was captured ({change:.1%} of pixels); not using its view hierarchy")
+            return None
+        return xml
+
+    def _press_keycode(self, keycode: int) -> None:
+        adb = self._adb_for("key")
+        if adb is not None:
+            try:
+                adb.keyevent(keycode)
+                return
+            except Exception as e:
+                print(f"ADB keyevent failed, using Appium: {e}")
+        self.driver.press_keycode(keycode)
+
+    def _poll_screen(self) -> Tuple[bytes, bool]:
+        """
+        Undecoded screen bytes for change detection: raw `screencap` pixels when
+        screenshots go through ADB (then True), else the Appium PNG (False).
+        """
+        adb = self._adb_for("screenshot")
+        if adb is not None:
+            try:
+                return adb.screencap_raw(), True
+            except Exception as e:
+                print(f"ADB screencap failed, using Appium: {e}")
+        return self.driver.get_screenshot_as_png(), False
+
+    def wait_until_stable(self, timeout: Optional[float] = None, min_wait: float = 0.0,
+                          threshold: float = settings.SETTLE_CHANGE_THRESHOLD,
+                          poll_interval: float = settings.SETTLE_POLL_SECONDS,
+                          min_settle: Optional[float] = None,
+                          persist: Optional[bool] = False) -> Dict[str, Any]:
+        """
+        Wait for the screen to stop changing instead of sleeping a fixed time.
+
+        Polls frames (compared at 1/SETTLE_DOWNSCALE resolution) until two in a row
+        differ in at most `threshold` of their pixels, or `timeout` (default
+        SETTLE_TIMEOUT_SECONDS) passes. Until a change has been seen, unchanged
+        frames only count as settled once `min_settle` (default SETTLE_MIN_SECONDS,
+        capped at `timeout`) has passed, so a transition that starts late is not
+        mistaken for a settled screen. `min_wait` delays the first frame.
+        Polls skip decoding when the bytes repeat and never build full frames;
+        only the last one becomes the "screenshot" returned to the caller
+        (`persist=None` saves it like take_screenshot does).
+        """
+        if not self.driver:
+            return {"success": False, "error": "No active session"}
+
+        timeout = settings.SETTLE_TIMEOUT_SECONDS if timeout is None else timeout
+        min_settle = settings.SETTLE_MIN_SECONDS if min_settle is None else min_settle
+        start = time.perf_counter()
+        if min_wait > 0:
+            time.sleep(min_wait)
+        deadline = start + max(timeout, min_wait)
+        quiet_until = start + min(min_settle, max(timeout, min_wait))
+        previous = previous_data = change = None
+        frames = 0
+        changed = stable = False
+        try:
+            while True:
+                polled = time.perf_counter()
+                data, raw = self._poll_screen()
+                frames += 1
+                if data == previous_data:
+                    change = 0.0
+                else:
+                    current = (screencap_low_res if raw else low_res_frame)(data, settings.SETTLE_DOWNSCALE)
+                    if previous is not None:
+                        change = frame_change_ratio(previous, current)
+                    previous = current
+                previous_data = data
+                if change is not None:
+                    if change > threshold:
+                        changed = True
+                    elif changed or polled >= quiet_until:
+                        stable = True
+                        break
+                if time.perf_counter() >= deadline:
+                    break
+                time.sleep(max(0.0, poll_interval - (time.perf_counter() - polled)))
+            frame = Screenshot(image=decode_screencap(data)) if raw else Screenshot(png=data)
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+        # Only the returned frame may need its hierarchy.
+        self._attach_hierarchy(frame)
+        elapsed = time.perf_counter() - start
+        print(f"Screen {'settled' if stable else 'still changing'} after {elapsed:.2f}s ({frames} frames)")
+        if settings.PERSIST_SCREENSHOTS if persist is None else persist:
+            frame.persist(os.path.join(self.screenshot_dir, self._next_screenshot_filename()))
+        return {
+            "success": True,
+            "stable": stable,
+            "seconds": round(elapsed, 3),
+            "frames": frames,
+            "change": change,
+            "screenshot": frame
+        }
+
     # COORDINATE-BASED INTERACTION METHODS
 
     def click_coordinates(self, x: int, y: int) -> Dict[str, Any]:
@@ -159,16 +337,17 @@ class AppiumController:
             if not self._validate_coordinates(x, y):
                 return {"success": False, "error": f"Invalid coordinates ({x}, {y})"}
             
-            actions = ActionChains(self.driver)
-            actions.w3c_actions = ActionBuilder(
-                self.driver,
-                mouse=PointerInput(interaction.POINTER_TOUCH, "touch")
-            )
-            
-            actions.w3c_actions.pointer_action.move_to_location(x, y)
-            actions.w3c_actions.pointer_action.pointer_down()
-            actions.w3c_actions.pointer_action.pointer_up()
-            actions.perform()
+            if not self._adb_input("tap", x, y):
+                actions = ActionChains(self.driver)
+                actions.w3c_actions = ActionBuilder(
+                    self.driver,
+                    mouse=PointerInput(interaction.POINTER_TOUCH, "touch")
+                )
+
+                actions.w3c_actions.pointer_action.move_to_location(x, y)
+                actions.w3c_actions.pointer_action.pointer_down()
+                actions.w3c_actions.pointer_action.pointer_up()
+                actions.perform()
 
             print(f"Clicked at ({x}, {y})")
             return {
@@ -191,13 +370,13 @@ class AppiumController:
                 return {"success": False, "error": f"Invalid coordinates ({x}, {y})"}
             
 
-            result1 = self.click_coordinates(x, y)
-            time.sleep(0.1)  
-            result2 = self.click_coordinates(x, y)
+            result = self.perform_gestures([["double_tap", x, y]])
+            if not result["success"]:
+                return {"success": False, "error": result["error"]}
 
             print(f"Double clicked at ({x}, {y})")
             return {
-                "success": result1["success"] and result2["success"],
+                "success": True,
                 "action": "double_click",
                 "coordinates": (x, y),
                 "timestamp": datetime.now().isoformat()
@@ -248,17 +427,18 @@ class AppiumController:
                    self._validate_coordinates(end_x, end_y)):
                 return {"success": False, "error": "Invalid coordinates"}
             
-            actions = ActionChains(self.driver)
-            actions.w3c_actions = ActionBuilder(
-                self.driver,
-                mouse=PointerInput(interaction.POINTER_TOUCH, "touch")
-            )
-            
-            actions.w3c_actions.pointer_action.move_to_location(start_x, start_y)
-            actions.w3c_actions.pointer_action.pointer_down()
-            actions.w3c_actions.pointer_action.move_to_location(end_x, end_y)
-            actions.w3c_actions.pointer_action.pointer_up()
-            actions.perform()
+            if not self._adb_input("swipe", start_x, start_y, end_x, end_y):
+                actions = ActionChains(self.driver)
+                actions.w3c_actions = ActionBuilder(
+                    self.driver,
+                    mouse=PointerInput(interaction.POINTER_TOUCH, "touch")
+                )
+
+                actions.w3c_actions.pointer_action.move_to_location(start_x, start_y)
+                actions.w3c_actions.pointer_action.pointer_down()
+                actions.w3c_actions.pointer_action.move_to_location(end_x, end_y)
+                actions.w3c_actions.pointer_action.pointer_up()
+                actions.perform()
             
             print(f"Swiped from ({start_x}, {start_y}) to ({end_x}, {end_y})")
             return {
@@ -311,16 +491,22 @@ class AppiumController:
             return {"success": False, "error": "No active session"}
         
         try:
-            # First click to focus
-            click_result = self.click_coordinates(x, y)
-            if not click_result["success"]:
-                return click_result
-            
-            time.sleep(0.5) 
-            
-            if self.platform == "android":
-                self.driver.execute_script('mobile: type', {'text': text})
+            if self.platform == "android" and self._adb_for("text") is not None and text.isascii():
+                click_result = self.click_coordinates(x, y)
+                if not click_result["success"]:
+                    return click_result
+                time.sleep(FOCUS_PAUSE_MS / 1000)
+                self.adb.text(text)
+            elif self.platform == "android":
+                # Tap and focus pause in one request, then `mobile: type`.
+                result = self.perform_gestures([["tap", x, y], ["pause", FOCUS_PAUSE_MS], ["type_text", text]])
+                if not result["success"]:
+                    return {"success": False, "error": result["error"], "steps": result["steps"]}
             else:  # iOS
+                click_result = self.click_coordinates(x, y)
+                if not click_result["success"]:
+                    return click_result
+                self.wait_until_stable(timeout=1)
                 self.driver.execute_script('mobile: type', {'text': text})
             
             print(f"Typed '{text}' at ({x}, {y})")
@@ -340,17 +526,15 @@ class AppiumController:
             return {"success": False, "error": "No active session"}
         
         try:
-            click_result = self.click_coordinates(x, y)
-            if not click_result["success"]:
-                return click_result
-            
-            time.sleep(0.5)
-            
             if self.platform == "android":
-                self.driver.execute_script('mobile: key', {'key': 'ctrl+a'})
-                time.sleep(0.2)
-                self.driver.execute_script('mobile: key', {'key': 'del'})
+                result = self.perform_gestures([["tap", x, y], ["pause", FOCUS_PAUSE_MS], ["clear_text"]])
+                if not result["success"]:
+                    return {"success": False, "error": result["error"], "steps": result["steps"]}
             else:  # iOS
+                click_result = self.click_coordinates(x, y)
+                if not click_result["success"]:
+                    return click_result
+                self.wait_until_stable(timeout=1)
                 self.driver.execute_script('mobile: clearText')
             
             print(f"🗑️ Cleared text field at ({x}, {y})")
@@ -359,11 +543,29 @@ class AppiumController:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def tap_and_type(self, x: int, y: int, text: str, clear: bool = False, submit: bool = False) -> Dict[str, Any]:
+        """
+        Focus the field at (x, y) (tap and focus pause in one request), optionally
+        clear it, type `text` and optionally press Enter. Returns per-step results under "steps".
+        """
+        if not self.driver:
+            return {"success": False, "error": "No active session"}
+        steps = [["tap", x, y], ["pause", FOCUS_PAUSE_MS]]
+        if clear:
+            steps.append(["clear_text"])
+        steps.append(["type_text", text])
+        if submit:
+            steps.append(["press_key", "enter"])
+        result = self.perform_gestures(steps)
+        if result["success"]:
+            print(f"Typed '{text}' at ({x}, {y}) in {result['duration_ms']} ms")
+        return result
+
     def send_enter_key(self) -> Dict[str, Any]:
         """Send Enter/Return key."""
         try:
             if self.platform == "android":
-                self.driver.press_keycode(66)  # KEYCODE_ENTER
+                self._press_keycode(66)  # KEYCODE_ENTER
             else:  # iOS
                 self.driver.execute_script('mobile: key', {'key': 'return'})
 
@@ -374,18 +576,43 @@ class AppiumController:
             return {"success": False, "error": str(e)}
 
 
+    # BATCHED GESTURES
+
+    def batch(self) -> GestureBatch:
+        """Start a GestureBatch: gestures added to it are sent in one request on perform()."""
+        return GestureBatch(self)
+
+    def perform_gestures(self, steps: list) -> Dict[str, Any]:
+        """Run gesture steps such as ["tap", x, y] (pointer steps batched as W3C actions), with per-step results."""
+        if not self.driver:
+            return {"success": False, "error": "No active session", "steps": []}
+        return perform_gestures(self.driver, steps, validate=self._validate_coordinates, keyboard=self._keyboard_step)
+
+    def _keyboard_step(self, gesture: str, args: list) -> None:
+        if self.platform == "android":
+            keyboard_step(self.driver, gesture, args)
+        elif gesture == "type_text":
+            self.driver.execute_script('mobile: type', {'text': str(args[0])})
+        elif gesture == "clear_text":
+            self.driver.execute_script('mobile: clearText')
+        elif str(args[0]).lower() == "enter":
+            self.driver.execute_script('mobile: key', {'key': 'return'})
+        else:
+            self.driver.execute_script('mobile: type', {'text': str(args[0])})
+
+
     # SYSTEM NAVIGATION METHODS
 
     def press_back_button(self) -> Dict[str, Any]:
         """Press the system back button."""
         try:
             if self.platform == "android":
-                self.driver.press_keycode(4)  # KEYCODE_BACK
+                self._press_keycode(4)  # KEYCODE_BACK
             else:  # iOS - swipe from left edge
                 self.swipe_coordinates(10, self.screen_height // 2, 
                                      self.screen_width // 2, self.screen_height // 2, 300)
             
-            time.sleep(1)
+            self.wait_until_stable()
             print("Pressed back button")
             return {"success": True, "action": "back_button"}
             
@@ -396,11 +623,11 @@ class AppiumController:
         """Press the system home button."""
         try:
             if self.platform == "android":
-                self.driver.press_keycode(3)  # KEYCODE_HOME
+                self._press_keycode(3)  # KEYCODE_HOME
             else:  # iOS
                 self.driver.execute_script('mobile: pressButton', {'name': 'home'})
             
-            time.sleep(1)
+            self.wait_until_stable()
             print("Pressed home button")
             return {"success": True, "action": "home_button"}
             
@@ -411,13 +638,13 @@ class AppiumController:
         """Open the app switcher/recent apps."""
         try:
             if self.platform == "android":
-                self.driver.press_keycode(187)  # KEYCODE_APP_SWITCH
+                self._press_keycode(187)  # KEYCODE_APP_SWITCH
             else:  # iOS - double tap home
                 self.driver.execute_script('mobile: pressButton', {'name': 'home'})
                 time.sleep(0.1)
                 self.driver.execute_script('mobile: pressButton', {'name': 'home'})
             
-            time.sleep(1)
+            self.wait_until_stable()
             print("Opened app switcher")
             return {"success": True, "action": "app_switcher"}
             
@@ -433,7 +660,17 @@ class AppiumController:
             return {"success": False, "error": "No active session"}
         
         try:
-            if self.platform == "android":
+            adb = self._adb_for("launch")
+            launched = None
+            if adb is not None:
+                try:
+                    launched = adb.start_app(app_package)
+                    print(f"Started {launched['component']} in {launched['total_time_ms']} ms")
+                    method_used = "am_start"
+                except Exception as e:
+                    print(f"ADB launch failed, using Appium: {e}")
+
+            if launched is None and self.platform == "android":
                 try:
                     self.driver.activate_app(app_package)
                     print(f"Activated existing app: {app_package}")
@@ -444,7 +681,7 @@ class AppiumController:
                     })
                     print(f"🚀 Launched new app: {app_package}")
                     method_used = "launch"
-            else:  # iOS
+            elif launched is None:  # iOS
                 try:
                     self.driver.activate_app(app_package)
                     print(f"Activated iOS app: {app_package}")
@@ -453,7 +690,9 @@ class AppiumController:
                     print(f"Could not activate iOS app {app_package}: {e}")
                     return {"success": False, "error": f"Failed to open iOS app: {str(e)}"}
             
-            time.sleep(2) 
+            # Launches show a splash first; give the transition a moment to start
+            # (`am start -W` already returned after the first frame was drawn).
+            self.wait_until_stable(min_wait=0.0 if launched else 0.5)
             self._update_screen_dimensions()  
             
             return {
@@ -489,7 +728,7 @@ class AppiumController:
         """Rotate screen to landscape orientation."""
         try:
             self.driver.orientation = "LANDSCAPE"
-            time.sleep(2)
+            self.wait_until_stable(min_wait=0.3)
             self._update_screen_dimensions()
             
             print("Rotated to landscape")
@@ -502,7 +741,7 @@ class AppiumController:
         """Rotate screen to portrait orientation."""
         try:
             self.driver.orientation = "PORTRAIT"
-            time.sleep(2)
+            self.wait_until_stable(min_wait=0.3)
             self._update_screen_dimensions()
             
             print("Rotated to portrait")
@@ -514,12 +753,30 @@ class AppiumController:
 
     # UTILITY METHODS
 
+    def _adb_input(self, operation: str, *coordinates: int) -> bool:
+        """Send a tap or swipe over ADB if that operation is routed there. Returns False to use Appium."""
+        adb = self._adb_for(operation)
+        if adb is None:
+            return False
+        try:
+            if operation == "tap":
+                adb.tap(*coordinates)
+            else:
+                adb.swipe(*coordinates)
+            return True
+        except Exception as e:
+            print(f"ADB {operation} failed, using Appium: {e}")
+            return False
+
     def wait_seconds(self, seconds: float) -> Dict[str, Any]:
-        """Wait for specified number of seconds."""
+        """Wait up to `seconds`, returning early once the screen has stopped changing."""
         try:
-            time.sleep(seconds)
-            print(f"Waited {seconds} seconds")
-            return {"success": True, "action": "wait", "duration": seconds}
+            settled = self.wait_until_stable(timeout=seconds) if self.driver else {"success": False}
+            if not settled["success"]:
+                time.sleep(seconds)
+            waited = settled.get("seconds", seconds)
+            print(f"Waited {waited} of {seconds} seconds")
+            return {"success": True, "action": "wait", "duration": waited}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
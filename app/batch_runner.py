@@ -0,0 +1,220 @@
+# app/batch_runner.py
+"""
+Headless batch runner: runs a file of tasks across every attached device
+(see app.device_pool) and appends one JSON result per task to --output.
+
+    python app/batch_runner.py nightly.yaml --output logs/nightly.jsonl --rpm 120
+
+The task file is YAML (a list, or a mapping with a "tasks" list) or JSONL (one
+entry per line). An entry is a task string or a mapping:
+
+    - id: send-hello            # optional, defaults to a hash of the task
+      task: Send "hello" to Bob on WhatsApp
+      max_iterations: 8         # optional, defaults to --max-iterations
+      expected_status: Completed
+      expected_text: sent       # optional, must appear in the final summary
+
+Tasks that already have a result in --output are skipped, so an interrupted run
+resumes where it stopped. Ctrl-C lets running tasks finish and record their
+results; press it again to abort immediately.
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import argparse
+import hashlib
+import json
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import yaml
+from pydantic import BaseModel
+
+from app.config import settings
+from app.device_pool import DevicePool, discover_devices
+from utils.api_usage import configure_rate_limits, usage_stats
+from utils.response_cache import response_cache
+
+
+class BatchTask(BaseModel):
+    id: Optional[str] = None
+    task: str
+    max_iterations: Optional[int] = None
+    expected_status: str = "Completed"
+    expected_text: Optional[str] = None
+
+
+def load_tasks(path: str) -> list[BatchTask]:
+    """Read a YAML or JSONL task file; entries without an id get one derived from the task text."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            entries = [json.loads(line) for line in f if line.strip()]
+        else:
+            entries = yaml.safe_load(f) or []
+    if isinstance(entries, dict):
+        entries = entries.get("tasks", [])
+
+    tasks = [BatchTask(task=entry) if isinstance(entry, str) else BatchTask.model_validate(entry) for entry in entries]
+    seen: Counter = Counter()
+    for task in tasks:
+        if task.id is None:
+            base = hashlib.md5(task.task.encode("utf-8")).hexdigest()[:12]
+            seen[base] += 1
+            task.id = base if seen[base] == 1 else f"{base}-{seen[base]}"
+    duplicates = [task_id for task_id, count in Counter(task.id for task in tasks).items() if count > 1]
+    if duplicates:
+        raise ValueError(f"Duplicate task ids in {path}: {', '.join(duplicates)}")
+    return tasks
+
+
+def load_finished(path: str) -> set[str]:
+    """Ids of the tasks that already have a result in `path` (a torn last line is ignored)."""
+    if not os.path.exists(path):
+        return set()
+    finished = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                finished.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    return finished
+
+
+class ResultWriter:
+    """Appends result records to a JSONL file, flushed and fsynced one by one."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Terminate a line torn by an interrupted write so the next record starts cleanly.
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def write(self, record: dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def result_record(task: BatchTask, result: dict[str, Any]) -> dict[str, Any]:
+    summary = result.get("summary") or ""
+    passed = result["status"] == task.expected_status and (
+        task.expected_text is None or task.expected_text.lower() in str(summary).lower()
+    )
+    usage = result.get("usage", {})
+    return {
+        "id": task.id,
+        "task": task.task,
+        "status": result["status"],
+        "passed": passed,
+        "expected_status": task.expected_status,
+        "device": result.get("device"),
+        "iterations": result.get("iterations"),
+        "attempts": result.get("attempts"),
+        "seconds": result.get("seconds"),
+        "error": result.get("error"),
+        "log": result.get("log"),
+        "summary": summary or None,
+        "usage": usage,
+        "tokens": {
+            "prompt": sum(stats["prompt_tokens"] for stats in usage.values()),
+            "output": sum(stats["output_tokens"] for stats in usage.values())
+        },
+        "finished_at": datetime.now(timezone.utc).isoformat()
+    }
+
+
+def run_batch(tasks: list[BatchTask], output: str, serials: list[str], retries: int = settings.DEVICE_POOL_TASK_RETRIES,
+              max_iterations: int = settings.MAX_ITERATIONS, sleep_between: float = 2) -> list[dict[str, Any]]:
+    """Run `tasks` on the devices in `serials`, writing each result to `output` as it finishes."""
+    writer = ResultWriter(output)
+    records: list[dict[str, Any]] = []
+    pool = DevicePool(serials=serials)
+
+    def on_result(index: int, result: dict[str, Any]) -> None:
+        record = result_record(tasks[index], result)
+        writer.write(record)
+        records.append(record)
+        print(f"[{len(records)}/{len(tasks)}] {record['id']}: {record['status']} "
+              f"({'passed' if record['passed'] else 'failed'}, {record['seconds']}s on {record['device']})")
+
+    items = [
+        {"task": task.task, "max_iterations": task.max_iterations or max_iterations, "sleep_between": sleep_between}
+        for task in tasks
+    ]
+    runner = threading.Thread(
+        target=pool.run_tasks, args=(items,), kwargs={"retries": retries, "on_result": on_result},
+        name="batch-runner", daemon=True
+    )
+    runner.start()
+    try:
+        while runner.is_alive():
+            runner.join(0.5)
+    except KeyboardInterrupt:
+        print("Interrupted: waiting for running tasks to finish (Ctrl-C again to abort)...")
+        pool.stop()
+        runner.join()
+    finally:
+        pool.close()
+    return records
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tasks", help="YAML or JSONL task file")
+    parser.add_argument("--output", help="JSONL results file (default: LOG_DIR/batch_<tasks file>.jsonl)")
+    parser.add_argument("--devices", help="Comma-separated device serials (default: every attached device)")
+    parser.add_argument("--workers", type=int, help="Max devices (one worker each) to use")
+    parser.add_argument("--max-iterations", type=int, default=settings.MAX_ITERATIONS)
+    parser.add_argument("--sleep-between", type=float, default=2)
+    parser.add_argument("--retries", type=int, default=settings.DEVICE_POOL_TASK_RETRIES,
+                        help="Times a task whose device crashed is retried on another device")
+    parser.add_argument("--rpm", type=float, help="Max requests per minute per model (default: API_REQUESTS_PER_MINUTE)")
+    parser.add_argument("--max-concurrent-requests", type=int,
+                        help="Max in-flight requests per model (default: API_MAX_CONCURRENT_REQUESTS)")
+    parser.add_argument("--no-resume", action="store_true", help="Run every task even if it already has a result")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(
+        settings.LOG_DIR, f"batch_{os.path.splitext(os.path.basename(args.tasks))[0]}.jsonl"
+    )
+    tasks = load_tasks(args.tasks)
+    finished = set() if args.no_resume else load_finished(output)
+    todo = [task for task in tasks if task.id not in finished]
+    print(f"{len(tasks)} tasks, {len(tasks) - len(todo)} already in {output}, {len(todo)} to run")
+    if not todo:
+        return 0
+
+    serials = args.devices.split(",") if args.devices else discover_devices()
+    serials = serials[:args.workers] if args.workers else serials
+    if not serials:
+        print("No connected devices found.")
+        return 1
+    configure_rate_limits(args.rpm, args.max_concurrent_requests)
+
+    records = run_batch(todo, output, serials, retries=args.retries,
+                        max_iterations=args.max_iterations, sleep_between=args.sleep_between)
+
+    statuses = Counter(record["status"] for record in records)
+    passed = sum(record["passed"] for record in records)
+    print(f"\nRan {len(records)}/{len(todo)} tasks on {len(serials)} devices: {passed} passed, {dict(statuses)}")
+    print(f"API usage: {usage_stats.snapshot()}")
+    if response_cache() is not None:
+        print(f"Response cache: {response_cache().stats()}")
+    print(f"Results written to {output}")
+    return 0 if passed == len(todo) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# app/chat_log.py
+
+import atexit
+import json
+import os
+import queue
+import threading
+from typing import Any, Iterator, Optional
+
+from app.config import settings
+
+
+def chat_log_path(task_id: str, log_dir: str = settings.LOG_DIR) -> str:
+    return os.path.join(log_dir, f"chat_{task_id}.jsonl")
+
+
+class ChatLog:
+    """
+    Append-only JSONL log of one task's chatroom messages.
+
+    `append()` only enqueues the record; a background thread writes it and
+    fsyncs in batches (every `fsync_batch` records, or when the queue has been
+    idle for `flush_seconds`), so the control loop never blocks on disk. Every
+    record is one self-contained line, so a crash loses at most the last
+    unsynced batch and never corrupts earlier messages. Re-opening a task ID
+    appends to its existing log; `records` counts every record in it.
+
+    `close()` writes what is queued and releases the writer thread and file;
+    appending afterwards re-opens the log. Logs still open at interpreter exit
+    are closed by an atexit hook.
+    """
+
+    def __init__(self, task_id: str, log_dir: str = settings.LOG_DIR,
+                 fsync_batch: int = settings.CHAT_LOG_FSYNC_BATCH,
+                 flush_seconds: float = settings.CHAT_LOG_FLUSH_SECONDS):
+        self.task_id = task_id
+        self.path = chat_log_path(task_id, log_dir)
+        self.fsync_batch = fsync_batch
+        self.flush_seconds = flush_seconds
+        os.makedirs(log_dir or ".", exist_ok=True)
+        self.records = sum(1 for _ in iter_chat_log(self.path)) if os.path.exists(self.path) else 0
+
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._open()
+
+    @property
+    def closed(self) -> bool:
+        return self._thread is None
+
+    def _open(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._writer, name=f"chat-log-{self.task_id}", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def append(self, record: dict) -> None:
+        """Queue one message record for writing (re-opening the log if it was closed)."""
+        if self._thread is None:
+            self._open()
+        self.records += 1
+        self._queue.put(record)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until every record queued so far is written and fsynced."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self) -> None:
+        """Write and sync everything queued, then stop the writer thread and close the file."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(None)
+            thread.join()
+            atexit.unregister(self.close)
+
+    def _writer(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            unsynced = 0
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_seconds if unsynced else None)
+                except queue.Empty:
+                    item = threading.Event()  # idle: sync what we have
+
+                if item is None:
+                    if unsynced:
+                        self._sync(f)
+                    break
+                if isinstance(item, threading.Event):
+                    if unsynced:
+                        self._sync(f)
+                        unsynced = 0
+                    item.set()
+                    continue
+
+                try:
+                    f.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+                    unsynced += 1
+                except Exception as e:
+                    print(f"Chat log write failed for {self.path}: {e}")
+                if unsynced >= self.fsync_batch:
+                    self._sync(f)
+                    unsynced = 0
+
+    @staticmethod
+    def _sync(f) -> None:
+        f.flush()
+        os.fsync(f.fileno())
+
+    def __repr__(self) -> str:
+        return f"<ChatLog {self.path}>"
+
+
+# === Reader API ===
+
+def list_chat_logs(log_dir: str = settings.LOG_DIR) -> list[dict]:
+    """Chat logs in `log_dir`, newest first, as {task_id, path, size, modified} dicts."""
+    if not os.path.isdir(log_dir):
+        return []
+    logs = []
+    for filename in os.listdir(log_dir):
+        if filename.startswith("chat_") and filename.endswith(".jsonl"):
+            path = os.path.join(log_dir, filename)
+            stat = os.stat(path)
+            logs.append({
+                "task_id": filename[len("chat_"):-len(".jsonl")],
+                "path": path,
+                "size": stat.st_size,
+                "modified": stat.st_mtime
+            })
+    return sorted(logs, key=lambda log: log["modified"], reverse=True)
+
+
+def iter_chat_log(task_id_or_path: str, log_dir: str = settings.LOG_DIR,
+                  msg_type: Optional[str] = None, sender: Optional[str] = None) -> Iterator[dict]:
+    """
+    Stream the messages of a chat log in order, optionally filtered by type/sender.
+    A truncated last line (from a crash mid-write) is skipped.
+    """
+    path = task_id_or_path if os.path.exists(task_id_or_path) else chat_log_path(task_id_or_path, log_dir)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                msg = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if msg_type is not None and msg.get("type") != msg_type:
+                continue
+            if sender is not None and msg.get("sender") != sender:
+                continue
+            yield msg
+
+
+def load_chat_log(task_id_or_path: str, log_dir: str = settings.LOG_DIR) -> list[dict]:
+    """All messages of a chat log as a list."""
+    return list(iter_chat_log(task_id_or_path, log_dir))
+
+
+def summarize_chat_log(task_id_or_path: str, log_dir: str = settings.LOG_DIR) -> dict[str, Any]:
+    """Message counts per type and sender, plus first/last timestamps, for quick analysis."""
+    by_type: dict[str, int] = {}
+    by_sender: dict[str, int] = {}
+    first = last = None
+    total = 0
+    for msg in iter_chat_log(task_id_or_path, log_dir):
+        total += 1
+        by_type[msg.get("type")] = by_type.get(msg.get("type"), 0) + 1
+        by_sender[msg.get("sender")] = by_sender.get(msg.get("sender"), 0) + 1
+        first = first or msg.get("timestamp")
+        last = msg.get("timestamp")
+    return {"messages": total, "by_type": by_type, "by_sender": by_sender, "first": first, "last": last}
@@ -1,15 +1,207 @@
 # app/chatroom.py
 
+from bisect import bisect_left
 from datetime import datetime, timezone
-from typing import List, Optional
+from itertools import islice
+from typing import Any, Iterable, List, Optional
+
+from app.chat_log import ChatLog, iter_chat_log
+from app.config import settings
+
+# Message types left out of rendered transcripts (their content is a frame, not text).
+TRANSCRIPT_EXCLUDED_TYPES = frozenset({"screen_image"})
+
+
+class Message:
+    """
+    A single chatroom message stored as a compact slotted record.
+    Supports dict-style access (`msg["type"]`, `msg.get(...)`) so agents can treat
+    it like the plain dicts used elsewhere in the pipeline.
+    """
+    __slots__ = ("sender", "type", "content", "timestamp")
+
+    def __init__(self, sender: str, type: str, content: Any, timestamp: str):
+        self.sender = sender
+        self.type = type
+        self.content = content
+        self.timestamp = timestamp
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__
+
+    def keys(self) -> tuple:
+        return self.__slots__
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def render(self) -> str:
+        """The `[sender] (type): content` line agents put in their prompts."""
+        return f"[{self.sender}] ({self.type}): {self.content}"
+
+    def __repr__(self) -> str:
+        return f"Message({self.to_dict()!r})"
+
+
+class ChatHistory(list):
+    """
+    Append-only message list with per-type and per-sender indexes.
+
+    Latest-by-type lookups are O(1), and each message's `[sender] (type): content`
+    transcript line (none for screen_image messages) is rendered once, as it is
+    added; `transcript()` joins the lines on demand.
+
+    With a `window`, only the most recent `window` messages stay in memory (older
+    ones are expected to live in a ChatLog). The latest message of every type is
+    kept regardless, so latest-by-type lookups survive eviction, and given the
+    `log` (whose record `log_start` is this history's first message) evicted
+    messages can be read back with `evicted_since()`.
+    """
+
+    def __init__(self, messages: Iterable[Message] = (), window: Optional[int] = None,
+                 log: Optional[ChatLog] = None, log_start: int = 0):
+        super().__init__()
+        self.window = window
+        self.log = log
+        self._log_start = log_start
+        # Absolute position of self[0]; positions in the indexes are absolute.
+        self._base = 0
+        self._by_type: dict[str, list[int]] = {}
+        self._by_sender: dict[str, list[int]] = {}
+        self._latest: dict[str, Message] = {}
+        # _lines[i] is the rendered transcript line of in-memory message i (None if excluded)
+        self._lines: list[Optional[str]] = []
+        self.extend(messages)
+
+    @property
+    def total(self) -> int:
+        """Number of messages ever appended, including evicted ones."""
+        return self._base + len(self)
+
+    def append(self, msg: Message) -> None:
+        position = self.total
+        super().append(msg)
+        self._by_type.setdefault(msg.type, []).append(position)
+        self._by_sender.setdefault(msg.sender, []).append(position)
+        self._latest[msg.type] = msg
+        self._lines.append(msg.render() if msg.type not in TRANSCRIPT_EXCLUDED_TYPES else None)
+        # Evict in chunks so the front-of-list deletes stay amortized O(1) per message.
+        if self.window is not None and len(self) > self.window + max(self.window // 4, 1):
+            self._evict(len(self) - self.window)
+
+    def _evict(self, count: int) -> None:
+        super().__delitem__(slice(0, count))
+        self._base += count
+        del self._lines[:count]
+        for index in (self._by_type, self._by_sender):
+            for key in list(index):
+                kept = index[key][bisect_left(index[key], self._base):]
+                if kept:
+                    index[key] = kept
+                else:
+                    del index[key]
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        for msg in messages:
+            self.append(msg)
+
+    def __iadd__(self, messages: Iterable[Message]) -> "ChatHistory":
+        self.extend(messages)
+        return self
+
+    def _append_only(self, *args, **kwargs):
+        raise TypeError("ChatHistory is append-only")
+
+    insert = remove = pop = clear = sort = reverse = _append_only
+    __setitem__ = __delitem__ = __imul__ = _append_only
+
+    def latest(self, msg_type: str) -> Optional[Message]:
+        """Latest message of a given type, or None (kept even after eviction)."""
+        return self._latest.get(msg_type)
+
+    def latest_content(self, msg_type: str) -> Any:
+        """Content of the latest message of a given type, or None."""
+        msg = self.latest(msg_type)
+        return msg.content if msg is not None else None
+
+    def last_index(self, msg_type: str) -> int:
+        """In-memory position of the latest message of a given type, or -1."""
+        indexes = self._by_type.get(msg_type)
+        return indexes[-1] - self._base if indexes else -1
+
+    def of_type(self, msg_type: str) -> List[Message]:
+        """In-memory messages of a given type."""
+        return [self[i - self._base] for i in self._by_type.get(msg_type, ())]
+
+    def from_sender(self, sender: str) -> List[Message]:
+        """In-memory messages from a given sender."""
+        return [self[i - self._base] for i in self._by_sender.get(sender, ())]
+
+    def since(self, total: int) -> List[Message]:
+        """In-memory messages appended after the history held `total` messages."""
+        return self[max(total - self._base, 0):]
+
+    def evicted_since(self, total: int) -> List[Message]:
+        """Messages appended after the history held `total` messages but already evicted, read from the log."""
+        if total >= self._base or self.log is None:
+            return []
+        self.log.flush()
+        records = islice(iter_chat_log(self.log.path), self._log_start + total, self._log_start + self._base)
+        return [Message(rec["sender"], rec["type"], rec["content"], rec["timestamp"]) for rec in records]
+
+    def transcript(self, start: int = 0) -> str:
+        """Rendered transcript of in-memory messages from position `start` on, screen_image excluded."""
+        return "\n".join(line for line in self._lines[max(start, 0):] if line is not None)
+
+
+def latest_content(history: list, msg_type: str) -> Any:
+    """
+    Content of the latest message of `msg_type` in any history list.
+    Uses the index of a ChatHistory and falls back to a reverse scan for plain lists.
+    """
+    if isinstance(history, ChatHistory):
+        return history.latest_content(msg_type)
+    for msg in reversed(history):
+        if msg["type"] == msg_type:
+            return msg["content"]
+    return None
+
+
+def render_transcript(history: list) -> str:
+    """`[sender] (type): content` lines for a history list, screen_image excluded."""
+    if isinstance(history, ChatHistory):
+        return history.transcript()
+    return "\n".join(
+        f"[{msg['sender']}] ({msg['type']}): {msg['content']}"
+        for msg in history if msg["type"] not in TRANSCRIPT_EXCLUDED_TYPES
+    )
+
 
 class ChatRoom:
     """
     A simple message bus that stores agent/system/user messages in memory.
     Supports timestamping, filtering, and traceability.
+
+    Given a `task_id`, every message is also streamed to a ChatLog and only the
+    last `window` messages are kept in memory.
     """
-    def __init__(self):
-        self.messages: List[dict] = []
+    def __init__(self, task_id: Optional[str] = None, window: Optional[int] = settings.CHAT_WINDOW_SIZE):
+        self.task_id = task_id
+        self.log: Optional[ChatLog] = ChatLog(task_id) if task_id and settings.CHAT_LOG_ENABLED else None
+        self.window = window if self.log is not None else None
+        self.messages: ChatHistory = self._new_history()
+
+    def _new_history(self) -> ChatHistory:
+        log_start = self.log.records if self.log is not None else 0
+        return ChatHistory(window=self.window, log=self.log, log_start=log_start)
 
     def _timestamp(self) -> str:
         return datetime.now(timezone.utc).isoformat()
@@ -23,35 +215,44 @@ class ChatRoom:
             type (str): Message type (e.g. "task", "screen content", "code_snippet")
             content (str): Actual message payload
         """
-        self.messages.append({
-            "sender": sender,
-            "type": type,
-            "content": content,
-            "timestamp": self._timestamp()
-        })
-
-    def get_history(self) -> List[dict]:
-        """Return full message history (FIFO)."""
+        msg = Message(sender, type, content, self._timestamp())
+        self.messages.append(msg)
+        if self.log is not None:
+            self.log.append(msg.to_dict())
+
+    def get_history(self) -> ChatHistory:
+        """Return message history (FIFO); only the in-memory window when logging to disk."""
         return self.messages
 
-    def get_latest(self, msg_type: str) -> Optional[dict]:
+    def get_latest(self, msg_type: str) -> Optional[Message]:
         """Return latest message of a given type."""
-        for msg in reversed(self.messages):
-            if msg["type"] == msg_type:
-                return msg
-        return None
+        return self.messages.latest(msg_type)
 
-    def filter_by_type(self, msg_type: str) -> List[dict]:
+    def filter_by_type(self, msg_type: str) -> List[Message]:
         """Return list of all messages matching the given type."""
-        return [msg for msg in self.messages if msg["type"] == msg_type]
+        return self.messages.of_type(msg_type)
 
     def has_type_from_sender(self, msg_type: str, sender: str) -> bool:
         """Check if any message matches given type and sender."""
-        return any(msg["type"] == msg_type and msg["sender"] == sender for msg in self.messages)
+        return any(msg.type == msg_type for msg in self.messages.from_sender(sender))
+
+    def transcript(self, start: int = 0) -> str:
+        """Rendered history from message `start` on, without screen images."""
+        return self.messages.transcript(start)
+
+    def flush(self) -> None:
+        """Block until every message so far is durably in the chat log."""
+        if self.log is not None:
+            self.log.flush()
+
+    def close(self) -> None:
+        """Write out and close the chat log, releasing its writer thread (adding a message re-opens it)."""
+        if self.log is not None:
+            self.log.close()
 
     def clear(self) -> None:
-        """Clear all stored messages."""
-        self.messages = []
+        """Clear all in-memory messages (the chat log is kept)."""
+        self.messages = self._new_history()
 
     def __repr__(self) -> str:
-        return f"<ChatRoom with {len(self.messages)} messages>"
\ No newline at end of file
+        return f"<ChatRoom with {len(self.messages)} messages>"
@@ -0,0 +1,47 @@
+# app/code_runtime.py
+
+import builtins
+import time as time_module
+from types import ModuleType
+
+from app.config import settings
+
+
+class AdaptiveTime:
+    """
+    Stands in for the `time` module in generated code.
+    `sleep()` returns as soon as the screen has settled (capped at the requested
+    duration); everything else is the real `time` module.
+    """
+
+    def __init__(self, controller, time: ModuleType = time_module):
+        self._controller = controller
+        self._time = time
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > settings.SETTLE_POLL_SECONDS and getattr(self._controller, "driver", None) is not None:
+            settled = self._controller.wait_until_stable(timeout=seconds)
+            if settled.get("success"):
+                return
+        self._time.sleep(seconds)
+
+    def __getattr__(self, name: str):
+        return getattr(self._time, name)
+
+
+def execution_globals(controller, time: ModuleType = time_module) -> dict:
+    """
+    Namespace for exec() of generated code: `driver` is the controller and `time`
+    (injected or imported with `import time` / `from time import sleep`) is an
+    AdaptiveTime when ADAPTIVE_SLEEP_IN_CODE is on.
+    """
+    code_time = AdaptiveTime(controller, time) if settings.ADAPTIVE_SLEEP_IN_CODE else time
+
+    def _import(name, globals=None, locals=None, fromlist=(), level=0):
+        if name == "time" and level == 0:
+            return code_time
+        return builtins.__import__(name, globals, locals, fromlist, level)
+
+    code_builtins = dict(vars(builtins))
+    code_builtins["__import__"] = _import
+    return {"__builtins__": code_builtins, "driver": controller, "time": code_time}
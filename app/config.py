@@ -30,6 +30,121 @@ class Settings:
     # === Runtime Parameters ===
     MAX_ITERATIONS: int = int(os.getenv("MAX_ITERATIONS", 10))
     DEBUG_MODE: bool = str_to_bool(os.getenv("DEBUG_MODE", "0"))
+    # Run independent agents selected in the same step concurrently
+    CONCURRENT_AGENTS: bool = str_to_bool(os.getenv("CONCURRENT_AGENTS", "1"))
+    AGENT_TIMEOUT_SECONDS: float = float(os.getenv("AGENT_TIMEOUT_SECONDS", 120))
+    # Per-model API limits shared by all agents and tasks in the process (0 = unlimited)
+    API_REQUESTS_PER_MINUTE: float = float(os.getenv("API_REQUESTS_PER_MINUTE", 0))
+    API_MAX_CONCURRENT_REQUESTS: int = int(os.getenv("API_MAX_CONCURRENT_REQUESTS", 0))
+    # Settle, capture and summarize the next screen in the background while the orchestrator runs
+    PIPELINED_ITERATIONS: bool = str_to_bool(os.getenv("PIPELINED_ITERATIONS", "0"))
+    SETTLE_POLL_SECONDS: float = float(os.getenv("SETTLE_POLL_SECONDS", 0.3))
+    SETTLE_TIMEOUT_SECONDS: float = float(os.getenv("SETTLE_TIMEOUT_SECONDS", 4))
+    # Max fraction of changed pixels between consecutive low-res frames for the screen to count as settled
+    SETTLE_CHANGE_THRESHOLD: float = float(os.getenv("SETTLE_CHANGE_THRESHOLD", 0.002))
+    SETTLE_DOWNSCALE: int = int(os.getenv("SETTLE_DOWNSCALE", 8))
+    # Until the screen is seen changing, unchanged frames only count as settled after this long
+    SETTLE_MIN_SECONDS: float = float(os.getenv("SETTLE_MIN_SECONDS", 1.0))
+    # Let time.sleep() in generated code return early once the screen is stable
+    ADAPTIVE_SLEEP_IN_CODE: bool = str_to_bool(os.getenv("ADAPTIVE_SLEEP_IN_CODE", "1"))
+    SAVE_GRID_IMAGES: bool = str_to_bool(os.getenv("SAVE_GRID_IMAGES", "0"))
+    # Write screenshots (and annotated copies) to disk in the background
+    PERSIST_SCREENSHOTS: bool = str_to_bool(os.getenv("PERSIST_SCREENSHOTS", "1"))
+
+    # === Orchestrator Fast Path ===
+    # Resolve obvious transitions (e.g. execution error -> CodeVerifierAgent) without an LLM call
+    ORCHESTRATOR_RULES_ENABLED: bool = str_to_bool(os.getenv("ORCHESTRATOR_RULES_ENABLED", "1"))
+    ORCHESTRATOR_RULE_MIN_CONFIDENCE: float = float(os.getenv("ORCHESTRATOR_RULE_MIN_CONFIDENCE", 0.8))
+
+    # === History Compaction ===
+    # Turns (one per orchestrator selection) kept verbatim; older ones are condensed
+    HISTORY_RECENT_TURNS: int = int(os.getenv("HISTORY_RECENT_TURNS", 3))
+    HISTORY_DIGEST_LINE_CHARS: int = int(os.getenv("HISTORY_DIGEST_LINE_CHARS", 160))
+    # Multiplier for the offline token estimator until one is fitted per model from reported usage
+    TOKEN_ESTIMATE_SCALE: float = float(os.getenv("TOKEN_ESTIMATE_SCALE", 1.0))
+    ORCHESTRATOR_HISTORY_TOKENS: int = int(os.getenv("ORCHESTRATOR_HISTORY_TOKENS", 6000))
+    SUMMARIZER_HISTORY_TOKENS: int = int(os.getenv("SUMMARIZER_HISTORY_TOKENS", 8000))
+
+    # === Page Summary Cache ===
+    PAGE_SUMMARY_CACHE_ENABLED: bool = str_to_bool(os.getenv("PAGE_SUMMARY_CACHE_ENABLED", "1"))
+    PAGE_SUMMARY_CACHE_SIZE: int = int(os.getenv("PAGE_SUMMARY_CACHE_SIZE", 64))
+    # Max Hamming distance (out of 512 bits) for two screens to count as the same. A toggled
+    # checkbox or one typed character moves the fingerprint by only a bit or two, so anything
+    # above 0 trades stale summaries of changed screens for more hits.
+    PAGE_SUMMARY_CACHE_THRESHOLD: int = int(os.getenv("PAGE_SUMMARY_CACHE_THRESHOLD", 0))
+    # Also require identical pixels below the status bar (a badge count may not move the fingerprint
+    # at all). Turn off only together with a threshold, to reuse summaries of near-identical screens.
+    PAGE_SUMMARY_CACHE_EXACT: bool = str_to_bool(os.getenv("PAGE_SUMMARY_CACHE_EXACT", "1"))
+
+    # === Coordinate Cache ===
+    COORDINATE_CACHE_ENABLED: bool = str_to_bool(os.getenv("COORDINATE_CACHE_ENABLED", "1"))
+    COORDINATE_CACHE_PATH: str = os.getenv("COORDINATE_CACHE_PATH", "data/cache/coordinates.sqlite3")
+    COORDINATE_CACHE_TTL_SECONDS: int = int(os.getenv("COORDINATE_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+    COORDINATE_CACHE_MAX_ENTRIES: int = int(os.getenv("COORDINATE_CACHE_MAX_ENTRIES", 5000))
+    COORDINATE_CACHE_THRESHOLD: int = int(os.getenv("COORDINATE_CACHE_THRESHOLD", 6))
+    # "patch" re-checks the region around a cached hit before using it, "off" trusts the screen match
+    COORDINATE_CACHE_VERIFY: str = os.getenv("COORDINATE_CACHE_VERIFY", "patch")
+
+    # === Image Preparation ===
+    # Downscale and re-encode images per agent before vision calls; off sends every image as full-size PNG
+    IMAGE_PREP_ENABLED: bool = str_to_bool(os.getenv("IMAGE_PREP_ENABLED", "1"))
+    # Page summaries: max long edge in pixels (0 keeps the size), format (jpeg, webp or png) and quality
+    SUMMARY_IMAGE_MAX_EDGE: int = int(os.getenv("SUMMARY_IMAGE_MAX_EDGE", 1280))
+    SUMMARY_IMAGE_FORMAT: str = os.getenv("SUMMARY_IMAGE_FORMAT", "jpeg")
+    SUMMARY_IMAGE_QUALITY: int = int(os.getenv("SUMMARY_IMAGE_QUALITY", 80))
+    # Grid images for coordinate extraction stay lossless (png or webp) so the cell labels remain legible
+    GRID_IMAGE_MAX_EDGE: int = int(os.getenv("GRID_IMAGE_MAX_EDGE", 1600))
+    GRID_IMAGE_FORMAT: str = os.getenv("GRID_IMAGE_FORMAT", "png")
+
+    # === Response Cache ===
+    # Answer repeated stateless model requests (same model, system instruction, prompt and image) from disk
+    RESPONSE_CACHE_ENABLED: bool = str_to_bool(os.getenv("RESPONSE_CACHE_ENABLED", "0"))
+    RESPONSE_CACHE_PATH: str = os.getenv("RESPONSE_CACHE_PATH", "data/cache/responses.sqlite3")
+    RESPONSE_CACHE_MEMORY_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", 256))
+    # Defaults of agents without their own CachePolicy; max entries is per agent
+    RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 2000))
+    # Comma-separated agent names to cache (e.g. "OrchestratorAgent,CodeVerifierAgent"); empty caches every agent
+    RESPONSE_CACHE_AGENTS: str = os.getenv("RESPONSE_CACHE_AGENTS", "")
+
+    # === Hierarchy Locator ===
+    # Resolve coordinate requests from the accessibility tree before asking the vision model
+    HIERARCHY_LOCATOR_ENABLED: bool = str_to_bool(os.getenv("HIERARCHY_LOCATOR_ENABLED", "1"))
+    HIERARCHY_MIN_SCORE: float = float(os.getenv("HIERARCHY_MIN_SCORE", 0.75))
+    # Required lead of the best match over the runner-up; closer calls go to the vision model
+    HIERARCHY_MIN_MARGIN: float = float(os.getenv("HIERARCHY_MIN_MARGIN", 0.1))
+
+    # === App Index ===
+    # Installed apps are matched against the task locally; the selector agent only sees the top candidates
+    APP_INDEX_TOP_K: int = int(os.getenv("APP_INDEX_TOP_K", 8))
+    # A match this strong, with this lead over the runner-up, opens the app without asking the LLM
+    APP_INDEX_MIN_SCORE: float = float(os.getenv("APP_INDEX_MIN_SCORE", 0.8))
+    APP_INDEX_MIN_MARGIN: float = float(os.getenv("APP_INDEX_MIN_MARGIN", 0.15))
+    # Seconds between checks for installed, updated or removed packages
+    APP_INDEX_REFRESH_SECONDS: float = float(os.getenv("APP_INDEX_REFRESH_SECONDS", 60))
+
+    # === Macros ===
+    # Record successful runs to MACRO_DIR and replay them for repeated tasks (opt-in: replays tap blind)
+    MACROS_ENABLED: bool = str_to_bool(os.getenv("MACROS_ENABLED", "0"))
+    # Max fingerprint distance (out of 512 bits) for a replayed screen to count as the recorded one;
+    # as tight as COORDINATE_CACHE_THRESHOLD since a replayed step taps recorded coordinates the same way
+    MACRO_REPLAY_THRESHOLD: int = int(os.getenv("MACRO_REPLAY_THRESHOLD", 6))
+    MACRO_STEP_TIMEOUT_SECONDS: float = float(os.getenv("MACRO_STEP_TIMEOUT_SECONDS", 8))
+
+    # === Chat Log ===
+    CHAT_LOG_ENABLED: bool = str_to_bool(os.getenv("CHAT_LOG_ENABLED", "1"))
+    CHAT_LOG_FSYNC_BATCH: int = int(os.getenv("CHAT_LOG_FSYNC_BATCH", 20))
+    CHAT_LOG_FLUSH_SECONDS: float = float(os.getenv("CHAT_LOG_FLUSH_SECONDS", 1.0))
+    # Messages kept in memory per chatroom; older ones are only in the chat log
+    CHAT_WINDOW_SIZE: int = int(os.getenv("CHAT_WINDOW_SIZE", 200))
+
+    # === Tracing ===
+    # Time agent calls, device commands, generated code and iterations (see utils/tracing.py)
+    TRACING_ENABLED: bool = str_to_bool(os.getenv("TRACING_ENABLED", "1"))
+    # JSONL file every finished span is appended to; empty keeps spans in memory only
+    TRACE_FILE: str = os.getenv("TRACE_FILE", "logs/traces.jsonl")
+    # Latest durations kept per agent/command for the p50/p95 metrics
+    TRACE_MAX_SAMPLES: int = int(os.getenv("TRACE_MAX_SAMPLES", 2000))
 
     # === Browser Settings ===
     EDGE_PROFILE_PATH: str = os.getenv("EDGE_PROFILE_PATH", "")
@@ -42,9 +157,25 @@ class Settings:
     SUMMARY_DIR: str = os.getenv("SUMMARY_DIR", "data/summaries/")
     TRANSCRIPT_DIR: str = os.getenv("TRANSCRIPT_DIR", "data/transcripts/")
 
+    # === ADB Transport ===
+    # Comma-separated operations to send straight over ADB instead of Appium:
+    # screenshot, tap, swipe, text, key, launch (or "all"); empty keeps everything on Appium
+    ADB_OPERATIONS: str = os.getenv("ADB_OPERATIONS", "")
+    ADB_SERVER_HOST: str = os.getenv("ADB_SERVER_HOST", "127.0.0.1")
+    ADB_SERVER_PORT: int = int(os.getenv("ADB_SERVER_PORT", 5037))
+
     # === Appium Settings ===
     APPIUM_SERVER_URL: str = os.getenv("APPIUM_SERVER_URL", "http://localhost:4723")
 
+    # === Device Pool ===
+    # UiAutomator2 systemPort of the first pooled device; each further device gets the next port
+    DEVICE_POOL_BASE_SYSTEM_PORT: int = int(os.getenv("DEVICE_POOL_BASE_SYSTEM_PORT", 8200))
+    # Consecutive crashes after which a device is quarantined
+    DEVICE_POOL_MAX_FAILURES: int = int(os.getenv("DEVICE_POOL_MAX_FAILURES", 2))
+    DEVICE_POOL_QUARANTINE_SECONDS: float = float(os.getenv("DEVICE_POOL_QUARANTINE_SECONDS", 300))
+    # Times a task that crashed its device is requeued for another device
+    DEVICE_POOL_TASK_RETRIES: int = int(os.getenv("DEVICE_POOL_TASK_RETRIES", 1))
+
     def validate(self):
         required_keys = {
             "GOOGLE_API_KEY_COORDINATE": self.GOOGLE_API_KEY_COORDINATE,
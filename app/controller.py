@@ -2,22 +2,60 @@
 
 import time
 import hashlib
-from typing import Optional
-import json
+from typing import Callable, Optional
+from datetime import datetime
 
+from agents.schemas import parse_stats
 from app.config import settings
 from app.chatroom import ChatRoom
-from app.orchestrator import run_next_step
+from app.macros import MacroPlayer, MacroRecorder, MacroStore
+from app.orchestrator import get_agent, run_next_step
+from app.prefetch import SpeculativePrefetcher
 
 from app.appium_controller import AppiumController
+from utils.image_prep import image_prep_stats
+from utils.response_cache import response_cache
+from utils.screenshot import Screenshot, wait_for_pending_writes
+from utils.tracing import annotate, metrics as trace_metrics, span, traced
 
 def hash_content(content: str) -> str:
     """Return an MD5 hash of any string content."""
     return hashlib.md5(content.encode("utf-8")).hexdigest()
 
 
+def replay_macro(task: str, driver: AppiumController, chatroom: ChatRoom,
+                 macro_store: MacroStore, recorder: MacroRecorder) -> bool:
+    """
+    Replay the macro recorded for this task, if any. Returns True if it completed the
+    task; otherwise the executed steps seed `recorder` and the agents take over.
+    """
+    found = macro_store.load(task)
+    if found is None or driver.driver is None:
+        return False
+    macro, params = found
+    print(f"Replaying macro '{macro.template}' ({len(macro.steps)} steps)")
+    replay = MacroPlayer(driver).replay(macro, params)
+    print(f"Macro replay: {replay['reason']} after {replay['executed']} steps in {replay['seconds']}s")
+    recorder.seed(replay["steps"], macro.app_package)
+
+    if replay["completed"]:
+        chatroom.add_message("MacroPlayer", "feedback",
+                             f"Task completed by replaying a recorded macro ({replay['executed']} steps).")
+        return True
+    if replay["executed"]:
+        done = ", ".join(step.method for step in replay["steps"])
+        chatroom.add_message("MacroPlayer", "feedback",
+                             f"Replayed {replay['executed']} recorded steps ({done}); stopped because the "
+                             f"{replay['reason']}. Continue the task from the current screen.")
+    return False
+
+
+@traced("task", name="run_task")
 def run_task(task: str, max_iterations: int = settings.MAX_ITERATIONS, sleep_between: int = 2,
-             driver=None, chatroom=None, task_status=None
+             driver=None, chatroom=None, task_status=None,
+             metrics_hook: Optional[Callable[[dict], None]] = None,
+             on_finish: Optional[Callable[[dict], None]] = None,
+             on_selection: Optional[Callable[[dict], None]] = None
              ) -> ChatRoom:
     """
     Run the full browser automation loop for the given user task.
@@ -25,57 +63,163 @@ def run_task(task: str, max_iterations: int = settings.MAX_ITERATIONS, sleep_bet
     Args:
         task: Task description from user
         max_iterations: Max number of cycles to run
-        sleep_between: Seconds to wait between iterations
+        sleep_between: Max seconds to wait for the screen to settle between iterations
+        driver: AppiumController to reuse (a new one is created if None; a session is
+            started if it has none)
+        metrics_hook: Called with per-iteration timings when PIPELINED_ITERATIONS is on
+        on_finish: Called once at the end with {"status", "iterations", "replayed",
+            "seconds", "log", "summary"}
+        on_selection: Called with the agents chosen for each step (see run_next_step)
+
+    With MACROS_ENABLED, a macro recorded for the same task template is replayed
+    first; the agents only run if it diverges, and a successful run is recorded.
 
     Returns:
         ChatRoom instance containing full interaction history
     """
-    driver = AppiumController(
-        appium_server_url=settings.APPIUM_SERVER_URL
-    )
-    driver.setup_driver()
+    if driver is None:
+        driver = AppiumController(
+            appium_server_url=settings.APPIUM_SERVER_URL
+        )
+    if driver.driver is None:
+        driver.setup_driver()
     if not chatroom:
-        chatroom = ChatRoom()
+        task_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{hash_content(task)[:8]}"
+        chatroom = ChatRoom(task_id=task_id)
 
 
     task_status = "In Progress"
+    task_start = time.perf_counter()
+    iterations_run = 0
     
     chatroom.add_message("User", "task", task)
+    annotate(task=task, task_id=chatroom.task_id)
 
     prev_error: Optional[str] = None
-
-    for iteration in range(1, max_iterations + 1):
-        print(f"\nIteration {iteration} started.")
-
-        if driver.driver is not None:
-            screenshot = driver.take_screenshot()
-            if screenshot["success"]:
-                chatroom.add_message("Controller", "screen_image", screenshot["screenshot_path"])
-
-
-        result = run_next_step(chatroom, driver, time)
-
-        if result == "done":
-            print("Task completed.")
-            task_status = "Completed"
-            chatroom.add_message("Controller", "feedback", "Task completed successfully.")
-            break
-        elif result == "wait_user":
-            print("Awaiting user input or response...")
-            task_status = "Paused"
-            chatroom.add_message("Controller", "feedback", "Waiting for user input.")
-            break
-
-        time.sleep(sleep_between)
+    current_screenshot: Optional[Screenshot] = None
+    prefetcher = SpeculativePrefetcher(
+        driver, get_agent("PageSummarizerAgent"), sleep_between
+    ) if settings.PIPELINED_ITERATIONS else None
+
+    def add_screen(screenshot: Screenshot) -> None:
+        nonlocal current_screenshot
+        chatroom.add_message("Controller", "screen_image", screenshot)
+        if recorder is not None:
+            recorder.observe(screenshot)
+        # Only the latest frame is consumed by agents; free the previous one's pixels.
+        if current_screenshot is not None:
+            current_screenshot.release()
+        current_screenshot = screenshot
+
+    macro_store = MacroStore() if settings.MACROS_ENABLED else None
+    recorder = MacroRecorder(driver, task) if macro_store is not None else None
+    replayed = replay_macro(task, driver, chatroom, macro_store, recorder) if macro_store is not None else False
+    actions = recorder if recorder is not None else driver
+
+    # Last frame of the post-step settle wait, reused as the next iteration's screen.
+    settled_frame: Optional[Screenshot] = None
+
+    # A completed macro replay leaves nothing for the agents to do.
+    for iteration in range(1, (0 if replayed else max_iterations) + 1):
+        with span("iteration", "iteration", iteration=iteration):
+            print(f"\nIteration {iteration} started.")
+            iterations_run = iteration
+
+            collect_screen: Optional[Callable[[], dict]] = None
+            if prefetcher is not None and prefetcher.pending:
+                collected = {}
+
+                def collect_prefetched() -> dict:
+                    if "prefetched" not in collected:
+                        frame, collected["prefetched"] = prefetcher.collect()
+                        if frame is not None:
+                            add_screen(frame)
+                    return collected["prefetched"]
+
+                collect_screen = collect_prefetched
+
+            elif settled_frame is not None:
+                add_screen(settled_frame)
+                settled_frame = None
+
+            elif driver.driver is not None:
+                screenshot = driver.take_screenshot()
+                if screenshot["success"]:
+                    add_screen(screenshot["screenshot"])
+
+            step_start = chatroom.get_history().total
+            result = run_next_step(chatroom, actions, time, collect_screen=collect_screen, on_selection=on_selection)
+
+            if collect_screen is not None:
+                # The step may have failed before it needed the screen.
+                collect_screen()
+                metrics = prefetcher.finish_iteration()
+                metrics["iteration"] = iteration
+                print(f"Pipelined iteration: {metrics}")
+                if metrics_hook is not None:
+                    metrics_hook(metrics)
+
+            if result == "done":
+                print("Task completed.")
+                task_status = "Completed"
+                chatroom.add_message("Controller", "feedback", "Task completed successfully.")
+                break
+            elif result == "wait_user":
+                print("Awaiting user input or response...")
+                task_status = "Paused"
+                chatroom.add_message("Controller", "feedback", "Waiting for user input.")
+                break
+
+            executed_code = any(msg["type"] == "code_snippet" for msg in chatroom.get_history().since(step_start))
+            if prefetcher is not None and executed_code and driver.driver is not None:
+                prefetcher.start(task)
+            elif driver.driver is not None:
+                # Wait only while the screen is still changing, at most sleep_between.
+                settled = driver.wait_until_stable(timeout=sleep_between, persist=None)
+                settled_frame = settled["screenshot"] if settled["success"] else None
+            else:
+                time.sleep(sleep_between)
 
 
     else:
-        print("⏹️ Max iterations reached. Ending task.")
-        task_status = "Max Iterations Reached"
+        if replayed:
+            task_status = "Completed"
+        else:
+            print("⏹️ Max iterations reached. Ending task.")
+            task_status = "Max Iterations Reached"
 
     
-    with open("debug_chatroom.json", "w", encoding="utf-8") as f:
-        json.dump(chatroom.get_history(), f, indent=2, ensure_ascii=False)
-    print("Chatroom history saved to debug_chatroom.json")
+    if prefetcher is not None:
+        prefetcher.close()
+    if task_status == "Completed" and not replayed and recorder is not None and recorder.steps:
+        path = macro_store.save(recorder.to_macro(current_screenshot))
+        print(f"Recorded macro with {len(recorder.steps)} steps to {path}")
+    if current_screenshot is not None:
+        current_screenshot.release()
+    wait_for_pending_writes()
+
+    annotate(status=task_status, iterations=iterations_run, replayed=replayed)
+    print(f"Response parse stats: {parse_stats.snapshot()}")
+    latency = ", ".join(f"{row['name']} {row['p50_ms']}/{row['p95_ms']} ms x{row['count']}"
+                        for row in trace_metrics.summary("agent"))
+    print(f"Agent latency (p50/p95): {latency or 'no calls'}")
+    if response_cache() is not None:
+        print(f"Response cache: {response_cache().stats()}")
+    if image_prep_stats.snapshot():
+        print(f"Images sent per policy: {image_prep_stats.snapshot()}")
+    # The log re-opens if the chatroom is reused (e.g. resuming a paused task).
+    chatroom.close()
+    if chatroom.log is not None:
+        print(f"Chatroom history saved to {chatroom.log.path}")
+    if on_finish is not None:
+        summary = chatroom.get_latest("summary")
+        on_finish({
+            "status": task_status,
+            "iterations": iterations_run,
+            "replayed": replayed,
+            "seconds": round(time.perf_counter() - task_start, 2),
+            "log": chatroom.log.path if chatroom.log is not None else None,
+            "summary": summary["content"] if summary is not None else None
+        })
 
     return driver, chatroom, task_status
\ No newline at end of file
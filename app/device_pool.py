@@ -0,0 +1,328 @@
+# app/device_pool.py
+
+import hashlib
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+import adbutils
+
+from app.appium_controller import AppiumController
+from app.chatroom import ChatRoom
+from app.config import settings
+from app.controller import run_task
+from app.orchestrator import AgentSet, agent_scope
+from utils.api_usage import usage_delta
+
+
+def discover_devices(host: str = settings.ADB_SERVER_HOST, port: int = settings.ADB_SERVER_PORT) -> list[str]:
+    """Serials of every attached device that is online (adb state "device")."""
+    client = adbutils.AdbClient(host=host, port=port)
+    return [info.serial for info in client.list() if info.state == "device"]
+
+
+class DeviceSlot:
+    """A pooled device, its Appium session and its health."""
+
+    def __init__(self, serial: str, system_port: int):
+        self.serial = serial
+        self.system_port = system_port
+        # "idle", "busy", "quarantined" or "gone" (detached from adb)
+        self.state = "idle"
+        self.failures = 0
+        self.tasks_run = 0
+        self.last_error: Optional[str] = None
+        self.quarantined_until = 0.0
+        self.controller: Optional[AppiumController] = None
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "serial": self.serial,
+            "system_port": self.system_port,
+            "state": self.state,
+            "failures": self.failures,
+            "tasks_run": self.tasks_run,
+            "last_error": self.last_error,
+            "session": self.controller is not None and self.controller.driver is not None
+        }
+
+    def __repr__(self) -> str:
+        return f"<DeviceSlot {self.serial} ({self.state})>"
+
+
+class DevicePool:
+    """
+    Every attached device with its own Appium session, and a scheduler that
+    runs queued tasks across them.
+
+    Each device gets a unique UiAutomator2 systemPort (DEVICE_POOL_BASE_SYSTEM_PORT
+    upwards) and its own screenshot directory. After every task the device is
+    health-checked (adb state, a shell round trip and a call on the Appium
+    session). A device that fails is reclaimed: its session is dropped and
+    restarted before the next task. After DEVICE_POOL_MAX_FAILURES consecutive
+    failures it is quarantined for DEVICE_POOL_QUARANTINE_SECONDS, then
+    re-checked and put back into rotation.
+
+        pool = DevicePool()
+        results = pool.run_tasks(["Open settings", "Open camera"])
+    """
+
+    def __init__(self, appium_server_url: str = settings.APPIUM_SERVER_URL,
+                 serials: Optional[list[str]] = None,
+                 base_system_port: int = settings.DEVICE_POOL_BASE_SYSTEM_PORT,
+                 max_failures: int = settings.DEVICE_POOL_MAX_FAILURES,
+                 quarantine_seconds: float = settings.DEVICE_POOL_QUARANTINE_SECONDS,
+                 controller_factory: Callable[..., AppiumController] = AppiumController):
+        self.appium_server_url = appium_server_url
+        self.base_system_port = base_system_port
+        self.max_failures = max_failures
+        self.quarantine_seconds = quarantine_seconds
+        self.controller_factory = controller_factory
+        self.slots: dict[str, DeviceSlot] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.refresh(serials)
+
+    # DEVICES
+
+    def refresh(self, serials: Optional[list[str]] = None) -> list[DeviceSlot]:
+        """Add newly attached devices (or `serials`) and mark detached ones as gone."""
+        online = serials if serials is not None else discover_devices()
+        with self._lock:
+            for serial in online:
+                slot = self.slots.get(serial)
+                if slot is None:
+                    self.slots[serial] = DeviceSlot(serial, self.base_system_port + len(self.slots))
+                elif slot.state == "gone":
+                    slot.state = "idle"
+            if serials is None:
+                for slot in self.slots.values():
+                    if slot.serial not in online and slot.state == "idle":
+                        slot.state = "gone"
+        print(f"Device pool: {', '.join(f'{slot.serial} ({slot.state})' for slot in self.slots.values())}")
+        return list(self.slots.values())
+
+    def status(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [slot.snapshot() for slot in self.slots.values()]
+
+    def _adb_device(self, serial: str) -> adbutils.AdbDevice:
+        return adbutils.AdbClient(host=settings.ADB_SERVER_HOST, port=settings.ADB_SERVER_PORT).device(serial)
+
+    def health_check(self, slot: DeviceSlot) -> bool:
+        """True if the device is online, answers a shell command and (if it has one) its session responds."""
+        try:
+            device = self._adb_device(slot.serial)
+            if device.get_state() != "device" or device.shell("echo ok", timeout=10).strip() != "ok":
+                raise RuntimeError("device is not responding over adb")
+            if slot.controller is not None and slot.controller.driver is not None:
+                slot.controller.driver.get_window_size()
+            return True
+        except Exception as e:
+            slot.last_error = f"Health check failed: {e}"
+            print(f"Device {slot.serial}: {slot.last_error}")
+            return False
+
+    # SESSIONS
+
+    def session(self, slot: DeviceSlot) -> AppiumController:
+        """The device's controller, with an Appium session started if it has none."""
+        if slot.controller is None:
+            screenshot_dir = f"screenshots/{re.sub(r'[^A-Za-z0-9_.-]', '_', slot.serial)}"
+            slot.controller = self.controller_factory(
+                appium_server_url=self.appium_server_url,
+                device_name=slot.serial,
+                system_port=slot.system_port,
+                screenshot_dir=screenshot_dir
+            )
+        if slot.controller.driver is None:
+            slot.controller.setup_driver()
+        return slot.controller
+
+    def _drop_session(self, slot: DeviceSlot) -> None:
+        if slot.controller is not None:
+            slot.controller.quit_session()
+
+    def quarantine(self, slot: DeviceSlot, reason: str) -> None:
+        self._drop_session(slot)
+        with self._lock:
+            slot.state = "quarantined"
+            slot.last_error = reason
+            slot.quarantined_until = time.monotonic() + self.quarantine_seconds
+        print(f"Device {slot.serial} quarantined for {self.quarantine_seconds}s: {reason}")
+
+    def reclaim(self, slot: DeviceSlot) -> bool:
+        """
+        Put a quarantined device back into rotation once its quarantine has expired
+        and it passes a health check with a fresh session. Returns True if it did.
+        """
+        if slot.state != "quarantined" or time.monotonic() < slot.quarantined_until:
+            return False
+        if slot.serial not in discover_devices():
+            with self._lock:
+                slot.state = "gone"
+            print(f"Device {slot.serial} is no longer attached")
+            return False
+        try:
+            self.session(slot)
+            healthy = self.health_check(slot)
+        except Exception as e:
+            slot.last_error = f"Session failed to start: {e}"
+            healthy = False
+        if not healthy:
+            self.quarantine(slot, slot.last_error or "health check failed")
+            return False
+        with self._lock:
+            slot.state = "idle"
+            slot.failures = 0
+        print(f"Device {slot.serial} reclaimed")
+        return True
+
+    def release(self, slot: DeviceSlot, error: Optional[str] = None) -> None:
+        """
+        Return `slot` after a task. A clean run resets its failure count; a failed
+        one drops the session (restarted on the next task) and quarantines the
+        device after `max_failures` consecutive failures.
+        """
+        if error is None:
+            with self._lock:
+                slot.state = "idle"
+                slot.failures = 0
+            return
+        slot.failures += 1
+        slot.last_error = error
+        if slot.failures >= self.max_failures:
+            self.quarantine(slot, error)
+            return
+        self._drop_session(slot)
+        with self._lock:
+            slot.state = "idle"
+        print(f"Device {slot.serial} reclaimed after failure {slot.failures}/{self.max_failures}: {error}")
+
+    def close(self) -> None:
+        for slot in self.slots.values():
+            self._drop_session(slot)
+
+    # SCHEDULING
+
+    def stop(self) -> None:
+        """Let running tasks finish but start no new ones (run_tasks then returns)."""
+        self._stopping.set()
+
+    def run_tasks(self, tasks: list[str | dict], run: Callable = run_task,
+                  retries: int = settings.DEVICE_POOL_TASK_RETRIES,
+                  on_result: Optional[Callable[[int, dict], None]] = None, **run_kwargs) -> list[dict[str, Any]]:
+        """
+        Run `tasks` across all devices, one worker thread (with its own agents) per
+        device pulling from a shared queue. A task whose device crashed is requeued
+        up to `retries` times.
+
+        A task is a string or a dict {"task": ..., **keyword arguments for this task}.
+        `run` is called as run(task, driver=..., chatroom=..., on_finish=..., **kwargs)
+        and `on_result(index, result)` as soon as each task is done.
+
+        Returns one result per task, in input order: {"task", "device", "status",
+        "error", "attempts", "seconds", "usage"} plus what run_task reports on finish
+        ("iterations", "log", "summary", ...).
+        """
+        self._stopping.clear()
+        pending: queue.Queue = queue.Queue()
+        for index in range(len(tasks)):
+            pending.put((index, 1))
+        results: list[Optional[dict[str, Any]]] = [None] * len(tasks)
+
+        def work(slot: DeviceSlot) -> None:
+            while not self._stopping.is_set() and any(result is None for result in results):
+                if slot.state == "gone":
+                    return
+                if slot.state == "quarantined":
+                    if not self.reclaim(slot):
+                        time.sleep(min(1.0, max(0.1, slot.quarantined_until - time.monotonic())))
+                        continue
+                try:
+                    index, attempt = pending.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                with self._lock:
+                    slot.state = "busy"
+                item = tasks[index] if isinstance(tasks[index], dict) else {"task": tasks[index]}
+                task = item["task"]
+                kwargs = {**run_kwargs, **{key: value for key, value in item.items() if key != "task"}}
+                result = self._run_one(slot, task, attempt, run, kwargs)
+                slot.tasks_run += 1
+                self.release(slot, result["error"] if result["status"] == "Crashed" else None)
+                if result["status"] == "Crashed" and attempt <= retries:
+                    print(f"Requeueing '{task}' (attempt {attempt + 1}) after a crash on {slot.serial}")
+                    pending.put((index, attempt + 1))
+                    continue
+                results[index] = result
+                if on_result is not None:
+                    on_result(index, result)
+
+        workers = [
+            threading.Thread(target=work, args=(slot,), name=f"device-{slot.serial}", daemon=True)
+            for slot in self.slots.values() if slot.state != "gone"
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # Stopped, or every device left the pool before the queue drained.
+        for index, item in enumerate(tasks):
+            if results[index] is None:
+                stopped = self._stopping.is_set()
+                results[index] = {
+                    "task": item["task"] if isinstance(item, dict) else item,
+                    "device": None,
+                    "status": "Not Run" if stopped else "No Device",
+                    "error": "pool stopped" if stopped else "no healthy device left in the pool",
+                    "attempts": 0,
+                    "seconds": 0.0
+                }
+        return results
+
+    def _run_one(self, slot: DeviceSlot, task: str, attempt: int, run: Callable,
+                 run_kwargs: dict) -> dict[str, Any]:
+        start = time.perf_counter()
+        status, error = "Crashed", None
+        details: dict[str, Any] = {}
+        # Fresh agents per task, or chat sessions would carry one task's conversation into the next.
+        # What tasks can share lives outside the agents (app index, response cache, coordinate cache on disk).
+        agent_set = AgentSet(serial=slot.serial)
+        task_id = (f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_"
+                   f"{hashlib.md5(task.encode('utf-8')).hexdigest()[:8]}_{slot.system_port}")
+        chatroom = ChatRoom(task_id=task_id)
+        try:
+            controller = self.session(slot)
+            with agent_scope(agent_set):
+                _, _, status = run(task, driver=controller, chatroom=chatroom,
+                                   on_finish=details.update, **run_kwargs)
+            # run_task swallows most device errors, so confirm the device survived the task.
+            if not self.health_check(slot):
+                status, error = "Crashed", slot.last_error
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            # An error in the task itself leaves a working session behind; only a dead device is a crash.
+            session_alive = slot.controller is not None and slot.controller.driver is not None
+            status = "Failed" if session_alive and self.health_check(slot) else "Crashed"
+            print(f"Task '{task}' {status.lower()} on {slot.serial}: {error}")
+        finally:
+            # One log per task: don't leave its writer thread and file open for the rest of the batch.
+            chatroom.close()
+        # The pool's own status and timing (which include session start-up) take precedence.
+        details.pop("status", None)
+        details.pop("seconds", None)
+        return {
+            "task": task,
+            "device": slot.serial,
+            "status": status,
+            "error": error,
+            "attempts": attempt,
+            "seconds": round(time.perf_counter() - start, 2),
+            "usage": usage_delta({}, agent_set.usage()),
+            **details
+        }
@@ -0,0 +1,259 @@
+# app/gestures.py
+
+import time
+from typing import Any, Dict, Optional
+
+from selenium.webdriver.remote.command import Command
+
+# Android key codes for the special keys a batch can press.
+KEYCODES = {
+    "enter": 66,
+    "tab": 61,
+    "backspace": 67,
+    "delete": 112,
+    "escape": 111,
+}
+
+# Pause between focusing a field and typing into it (replaces a 0.5 s client-side sleep).
+FOCUS_PAUSE_MS = 300
+
+# Screen axis of each positional argument per gesture, for resolution-independent
+# storage (see app.macros); None for arguments that are not pixel positions.
+GESTURE_AXES: dict[str, tuple] = {
+    "tap": ("x", "y"),
+    "double_tap": ("x", "y"),
+    "long_press": ("x", "y", None),
+    "swipe": ("x", "y", "x", "y", None),
+    "type_text": (None,),
+    "clear_text": (),
+    "press_key": (None,),
+    "pause": (None,),
+}
+
+# Steps sent through the driver's text commands rather than W3C key actions:
+# UiAutomator2 maps W3C keys through the KeyCharacterMap, which drops characters
+# it has no key for (non-ASCII, emoji, many symbols), and not every IME honors Ctrl+A.
+KEYBOARD_GESTURES = frozenset({"type_text", "clear_text", "press_key"})
+
+
+def _pause(duration_ms: int = 0) -> dict:
+    return {"type": "pause", "duration": int(duration_ms)}
+
+
+def _move(x: int, y: int, duration_ms: int = 0) -> dict:
+    return {"type": "pointerMove", "duration": int(duration_ms), "x": int(x), "y": int(y), "origin": "viewport"}
+
+
+def _pointer_ticks(gesture: str, args: list) -> list[dict]:
+    if gesture == "tap":
+        x, y = args
+        return [_move(x, y), {"type": "pointerDown", "button": 0}, {"type": "pointerUp", "button": 0}]
+    if gesture == "double_tap":
+        x, y = args
+        return _pointer_ticks("tap", [x, y]) + [_pause(100)] + _pointer_ticks("tap", [x, y])[1:]
+    if gesture == "long_press":
+        x, y, duration_ms = (list(args) + [2000])[:3]
+        return [_move(x, y), {"type": "pointerDown", "button": 0}, _pause(duration_ms), {"type": "pointerUp", "button": 0}]
+    if gesture == "swipe":
+        start_x, start_y, end_x, end_y, duration_ms = (list(args) + [250])[:5]
+        return [_move(start_x, start_y), {"type": "pointerDown", "button": 0},
+                _move(end_x, end_y, duration_ms), {"type": "pointerUp", "button": 0}]
+    if gesture == "pause":
+        return [_pause(args[0])]
+    return []
+
+
+def build_actions(steps: list[list]) -> dict:
+    """Encode pointer steps (e.g. ["tap", 100, 200], ["pause", 300]) as one W3C actions payload."""
+    pointer: list[dict] = []
+    for gesture, *args in steps:
+        if gesture not in GESTURE_AXES:
+            raise ValueError(f"Unknown gesture: {gesture}")
+        if gesture in KEYBOARD_GESTURES:
+            raise ValueError(f"{gesture} is not a pointer gesture")
+        pointer.extend(_pointer_ticks(gesture, args))
+    return {"actions": [{
+        "type": "pointer", "id": "finger",
+        "parameters": {"pointerType": "touch"},
+        "actions": pointer
+    }]}
+
+
+def keyboard_step(driver, gesture: str, args: list) -> None:
+    """Run a typing step through UiAutomator2's text commands (what the controller used before batching)."""
+    if gesture == "type_text":
+        driver.execute_script("mobile: type", {"text": str(args[0])})
+    elif gesture == "clear_text":
+        driver.execute_script("mobile: key", {"key": "ctrl+a"})
+        driver.execute_script("mobile: key", {"key": "del"})
+    elif gesture == "press_key":
+        key = str(args[0])
+        if key.lower() in KEYCODES:
+            driver.execute_script("mobile: pressKey", {"keycode": KEYCODES[key.lower()]})
+        else:
+            driver.execute_script("mobile: type", {"text": key})
+
+
+def _segments(steps: list[list]) -> list[list[int]]:
+    """Step indexes grouped into runs of pointer steps (one request each) and single keyboard steps."""
+    segments: list[list[int]] = []
+    for index, (gesture, *_) in enumerate(steps):
+        if gesture in KEYBOARD_GESTURES:
+            segments.append([index])
+        elif segments and steps[segments[-1][-1]][0] not in KEYBOARD_GESTURES:
+            segments[-1].append(index)
+        else:
+            segments.append([index])
+    return segments
+
+
+class GestureBatch:
+    """
+    Collects gestures and key presses and sends them together: the taps,
+    swipes and pauses between two typing steps go in one request.
+
+        with driver.batch() as batch:
+            batch.tap(540, 300).pause(300).clear_text().type_text("coffee").press_key("enter")
+        print(batch.result)
+
+    `perform()` (called on leaving the `with` block) hands the steps to the
+    controller's `perform_gestures`.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.steps: list[list] = []
+        self.result: Optional[Dict[str, Any]] = None
+
+    def _add(self, gesture: str, *args) -> "GestureBatch":
+        self.steps.append([gesture, *args])
+        return self
+
+    def tap(self, x: int, y: int) -> "GestureBatch":
+        return self._add("tap", x, y)
+
+    def double_tap(self, x: int, y: int) -> "GestureBatch":
+        return self._add("double_tap", x, y)
+
+    def long_press(self, x: int, y: int, duration_ms: int = 2000) -> "GestureBatch":
+        return self._add("long_press", x, y, duration_ms)
+
+    def swipe(self, start_x: int, start_y: int, end_x: int, end_y: int, duration_ms: int = 250) -> "GestureBatch":
+        return self._add("swipe", start_x, start_y, end_x, end_y, duration_ms)
+
+    def type_text(self, text: str) -> "GestureBatch":
+        """Type into the focused field."""
+        return self._add("type_text", text)
+
+    def clear_text(self) -> "GestureBatch":
+        """Select all and delete in the focused field."""
+        return self._add("clear_text")
+
+    def press_key(self, key: str) -> "GestureBatch":
+        """Press "enter", "tab", "backspace", "delete", "escape" or type a single character."""
+        return self._add("press_key", key)
+
+    def pause(self, duration_ms: int) -> "GestureBatch":
+        return self._add("pause", duration_ms)
+
+    def perform(self) -> Dict[str, Any]:
+        self.result = self.controller.perform_gestures(self.steps)
+        return self.result
+
+    def __enter__(self) -> "GestureBatch":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is None and self.steps:
+            self.perform()
+
+
+def perform_gestures(driver, steps: list[list], validate=None, keyboard=None) -> Dict[str, Any]:
+    """
+    Run `steps` through the Selenium/Appium `driver`: each run of consecutive
+    pointer steps (taps, swipes, pauses) is sent as one W3C action sequence,
+    and typing steps go through `keyboard(gesture, args)` (keyboard_step on the
+    driver by default), in order.
+
+    If a combined pointer request fails (servers validate the whole sequence
+    before dispatching it, so typically nothing has run), its steps are retried
+    one request each so the result says which step failed; later steps are
+    skipped. `validate(x, y)` rejects out-of-screen coordinates before anything is sent.
+    """
+    start = time.perf_counter()
+    results = [{"index": i, "action": step[0], "args": list(step[1:]), "success": True} for i, step in enumerate(steps)]
+    if keyboard is None:
+        def keyboard(gesture: str, args: list) -> None:
+            keyboard_step(driver, gesture, args)
+
+    def finish(success: bool, mode: str, error: Optional[str] = None) -> Dict[str, Any]:
+        result = {
+            "success": success,
+            "action": "batch",
+            "mode": mode,
+            "steps": results,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+        if error:
+            result["error"] = error
+        return result
+
+    try:
+        for result, (gesture, *args) in zip(results, steps):
+            axes = GESTURE_AXES.get(gesture)
+            if axes is None:
+                raise ValueError(f"Unknown gesture: {gesture}")
+            if gesture == "press_key" and str(args[0]).lower() not in KEYCODES and len(str(args[0])) != 1:
+                raise ValueError(f"Unknown key '{args[0]}' in step {result['index']}")
+            coordinates = [value for axis, value in zip(axes, args) if axis is not None]
+            for x, y in zip(coordinates[::2], coordinates[1::2]):
+                if validate is not None and not validate(x, y):
+                    raise ValueError(f"Invalid coordinates ({x}, {y}) in step {result['index']} ({gesture})")
+        segments = _segments(steps)
+        payloads = {segment[0]: build_actions([steps[i] for i in segment])
+                    for segment in segments if steps[segment[0]][0] not in KEYBOARD_GESTURES}
+    except ValueError as e:
+        for result in results:
+            result["success"] = False
+        return finish(False, "rejected", str(e))
+
+    mode = "w3c"
+    failed = None
+    for segment in segments:
+        if failed is not None:
+            for index in segment:
+                results[index].update(success=False, error="skipped")
+            continue
+        gesture, *args = steps[segment[0]]
+        if gesture in KEYBOARD_GESTURES:
+            try:
+                keyboard(gesture, args)
+            except Exception as e:
+                results[segment[0]].update(success=False, error=str(e))
+                failed = results[segment[0]]
+            continue
+        try:
+            driver.execute(Command.W3C_ACTIONS, payloads[segment[0]])
+            continue
+        except Exception as e:
+            error = str(e)
+        if len(segment) == 1:
+            results[segment[0]].update(success=False, error=error)
+            failed = results[segment[0]]
+            continue
+        print(f"Batched gestures failed ({error}); retrying step by step")
+        mode = "sequential"
+        for index in segment:
+            if failed is not None:
+                results[index].update(success=False, error="skipped")
+                continue
+            try:
+                driver.execute(Command.W3C_ACTIONS, build_actions([steps[index]]))
+            except Exception as e:
+                results[index].update(success=False, error=str(e))
+                failed = results[index]
+
+    if failed is not None:
+        return finish(False, mode, f"Step {failed['index']} ({failed['action']}) failed: {failed['error']}")
+    print(f"Performed {len(steps)} gestures ({len(payloads)} W3C action requests)")
+    return finish(True, mode)
@@ -0,0 +1,316 @@
+# app/macros.py
+
+import hashlib
+import inspect
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+from app.appium_controller import AppiumController
+from app.config import settings
+from app.gestures import GESTURE_AXES, GestureBatch
+from utils.screen_fingerprint import fingerprint_distance
+from utils.screenshot import Screenshot
+
+# Controller actions that are recorded, with the screen axis ("x"/"y") of each
+# positional argument that is a pixel position or distance (None otherwise).
+# "gestures" marks a list of gesture steps, normalized per GESTURE_AXES.
+RECORDED_ACTIONS: dict[str, tuple] = {
+    "click_coordinates": ("x", "y"),
+    "double_click_coordinates": ("x", "y"),
+    "long_press_coordinates": ("x", "y", None),
+    "swipe_coordinates": ("x", "y", "x", "y"),
+    "scroll_down": ("y",),
+    "scroll_up": ("y",),
+    "scroll_left": ("x",),
+    "scroll_right": ("x",),
+    "type_text_at_coordinates": ("x", "y", None),
+    "clear_text_field": ("x", "y"),
+    "tap_and_type": ("x", "y", None, None, None),
+    "perform_gestures": ("gestures",),
+    "send_enter_key": (),
+    "press_back_button": (),
+    "press_home_button": (),
+    "open_app_switcher": (),
+    "open_app": (None,),
+    "pull_down_notifications": (),
+    "rotate_screen_to_landscape": (),
+    "rotate_screen_to_portrait": (),
+}
+
+_PARAM = re.compile(r"\"([^\"]+)\"|'([^']+)'|“([^”]+)”|\b(\d+(?:[.:/]\d+)*)\b")
+
+
+def task_template(task: str) -> tuple[str, list[str]]:
+    """
+    Split a task into a template and its parameters: quoted strings and numbers.
+    'Text "hi" to Bob at 5' -> ('text {0} to bob at {1}', ['hi', '5']).
+    """
+    params: list[str] = []
+
+    def replace(match: re.Match) -> str:
+        params.append(next(group for group in match.groups() if group is not None))
+        return f"{{{len(params) - 1}}}"
+
+    template = _PARAM.sub(replace, task.strip())
+    return " ".join(template.lower().split()), params
+
+
+def _bind_positional(method: str, args: tuple, kwargs: dict) -> list:
+    """Arguments of a controller call as a positional list, defaults filled in."""
+    bound = inspect.signature(getattr(AppiumController, method)).bind(None, *args, **kwargs)
+    bound.apply_defaults()
+    return list(bound.args[1:])
+
+
+class MacroStep(BaseModel):
+    method: str
+    # Pixel arguments are stored as fractions of the screen width/height.
+    args: list[Any] = []
+    # Fingerprint of the screen this step was decided on. Only set on the first
+    # action after a new screen; later actions of the same snippet had no screenshot.
+    checkpoint: Optional[str] = None
+
+
+class Macro(BaseModel):
+    template: str
+    params: list[str] = []
+    app_package: Optional[str] = None
+    screen_size: tuple[int, int] = (0, 0)
+    steps: list[MacroStep] = []
+    final_fingerprint: Optional[str] = None
+    created: str = ""
+
+
+def _normalize(step_args: list, axes: tuple, width: int, height: int, params: list[str]) -> list:
+    normalized = []
+    for i, value in enumerate(step_args):
+        axis = axes[i] if i < len(axes) else None
+        if axis == "gestures":
+            value = [[gesture, *_normalize(args, GESTURE_AXES.get(gesture, ()), width, height, params)]
+                     for gesture, *args in value]
+        elif axis is not None and isinstance(value, (int, float)):
+            value = round(value / (width if axis == "x" else height), 5)
+        elif isinstance(value, str):
+            for index, param in enumerate(params):
+                if value == param or (len(param) >= 3 and param in value):
+                    value = value.replace(param, f"{{{index}}}")
+        normalized.append(value)
+    return normalized
+
+
+def _denormalize(step_args: list, axes: tuple, width: int, height: int, params: list[str]) -> list:
+    resolved = []
+    for i, value in enumerate(step_args):
+        axis = axes[i] if i < len(axes) else None
+        if axis == "gestures":
+            value = [[gesture, *_denormalize(args, GESTURE_AXES.get(gesture, ()), width, height, params)]
+                     for gesture, *args in value]
+        elif axis is not None and isinstance(value, (int, float)):
+            value = round(value * (width if axis == "x" else height))
+        elif isinstance(value, str):
+            for index, param in enumerate(params):
+                value = value.replace(f"{{{index}}}", param)
+        resolved.append(value)
+    return resolved
+
+
+class MacroRecorder:
+    """
+    Stands in for the AppiumController while the agents run a task.
+
+    Every attribute is forwarded to the controller; successful RECORDED_ACTIONS
+    calls are also appended to `steps`, with resolution-independent coordinates,
+    the task's parameters replaced by placeholders, and the fingerprint of the
+    screen the agents were looking at (see `observe()`).
+    """
+
+    def __init__(self, controller, task: str):
+        self.controller = controller
+        self.template, self.params = task_template(task)
+        self.steps: list[MacroStep] = []
+        self.app_package: Optional[str] = None
+        self._screen: Optional[Screenshot] = None
+
+    def observe(self, screenshot: Screenshot) -> None:
+        """Mark `screenshot` as the screen the next action is decided on."""
+        self._screen = screenshot
+
+    def seed(self, steps: list[MacroStep], app_package: Optional[str] = None) -> None:
+        """Start from steps already replayed from a macro."""
+        self.steps = list(steps)
+        self.app_package = self.app_package or app_package
+
+    def batch(self) -> GestureBatch:
+        """A GestureBatch that performs (and so records) through this recorder."""
+        return GestureBatch(self)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.controller, name)
+        if name not in RECORDED_ACTIONS or not callable(attr):
+            return attr
+
+        def recorded(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if isinstance(result, dict) and result.get("success"):
+                self._record(name, args, kwargs)
+            return result
+        return recorded
+
+    def _record(self, method: str, args: tuple, kwargs: dict) -> None:
+        try:
+            step_args = _bind_positional(method, args, kwargs)
+        except TypeError:
+            return
+        checkpoint = None
+        if self._screen is not None:
+            try:
+                checkpoint = self._screen.fingerprint
+            except Exception as e:
+                print(f"Macro recorder: no fingerprint for the current screen: {e}")
+            self._screen = None
+        if method == "open_app" and self.app_package is None:
+            self.app_package = step_args[0]
+        width, height = self.controller.screen_width or 1, self.controller.screen_height or 1
+        self.steps.append(MacroStep(
+            method=method,
+            args=_normalize(step_args, RECORDED_ACTIONS[method], width, height, self.params),
+            checkpoint=checkpoint
+        ))
+
+    def to_macro(self, final_screen: Optional[Screenshot] = None) -> Macro:
+        return Macro(
+            template=self.template,
+            params=self.params,
+            app_package=self.app_package,
+            screen_size=(self.controller.screen_width, self.controller.screen_height),
+            steps=self.steps,
+            final_fingerprint=final_screen.fingerprint if final_screen is not None else None,
+            created=datetime.now().isoformat()
+        )
+
+
+class MacroStore:
+    """Macros saved as one JSON file per task template in `directory`."""
+
+    def __init__(self, directory: str = settings.MACRO_DIR):
+        self.directory = directory
+
+    def path_for(self, template: str) -> str:
+        key = hashlib.sha1(template.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, task: str) -> Optional[tuple[Macro, list[str]]]:
+        """The macro recorded for this task's template and the task's own parameters, or None."""
+        template, params = task_template(task)
+        path = self.path_for(template)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                macro = Macro.model_validate_json(f.read())
+        except Exception as e:
+            print(f"Ignoring unreadable macro {path}: {e}")
+            return None
+        if macro.template != template or len(macro.params) != len(params):
+            return None
+        return macro, params
+
+    def save(self, macro: Macro) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(macro.template)
+        # A unique temp file per save, so concurrent runs of one template never share it.
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(macro.model_dump_json(indent=2))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return path
+
+    def delete(self, task: str) -> None:
+        path = self.path_for(task_template(task)[0])
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class MacroPlayer:
+    """
+    Replays a Macro directly against an AppiumController, without any agent.
+
+    Before each checkpointed step the player polls the screen until it matches
+    the recorded fingerprint; if it never does (or an action fails) the replay
+    stops there, so the agent loop can take over from the first diverging step.
+    """
+
+    def __init__(self, controller, threshold: int = settings.MACRO_REPLAY_THRESHOLD,
+                 step_timeout: float = settings.MACRO_STEP_TIMEOUT_SECONDS,
+                 poll_interval: float = settings.SETTLE_POLL_SECONDS):
+        self.controller = controller
+        self.threshold = threshold
+        self.step_timeout = step_timeout
+        self.poll_interval = poll_interval
+
+    def wait_for_screen(self, expected: str) -> tuple[bool, Optional[int]]:
+        """Poll until the screen is within `threshold` of `expected`. Returns (matched, last distance)."""
+        deadline = time.perf_counter() + self.step_timeout
+        distance = None
+        while True:
+            shot = self.controller.take_screenshot(persist=False)
+            if shot["success"]:
+                frame = shot["screenshot"]
+                distance = fingerprint_distance(frame.fingerprint, expected)
+                frame.release()
+                if distance <= self.threshold:
+                    return True, distance
+            if time.perf_counter() >= deadline:
+                return False, distance
+            time.sleep(self.poll_interval)
+
+    def replay(self, macro: Macro, params: list[str]) -> dict[str, Any]:
+        """
+        Execute `macro` with this task's `params`.
+
+        Returns {"completed", "executed", "diverged_at", "reason", "steps", "seconds"};
+        `steps` are the recorded steps that were executed, `completed` is True only if
+        every step ran and the final screen matches the recorded one.
+        """
+        start = time.perf_counter()
+        width, height = self.controller.screen_width or 1, self.controller.screen_height or 1
+
+        def outcome(executed: int, completed: bool, reason: str) -> dict[str, Any]:
+            return {
+                "completed": completed,
+                "executed": executed,
+                "diverged_at": None if completed else executed,
+                "reason": reason,
+                "steps": macro.steps[:executed],
+                "seconds": round(time.perf_counter() - start, 2)
+            }
+
+        for index, step in enumerate(macro.steps):
+            if step.checkpoint is not None:
+                matched, distance = self.wait_for_screen(step.checkpoint)
+                if not matched:
+                    return outcome(index, False, f"screen before step {index + 1} differs (distance {distance})")
+            args = _denormalize(step.args, RECORDED_ACTIONS.get(step.method, ()), width, height, params)
+            try:
+                result = getattr(self.controller, step.method)(*args)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            if not result.get("success"):
+                return outcome(index, False, f"step {index + 1} ({step.method}) failed: {result.get('error')}")
+            print(f"Macro step {index + 1}/{len(macro.steps)}: {step.method}{tuple(args)}")
+
+        if macro.final_fingerprint is not None:
+            matched, distance = self.wait_for_screen(macro.final_fingerprint)
+            if not matched:
+                return outcome(len(macro.steps), False, f"final screen differs (distance {distance})")
+        return outcome(len(macro.steps), True, "all steps replayed")
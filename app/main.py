@@ -8,9 +8,38 @@ import streamlit as st
 import streamlit.components.v1 as components
 
 from app.controller import run_task
+from utils.tracing import metrics
 # from utils.speech import record_and_transcribe
 
 
+def display_latest_agent_message(next_agents: dict):
+    """
+    Efficiently manages a single UI field that updates with the latest message,
+    and provides full message history in a static expander.
+    """
+
+    if 'thought_history' not in st.session_state:
+        st.session_state.thought_history = []
+
+    if 'message_placeholder' not in st.session_state:
+        st.session_state.message_placeholder = st.empty()
+
+    for agent, message in next_agents.items():
+        entry = f"[{agent}] {message}"
+        if entry not in st.session_state.thought_history:
+            st.session_state.thought_history.append(entry)
+
+    latest = st.session_state.thought_history[-1] if st.session_state.thought_history else "Waiting for agent messages..."
+
+    with st.session_state.message_placeholder.container():
+        st.markdown("### 🧠 Chain of Thought (Latest)")
+        st.info(latest)
+
+        with st.expander("🧾 View Full History", expanded=False):
+            for msg in reversed(st.session_state.thought_history):
+                st.markdown(f"- {msg}")
+
+
 st.set_page_config(page_title="🧠 AI Multi-Agent Automator", layout="wide")
 st.markdown("<h1 style='text-align:center;'> Multi-Agent Android Automation</h1>", unsafe_allow_html=True)
 st.markdown("---")
@@ -20,7 +49,7 @@ if "chatroom" in st.session_state:
     with st.sidebar:
         st.markdown("## 💬 Chat Memory")
         for msg in st.session_state.chatroom.get_history():
-            st.markdown(f"**[{msg['sender']}]** ({msg['type']}): {msg['content'][:200]}")
+            st.markdown(f"**[{msg['sender']}]** ({msg['type']}): {str(msg['content'])[:200]}")
 
 
 @st.dialog("User Input Required")
@@ -32,7 +61,8 @@ def get_user_input(up):
             driver, chatroom, task_status = run_task(
                 updated_task.strip(),
                 driver=st.session_state.get("driver"),
-                chatroom=st.session_state.get("chatroom")
+                chatroom=st.session_state.get("chatroom"),
+                on_selection=display_latest_agent_message
             )
             st.session_state["driver"] = driver
             st.session_state["chatroom"] = chatroom
@@ -56,7 +86,7 @@ if st.button("🚀 Start Automation"):
         st.warning("Please enter or speak a task first.")
     else:
         with st.spinner("Running multi-agent task..."):
-            driver, chatroom, task_status = run_task(task)
+            driver, chatroom, task_status = run_task(task, on_selection=display_latest_agent_message)
             st.session_state["chatroom"] = chatroom
             st.session_state["driver"] = driver
             st.session_state["task_status"] = task_status
@@ -80,4 +110,18 @@ st.markdown("### 📱 Agent Status & Feedback")
 if "chatroom" in st.session_state:
     summary = st.session_state.chatroom.get_latest("summary")
     if summary:
-        st.success(f"Task Summary:\n\n{summary['content']}")
\ No newline at end of file
+        st.success(f"Task Summary:\n\n{summary['content']}")
+
+
+st.markdown("---")
+st.markdown("### ⏱️ Performance")
+
+# Spans of this process (all tasks so far): agent calls, device commands, generated code, iterations.
+rows = metrics.summary()
+if rows:
+    kinds = sorted({row["kind"] for row in rows})
+    for kind, tab in zip(kinds, st.tabs(kinds)):
+        with tab:
+            st.dataframe([row for row in rows if row["kind"] == kind], use_container_width=True, hide_index=True)
+else:
+    st.caption("No traced calls yet.")
@@ -1,87 +1,234 @@
 # app/orchestrator.py
 
-from typing import Any
-from agents.application_selector import ApplicationSelectorAgent
+import asyncio
+import importlib
+import inspect
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable
+from agents.base import BaseAgent
+from agents.schemas import AgentCall, AgentSelection, ResponseParseError, parse_model
 from app.appium_controller import AppiumController
-from app.chatroom import ChatRoom
+from app.chatroom import ChatRoom, latest_content
+from app.code_runtime import execution_globals
 from app.config import settings
-from agents.coordinate_extrator import CoordinateExtractorAgent
-from agents.chain_of_thought import ChainOfThoughtAgent
-from agents.code_generator import CodeGeneratorAgent
-from agents.code_verifier import CodeVerifierAgent
-from agents.user_prompt_agent import UserPromptAgent
-from agents.summarizer import SummarizerAgent
-from agents.orchestrator_agent import OrchestratorAgent
-from agents.page_summarizer import PageSummarizerAgent
-
-import re
-import json
-import streamlit as st
-
-from utils.coordinate_utils import annotate_coordinates_from_llm
-from utils.sanitizer import sanitize_app_selection, sanitize_code
+
+from utils.coordinate_utils import annotate_coordinates
+from utils.sanitizer import sanitize_code
+from utils.async_utils import run_coroutine
 from utils.history_utils import get_recent_updates
+from utils.tracing import span
+
+
+# Agent name -> (module, settings attribute holding its API key), in dispatch order.
+# Modules are imported and agents constructed on first use (see AgentSet.get).
+AGENT_REGISTRY: dict[str, tuple[str, str]] = {
+    "CoordinateExtractorAgent": ("agents.coordinate_extrator", "GOOGLE_API_KEY_COORDINATE"),
+    "ChainOfThoughtAgent": ("agents.chain_of_thought", "GOOGLE_API_KEY_COT"),
+    "CodeGeneratorAgent": ("agents.code_generator", "GOOGLE_API_KEY_CODEGEN"),
+    "CodeVerifierAgent": ("agents.code_verifier", "GOOGLE_API_KEY_VERIFIER"),
+    "UserPromptAgent": ("agents.user_prompt_agent", "GOOGLE_API_KEY_PROMPTER"),
+    "PageSummarizerAgent": ("agents.page_summarizer", "GOOGLE_API_KEY_PAGE_SUMMARIZER"),
+    "SummarizerAgent": ("agents.summarizer", "GOOGLE_API_KEY_SUMMARIZER"),
+    "ApplicationSelectorAgent": ("agents.application_selector", "GOOGLE_API_KEY_APP_SELECTION"),
+}
+ORCHESTRATOR_SPEC = ("OrchestratorAgent", "agents.orchestrator_agent", "GOOGLE_API_KEY_ORCHESTRATOR")
+
+
+class AgentSet:
+    """
+    One instance of every agent plus the OrchestratorAgent, each built on first use.
+    Agents keep per-task state (chat sessions, the last extracted coordinates),
+    so every task, and every task running in parallel, needs its own set (see agent_scope).
+    `serial` is the device the ApplicationSelectorAgent lists installed apps from.
+    """
+
+    def __init__(self, serial: str | None = None):
+        self.serial = serial
+        self._built: dict[str, BaseAgent] = {}
+        self._lock = threading.Lock()
+
+    def _build(self, name: str, module: str, api_key_setting: str) -> BaseAgent:
+        with self._lock:
+            if name not in self._built:
+                cls = getattr(importlib.import_module(module), name)
+                kwargs = {"api_key": getattr(settings, api_key_setting)}
+                if "serial" in inspect.signature(cls).parameters:
+                    kwargs["serial"] = self.serial
+                self._built[name] = cls(**kwargs)
+            return self._built[name]
+
+    def built(self, name: str) -> BaseAgent | None:
+        """The named agent if it has been built already (never builds one)."""
+        return self._built.get(name)
+
+    def get(self, name: str) -> BaseAgent | None:
+        if name not in AGENT_REGISTRY:
+            return None
+        return self._built.get(name) or self._build(name, *AGENT_REGISTRY[name])
+
+    def select(self, names) -> list[BaseAgent]:
+        """The named agents in dispatch (registry) order."""
+        return [self.get(name) for name in AGENT_REGISTRY if name in names]
+
+    @property
+    def orchestrator(self) -> BaseAgent:
+        name = ORCHESTRATOR_SPEC[0]
+        return self._built.get(name) or self._build(*ORCHESTRATOR_SPEC)
+
+    def usage(self) -> dict[str, dict]:
+        """Model calls, latency and tokens so far per agent of this set (built agents only)."""
+        usage = {}
+        for agent in list(self._built.values()):
+            usage.update(agent.usage.agents())
+        return usage
+
+
+default_agents = AgentSet()
+
+_active_agents: ContextVar[AgentSet] = ContextVar("active_agents", default=default_agents)
 
 
-import streamlit as st
+@contextmanager
+def agent_scope(agent_set: AgentSet):
+    """Use `agent_set` instead of the default agents for steps run in this thread/context."""
+    token = _active_agents.set(agent_set)
+    try:
+        yield agent_set
+    finally:
+        _active_agents.reset(token)
+
+
+def current_agents() -> AgentSet:
+    return _active_agents.get()
+
 
-def display_latest_agent_message(next_agents: dict):
+VALID_AGENTS = set(AGENT_REGISTRY)
+
+
+class TransitionRule:
     """
-    Efficiently manages a single UI field that updates with the latest message,
-    and provides full message history in a static expander.
+    A deterministic step of the orchestrator's decision ladder.
+
+    `resolve` looks at the messages added since the last agent_selection (and
+    the full history for context) and returns the next agents with their
+    expectations, or None when the rule does not apply.
     """
 
-    if 'thought_history' not in st.session_state:
-        st.session_state.thought_history = []
+    def __init__(self, name: str, confidence: float,
+                 resolve: Callable[[list, list], dict[str, str] | None]):
+        self.name = name
+        self.confidence = confidence
+        self.resolve = resolve
 
-    if 'message_placeholder' not in st.session_state:
-        st.session_state.message_placeholder = st.empty()
+    def __repr__(self) -> str:
+        return f"<TransitionRule {self.name} ({self.confidence})>"
 
-    for agent, message in next_agents.items():
-        entry = f"[{agent}] {message}"
-        if entry not in st.session_state.thought_history:
-            st.session_state.thought_history.append(entry)
 
-    latest = st.session_state.thought_history[-1] if st.session_state.thought_history else "Waiting for agent messages..."
+TRANSITION_RULES: list[TransitionRule] = []
+orchestrator_stats = {"llm_calls": 0, "rule_hits": 0, "saved_calls": 0, "by_rule": {}}
 
-    with st.session_state.message_placeholder.container():
-        st.markdown("### 🧠 Chain of Thought (Latest)")
-        st.info(latest)
 
-        with st.expander("🧾 View Full History", expanded=False):
-            for msg in reversed(st.session_state.thought_history):
-                st.markdown(f"- {msg}")
+def transition_rule(name: str, confidence: float):
+    """Register a function as a TransitionRule."""
+    def register(resolve):
+        TRANSITION_RULES.append(TransitionRule(name, confidence, resolve))
+        return resolve
+    return register
 
 
+@transition_rule("app_selected_then_summarize", confidence=0.95)
+def _after_app_selected(recent: list, history: list) -> dict[str, str] | None:
+    opened = any(
+        msg["type"] == "feedback" and str(msg["content"]).startswith("Application selected:")
+        for msg in recent
+    )
+    if opened and not any(msg["type"] == "error" for msg in recent):
+        return {"PageSummarizerAgent": "Return a plain-text summary of the current screen, focusing on its main purpose and available actions."}
+    return None
 
-agents = [
-    CoordinateExtractorAgent(api_key=settings.GOOGLE_API_KEY_COORDINATE),
-    ChainOfThoughtAgent(api_key=settings.GOOGLE_API_KEY_COT),
-    CodeGeneratorAgent(api_key=settings.GOOGLE_API_KEY_CODEGEN),
-    CodeVerifierAgent(api_key=settings.GOOGLE_API_KEY_VERIFIER),
-    UserPromptAgent(api_key=settings.GOOGLE_API_KEY_PROMPTER),
-    PageSummarizerAgent(api_key=settings.GOOGLE_API_KEY_PAGE_SUMMARIZER),
-    SummarizerAgent(api_key=settings.GOOGLE_API_KEY_SUMMARIZER),
-    ApplicationSelectorAgent(api_key=settings.GOOGLE_API_KEY_APP_SELECTION),
-]
 
-orchestrator_agent = OrchestratorAgent(api_key=settings.GOOGLE_API_KEY_ORCHESTRATOR)
+@transition_rule("execution_error_then_verify", confidence=0.9)
+def _after_execution_error(recent: list, history: list) -> dict[str, str] | None:
+    if not any(msg["type"] == "code_snippet" for msg in recent):
+        return None
+    errors = [msg for msg in recent if msg["type"] == "error" and msg["sender"] == "Controller"]
+    if not errors:
+        return None
+    # After two failed fixes in a row, let the LLM decide (re-plan or ask the user).
+    selections = [msg for msg in history if msg["type"] == "agent_selection"][-2:]
+    if len(selections) == 2 and all("CodeVerifierAgent" in str(msg["content"]) for msg in selections):
+        return None
+    return {"CodeVerifierAgent": f"The previous code failed with {errors[-1]['content']}. Fix the code to correctly perform the intended action."}
+
+
+@transition_rule("coordinates_with_plan_then_generate", confidence=0.85)
+def _after_coordinates(recent: list, history: list) -> dict[str, str] | None:
+    coordinates = [msg for msg in recent if msg["type"] == "screen_coordinates"]
+    if not coordinates or "None" in str(coordinates[-1]["content"]):
+        return None
+    if any(msg["type"] == "error" for msg in recent):
+        return None
+    plan = latest_content(history, "action_plan")
+    if not plan:
+        return None
+    action = plan.strip().splitlines()[-1].strip()
+    if not action or action == "TASK_COMPLETED":
+        return None
+    return {"CodeGeneratorAgent": f"Generate code that performs the planned action {action} at the extracted coordinates."}
+
+
+def resolve_transition(history: list) -> tuple[TransitionRule, dict[str, str]] | None:
+    """
+    Return the first rule that fires with at least ORCHESTRATOR_RULE_MIN_CONFIDENCE,
+    with its next agents, or None to defer to the OrchestratorAgent.
+    Never fires on the first step of a task or right after user input.
+    """
+    if not settings.ORCHESTRATOR_RULES_ENABLED:
+        return None
+    recent = get_recent_updates(history)
+    if len(recent) == len(history) or any(msg["type"] in ("task", "user_prompt") for msg in recent):
+        return None
+    for rule in TRANSITION_RULES:
+        if rule.confidence < settings.ORCHESTRATOR_RULE_MIN_CONFIDENCE:
+            continue
+        next_agents = rule.resolve(recent, history)
+        if next_agents:
+            return rule, next_agents
+    return None
 
 
-VALID_AGENTS = {
-    "CoordinateExtractorAgent",
-    "ChainOfThoughtAgent",
-    "CodeGeneratorAgent",
-    "CodeVerifierAgent",
-    "UserPromptAgent",
-    "PageSummarizerAgent",
-    "SummarizerAgent",
-    "ApplicationSelectorAgent"
-}
+def select_next_agents(history: list) -> dict:
+    """
+    Decide the next agents: locally when a transition rule fires, otherwise with
+    the OrchestratorAgent. Returns an agent_selection response either way.
+    """
+    match = resolve_transition(history)
+    if match is None:
+        orchestrator_stats["llm_calls"] += 1
+        print(f"Orchestrator path: LLM ({orchestrator_stats})")
+        return current_agents().orchestrator.generate_response(history)
+
+    rule, next_agents = match
+    orchestrator_stats["rule_hits"] += 1
+    orchestrator_stats["saved_calls"] += 1
+    orchestrator_stats["by_rule"][rule.name] = orchestrator_stats["by_rule"].get(rule.name, 0) + 1
+    print(f"Orchestrator path: rule {rule.name} ({rule.confidence}), {orchestrator_stats['saved_calls']} LLM calls saved")
+    selection = AgentSelection(next_agents=[
+        AgentCall(name=name, expectation=expectation) for name, expectation in next_agents.items()
+    ])
+    return {
+        "type": "agent_selection",
+        "sender": "TransitionRules",
+        "content": selection.model_dump_json(),
+        "data": selection
+    }
 
 def extract_agent_list(response_text: str) -> dict:
     """
-    Extracts a list of agent dicts from structured model output:
+    Extracts the scheduled agents from the orchestrator's AgentSelection JSON:
     {
       "next_agents": [
         {"name": "Agent1", "expectation": "..."},
@@ -89,53 +236,194 @@ def extract_agent_list(response_text: str) -> dict:
       ]
     }
 
-    Supports:
-    - JSON inside triple backticks
-    - Fallback: extract names only (without expectations) from plain text
-
     Returns:
-        List of dicts like: [{"name": "AgentX", "expectation": "..."}]
+        Dict of agent name -> expectation, for valid agent names only
     """
+    try:
+        selection = parse_model(AgentSelection, response_text)
+    except ResponseParseError as e:
+        print(e)
+        return {}
+
+    return {
+        call.name: call.expectation.strip()
+        for call in selection.next_agents
+        if call.name in VALID_AGENTS
+    }
+
+
+def get_agent(name: str):
+    """Return the agent instance with the given name from the current AgentSet, or None."""
+    return current_agents().get(name)
+
 
+def get_latest_by_type(history: list[dict[str, Any]], msg_type: str) -> Any:
+    return latest_content(history, msg_type)
 
-    code_blocks = re.findall(r"```(?:json)?\s*([\s\S]+?)```", response_text, re.IGNORECASE)
-    print('================================================================')
-    for block in code_blocks:
+def _reads(agent: BaseAgent, produced: tuple[str, ...]) -> bool:
+    return "*" in agent.consumes or bool(set(produced).intersection(agent.consumes))
+
+
+def plan_agent_waves(selected: list[BaseAgent]) -> list[list[BaseAgent]]:
+    """
+    Group the selected agents (in dispatch order) into waves that can run concurrently.
+
+    An agent runs in a later wave than any earlier-dispatched agent whose output it
+    consumes, and never in an earlier wave than an earlier-dispatched agent that
+    consumes its output. Every agent therefore sees exactly the history it would
+    have seen when agents ran one after another, while independent agents
+    (e.g. PageSummarizerAgent and CoordinateExtractorAgent) overlap.
+    """
+    levels: list[int] = []
+    for i, agent in enumerate(selected):
+        level = 0
+        for j in range(i):
+            earlier = selected[j]
+            if _reads(agent, earlier.produces):
+                level = max(level, levels[j] + 1)
+            elif _reads(earlier, agent.produces):
+                level = max(level, levels[j])
+        levels.append(level)
+
+    waves = [[] for _ in range(max(levels, default=-1) + 1)]
+    for agent, level in zip(selected, levels):
+        waves[level].append(agent)
+    return waves
+
+
+async def _run_agent(agent: BaseAgent, history: list[dict[str, Any]], expectation: str,
+                     prefetched: Future | None = None) -> dict:
+    if prefetched is not None and not prefetched.cancelled():
         try:
-            parsed = json.loads(block.strip())
-            agents = parsed.get("next_agents", [])
-            if isinstance(agents, list):
-                result = {}
-                for item in agents:
-                    if isinstance(item, dict) and item.get("name") in VALID_AGENTS:
-                        result[item["name"]] = item.get("expectation", "").strip()
-        
-                if result:
-                    return result
-        except json.JSONDecodeError as e:
-            print(e)
-            continue
+            return await asyncio.wait_for(asyncio.wrap_future(prefetched), timeout=agent.timeout)
+        except Exception as e:
+            print(f"Discarding prefetched {agent.name} response: {e!r}")
+    try:
+        return await asyncio.wait_for(agent.agenerate_response(history, expectation), timeout=agent.timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{agent.name} timed out after {agent.timeout}s") from None
 
 
-    fallback = {}
-    for line in response_text.strip().splitlines():
-        name = line.strip()
-        if name in VALID_AGENTS:
-            fallback[name]= ""
+async def _run_wave(wave: list[BaseAgent], history: list[dict[str, Any]], next_agents: dict,
+                    prefetched: dict[str, Future]) -> list:
+    return await asyncio.gather(
+        *(_run_agent(agent, history, next_agents[agent.name], prefetched.get(agent.name)) for agent in wave),
+        return_exceptions=True
+    )
 
-    return fallback
 
+def dispatch_agents(wave: list[BaseAgent], history: list[dict[str, Any]], next_agents: dict,
+                    prefetched: dict[str, Future] | None = None) -> list[tuple]:
+    """
+    Run one wave of agents and return (agent, response or exception) pairs in wave order.
+    With CONCURRENT_AGENTS the calls overlap on the shared event loop and each one is
+    cancelled after its timeout; otherwise they run one after another.
+
+    Agents with an entry in `prefetched` (a speculative response started before the
+    orchestrator chose them) use it instead of a new call, falling back to a normal
+    call if it failed or was cancelled. Used entries are removed from `prefetched`.
+    """
+    prefetched = prefetched if prefetched is not None else {}
+    claimed = {agent.name: prefetched.pop(agent.name) for agent in wave if agent.name in prefetched}
+
+    if settings.CONCURRENT_AGENTS:
+        results = run_coroutine(_run_wave(wave, history, next_agents, claimed))
+        return list(zip(wave, results))
+
+    outcomes = []
+    for agent in wave:
+        try:
+            if agent.name in claimed:
+                try:
+                    outcomes.append((agent, claimed[agent.name].result(timeout=agent.timeout)))
+                    continue
+                except Exception as e:
+                    print(f"Discarding prefetched {agent.name} response: {e!r}")
+            outcomes.append((agent, agent.generate_response(history, next_agents[agent.name])))
+        except Exception as e:
+            outcomes.append((agent, e))
+    return outcomes
 
-def get_latest_by_type(history: list[dict[str, Any]], msg_type: str) -> str | None:
-    for msg in reversed(history):
-        if msg["type"] == msg_type:
-            return msg["content"]
-    return None
 
-def run_next_step(chatroom: ChatRoom, driver: AppiumController, time) -> str:
+def handle_agent_response(chatroom: ChatRoom, driver: AppiumController, time, agent: BaseAgent,
+                          agent_response: dict) -> str | None:
     """
-    Ask the OrchestratorAgent which agents should respond next,
-    then call them in order.
+    Record an agent's response and carry out its side effects (open app, run code).
+    Returns the new step state, or None to keep the current one.
+    """
+    content = agent_response["content"]
+    sender = agent_response.get("sender", agent.name)
+    msg_type = agent_response["type"]
+
+    chatroom.add_message(
+        sender=sender,
+        type=msg_type,
+        content=content
+    )
+
+    if agent_response["type"] == "proposed_screen_coordinates":
+        resolved = agent_response["data"]
+        coordinates = annotate_coordinates(
+            resolved.coordinates,
+            get_latest_by_type(chatroom.get_history(), "screen_image"),
+            output_dir="screenshot_coordinates" if settings.PERSIST_SCREENSHOTS else None
+        ) if resolved.coordinates else None
+        print(f"Screen coordinates extracted: {coordinates}")
+        chatroom.add_message(sender="Controller", type="screen_coordinates", content=f"Screen coordinates extracted: {coordinates}")
+        return None
+
+    elif agent_response["type"] == "selected_application":
+        app_package = agent_response["data"].package
+        if not app_package:
+            chatroom.add_message("Controller", "feedback", "No suitable application found for the task.")
+            return "continue"
+        print(f"Application selected: {app_package}")
+        chatroom.add_message("Controller", "feedback", f"Application selected: {app_package}")
+        driver.open_app(app_package)
+        return "continue"
+
+    elif agent_response["type"] == "code_snippet":
+        last_code = agent_response["content"]
+        cleaned_code = sanitize_code(last_code)
+        print(cleaned_code)
+        failed = False
+        try:
+            with span("generated_code", "exec", chars=len(cleaned_code)):
+                exec(cleaned_code, execution_globals(driver, time))
+        except Exception as e:
+            failed = True
+            error = str(e)
+            chatroom.add_message("Controller", "error", error)
+            print("Code execution error:", error)
+        # Cached coordinates are usually acted on by the next step's code; a failure using them makes them suspect.
+        extractor = current_agents().built("CoordinateExtractorAgent")
+        if extractor is not None:
+            extractor.code_ran(cleaned_code, failed)
+        return "continue"
+
+    elif agent_response["type"] == "summary":
+        return "done"
+    elif agent_response["type"] == "user_prompt":
+        return "wait_user"
+    return "continue"
+
+
+def run_next_step(chatroom: ChatRoom, driver: AppiumController, time,
+                  collect_screen: Callable[[], dict[str, Future]] | None = None,
+                  on_selection: Callable[[dict], None] | None = None) -> str:
+    """
+    Decide which agents should respond next (transition rules first, then the
+    OrchestratorAgent), then call them wave by wave, overlapping independent ones.
+    Responses are added to the chatroom in a deterministic order:
+    wave by wave, and in dispatch order within a wave.
+
+    `collect_screen`, if given, is called once the orchestrator has answered (it
+    does not look at the screen). It must add the current screen_image to the
+    chatroom and may return speculative responses keyed by agent name; the ones
+    that get used are removed from that dict.
+
+    `on_selection`, if given, is called with the selected agents and their
+    expectations (e.g. to show them in the UI).
     
     Returns:
         - "continue": continue to next iteration
@@ -145,8 +433,7 @@ def run_next_step(chatroom: ChatRoom, driver: AppiumController, time) -> str:
     """
     try:
 
-        recent_history = get_recent_updates(chatroom.get_history())
-        response = orchestrator_agent.generate_response(recent_history)
+        response = select_next_agents(chatroom.get_history())
 
         chatroom.add_message(
             sender=response["sender"],
@@ -154,67 +441,23 @@ def run_next_step(chatroom: ChatRoom, driver: AppiumController, time) -> str:
             content=response["content"]
         )
 
+        prefetched = collect_screen() if collect_screen is not None else {}
+
         next_agents = extract_agent_list(response["content"])
         agent_names = list(next_agents.keys())
         result_state = "wait"
         print(next_agents)
 
-        display_latest_agent_message(next_agents)
+        if on_selection is not None:
+            on_selection(next_agents)
 
-        for agent in agents:
-            if agent.name in agent_names:
+        selected = current_agents().select(agent_names)
+        for wave in plan_agent_waves(selected):
+            for agent, outcome in dispatch_agents(wave, chatroom.get_history(), next_agents, prefetched):
                 try:
-                    expectation = next_agents[agent.name]
-                    agent_response = agent.generate_response(chatroom.get_history(), expectation)
-                    
-                    content = agent_response["content"]
-                    sender = agent_response.get("sender", agent.name)
-                    msg_type = agent_response["type"]
-
-                    
-                    chatroom.add_message(
-                        sender=sender,
-                        type=msg_type,
-                        content=content
-                    )
-
-                    if agent_response["type"] == "proposed_screen_coordinates":
-                        coordinates = annotate_coordinates_from_llm(agent_response["content"], get_latest_by_type(chatroom.get_history(), "screen_image"))
-                        print(f"Screen coordinates extracted: {coordinates}")
-                        chatroom.add_message(sender="Controller", type="screen_coordinates", content=f"Screen coordinates extracted: {coordinates}")
-
-                    elif agent_response["type"] == "selected_application":
-                        app_package_name_with_launchables = agent_response["content"]
-                        app_package = sanitize_app_selection(app_package_name_with_launchables)
-                        print(f"Application selected: {app_package}")
-                        chatroom.add_message("Controller", "feedback", f"Application selected: {app_package}")
-                        driver.open_app(app_package)
-                        result_state = "continue"
-
-
-                    elif agent_response["type"] == "code_snippet":
-                        last_code = agent_response["content"]
-                        cleaned_code = sanitize_code(last_code)
-                        print(cleaned_code)
-                        try:
-                            local_vars = {
-                                "driver": driver,
-                                "time": time,
-                            }
-                            exec(cleaned_code, {}, local_vars)
-                            prev_error = None
-                        except Exception as e:
-                            prev_error = str(e)
-                            chatroom.add_message("Controller", "error", prev_error)
-                            print("Code execution error:", prev_error)
-                        result_state = "continue"
-
-                    elif agent_response["type"] == "summary":
-                        result_state = "done"
-                    elif agent_response["type"] == "user_prompt":
-                        result_state = "wait_user"
-                    else:
-                        result_state = "continue"
+                    if isinstance(outcome, BaseException):
+                        raise outcome
+                    result_state = handle_agent_response(chatroom, driver, time, agent, outcome) or result_state
 
                 except Exception as e:
                     chatroom.add_message(
@@ -233,4 +476,4 @@ def run_next_step(chatroom: ChatRoom, driver: AppiumController, time) -> str:
             type="error",
             content=f"Orchestrator failed: {e}"
         )
-        return "continue"
\ No newline at end of file
+        return "continue"
@@ -0,0 +1,134 @@
+# app/prefetch.py
+
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Optional
+
+from app.config import settings
+from utils.async_utils import submit_coroutine
+from utils.screenshot import Screenshot
+
+# The orchestrator has not chosen an expectation yet when the speculative summary starts.
+SPECULATIVE_EXPECTATION = "Describe the screen as it is after the last action and what can be done next."
+
+
+class SpeculativePrefetcher:
+    """
+    Overlaps the post-action settle time with the next iteration's work.
+
+    After generated code runs, `start()` polls the device on a background thread
+    until the screen stops changing (see AppiumController.wait_until_stable), keeps the
+    settled frame and immediately starts a page summary of it. Meanwhile the
+    controller asks the orchestrator for the next agents, which does not need the
+    screen. `collect()` then hands back the frame and the in-flight summary; a
+    summary the orchestrator did not ask for is cancelled and discarded.
+    """
+
+    def __init__(self, driver, page_summarizer, sleep_between: float,
+                 poll_interval: float = settings.SETTLE_POLL_SECONDS,
+                 settle_timeout: float = settings.SETTLE_TIMEOUT_SECONDS):
+        self.driver = driver
+        self.page_summarizer = page_summarizer
+        self.sleep_between = sleep_between
+        self.poll_interval = poll_interval
+        self.settle_timeout = settle_timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._capture: Optional[Future] = None
+        self._summary: Optional[Future] = None
+        self._prefetched: dict[str, Future] = {}
+        self._timings: dict[str, float] = {}
+
+    @property
+    def pending(self) -> bool:
+        return self._capture is not None
+
+    def start(self, task: str) -> None:
+        """Begin settling, capturing and summarizing the next screen in the background."""
+        self.discard()
+        self._timings = {}
+        self._capture = self._executor.submit(self._settle_and_summarize, task)
+
+    def _settle_and_summarize(self, task: str) -> Screenshot:
+        start = time.perf_counter()
+        frame = self._wait_for_settled_frame()
+        self._timings["settle"] = time.perf_counter() - start
+
+        if self.page_summarizer is not None:
+            history = [
+                {"sender": "User", "type": "task", "content": task},
+                {"sender": "Controller", "type": "screen_image", "content": frame}
+            ]
+            summary_start = time.perf_counter()
+            self._summary = submit_coroutine(
+                self.page_summarizer.agenerate_response(history, SPECULATIVE_EXPECTATION)
+            )
+            self._summary.add_done_callback(lambda _: self._timings.update(
+                summary=time.perf_counter() - summary_start, summary_done=time.perf_counter()
+            ))
+        return frame
+
+    def _wait_for_settled_frame(self) -> Screenshot:
+        settled = self.driver.wait_until_stable(timeout=self.settle_timeout, poll_interval=self.poll_interval,
+                                                persist=None)
+        if not settled["success"]:
+            raise RuntimeError(f"Screenshot failed while waiting for the screen to settle: {settled['error']}")
+        return settled["screenshot"]
+
+    def collect(self) -> tuple[Optional[Screenshot], dict[str, Future]]:
+        """
+        Wait for the settled frame. Returns it with the speculative agent responses
+        (futures keyed by agent name) that run_next_step uses instead of calling the agent.
+        Falls back to a plain screenshot if the background capture failed.
+        """
+        start = time.perf_counter()
+        try:
+            frame = self._capture.result()
+        except Exception as e:
+            print(f"Prefetch capture failed, taking a new screenshot: {e}")
+            shot = self.driver.take_screenshot()
+            frame = shot["screenshot"] if shot["success"] else None
+        self._capture = None
+        self._timings["collected"] = time.perf_counter()
+        self._timings["collect_wait"] = self._timings["collected"] - start
+        self._prefetched = {self.page_summarizer.name: self._summary} if self._summary is not None else {}
+        return frame, self._prefetched
+
+    def finish_iteration(self) -> dict[str, Any]:
+        """
+        Cancel speculative work the orchestrator did not ask for and return this
+        iteration's timings.
+
+        `saved_seconds` is measured against the serial loop, which sleeps
+        `sleep_between`, then (when it is needed) waits for the page summary:
+        the time the controller actually spent blocked on the prefetch is subtracted.
+        """
+        # run_next_step removes the entries it used from the dict handed out by collect().
+        summary_used = self._summary is not None and self.page_summarizer.name not in self._prefetched
+        if self._summary is not None and not summary_used:
+            self._summary.cancel()
+        self._summary = None
+
+        blocked = self._timings.get("collect_wait", 0.0)
+        serial = self.sleep_between
+        if summary_used:
+            serial += self._timings.get("summary", 0.0)
+            blocked += max(0.0, self._timings.get("summary_done", 0.0) - self._timings.get("collected", 0.0))
+        return {
+            "settle_seconds": round(self._timings.get("settle", 0.0), 3),
+            "summary_used": summary_used,
+            "blocked_seconds": round(blocked, 3),
+            "saved_seconds": round(serial - blocked, 3)
+        }
+
+    def discard(self) -> None:
+        """Drop any in-flight speculative work."""
+        if self._summary is not None:
+            self._summary.cancel()
+            self._summary = None
+        if self._capture is not None:
+            self._capture.cancel()
+            self._capture = None
+
+    def close(self) -> None:
+        self.discard()
+        self._executor.shutdown(wait=False, cancel_futures=True)
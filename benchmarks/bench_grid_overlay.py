@@ -0,0 +1,119 @@
+# benchmarks/bench_grid_overlay.py
+"""
+Per-call time of create_grid_overlay before and after the cached grid layer,
+on synthetic 1080x2400 screenshots.
+
+    python benchmarks/bench_grid_overlay.py --calls 20
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from PIL import Image, ImageDraw, ImageFont
+
+from utils.coordinate_utils import create_grid_overlay, grid_to_coordinates
+
+
+def legacy_create_grid_overlay(screenshot_path: str, grid_size: int = 75) -> dict:
+    """The pre-cache implementation: font load, full redraw, per-cell dict and PNG save per call."""
+    with Image.open(screenshot_path) as img:
+        img_width, img_height = img.size
+        overlay = img.copy()
+        draw = ImageDraw.Draw(overlay)
+        try:
+            font = ImageFont.truetype("arial.ttf", 32)
+        except:
+            font = ImageFont.load_default(size=32)
+
+        cols = img_width // grid_size
+        rows = img_height // grid_size
+        grid_map = {}
+        cell_number = 1
+
+        for i in range(cols + 1):
+            x = i * grid_size
+            draw.line([(x, 0), (x, img_height)], fill="red", width=2)
+        for i in range(rows + 1):
+            y = i * grid_size
+            draw.line([(0, y), (img_width, y)], fill="red", width=2)
+
+        for row in range(rows):
+            for col in range(cols):
+                x = col * grid_size
+                y = row * grid_size
+                draw.text((x + 5, y + 5), str(cell_number), fill="blue", font=font)
+                grid_map[cell_number] = {
+                    "cell": cell_number,
+                    "bounds": {"x": x, "y": y, "width": grid_size, "height": grid_size},
+                    "center": [x + grid_size // 2, y + grid_size // 2]
+                }
+                cell_number += 1
+
+        output_dir = os.path.join(tempfile.gettempdir(), "legacy_screenshot_grids")
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, os.path.basename(screenshot_path).replace(".png", "_grid.png"))
+        overlay.save(output_path)
+        return {"grid_image_path": output_path, "grid_map": grid_map}
+
+
+def make_screenshots(directory: str, count: int, size=(1080, 2400)) -> list[str]:
+    """Write `count` synthetic app-like screenshots and return their paths."""
+    rng = random.Random(0)
+    paths = []
+    for i in range(count):
+        img = Image.new("RGB", size, (245, 245, 245))
+        draw = ImageDraw.Draw(img)
+        for _ in range(40):
+            x, y = rng.randrange(size[0] - 200), rng.randrange(size[1] - 120)
+            draw.rectangle([x, y, x + rng.randrange(80, 200), y + rng.randrange(40, 120)],
+                           fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        path = os.path.join(directory, f"screenshot_{i:03d}.png")
+        img.save(path)
+        paths.append(path)
+    return paths
+
+
+def time_calls(fn, paths: list[str]) -> float:
+    """Average seconds per call over all paths."""
+    start = time.perf_counter()
+    for path in paths:
+        fn(path)
+    return (time.perf_counter() - start) / len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_screenshots(directory, args.calls)
+
+        before = time_calls(legacy_create_grid_overlay, paths)
+
+        def current(path):
+            grid_data = create_grid_overlay(path)
+            grid_to_coordinates(grid_data, [101, 102, 115])
+            return grid_data
+
+        # First call pays for building the layer; report it separately.
+        cold_start = time.perf_counter()
+        create_grid_overlay(paths[0])
+        cold = time.perf_counter() - cold_start
+        after = time_calls(current, paths)
+
+    print(f"1080x2400, {args.calls} calls")
+    print(f"  before (legacy):         {before * 1000:8.1f} ms/call")
+    print(f"  after  (first call):     {cold * 1000:8.1f} ms")
+    print(f"  after  (cached layer):   {after * 1000:8.1f} ms/call")
+    print(f"  speedup:                 {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
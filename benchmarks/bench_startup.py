@@ -0,0 +1,85 @@
+# benchmarks/bench_startup.py
+"""
+Import-time cost of the engine modules, measured with `python -X importtime`
+in fresh interpreters, plus checks that importing them has no side effects:
+nothing printed, and no UI or model-client modules (streamlit, google.genai)
+loaded before a task needs them.
+
+Exits with status 1 if a module's median cumulative import time exceeds
+--max-ms or a check fails, so it can gate CI:
+
+    python benchmarks/bench_startup.py --runs 5 --max-ms 1000
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_MODULES = ["app.orchestrator", "app.controller", "app.device_pool"]
+FORBIDDEN = ["streamlit", "google.genai"]
+
+
+def import_profile(module: str) -> tuple[dict[str, tuple[int, int]], str]:
+    """{module: (self us, cumulative us)} for one fresh `import module`, and its stdout."""
+    probe = f"import sys, {module}; print('\\n'.join(sorted(sys.modules)), file=sys.stderr)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, "PYTHONPATH": ROOT}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    timings, loaded = {}, set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:"):
+            parts = [part.strip() for part in line[len("import time:"):].split("|")]
+            if parts[0].isdigit():
+                timings[parts[2]] = (int(parts[0]), int(parts[1]))
+        else:
+            loaded.add(line.strip())
+    timings["__loaded__"] = loaded
+    return timings, result.stdout
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help=f"Module to import (default: {', '.join(DEFAULT_MODULES)})")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=1000, help="Regression threshold per module (median)")
+    parser.add_argument("--top", type=int, default=8, help="Slowest dependencies to list")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.module or DEFAULT_MODULES:
+        samples = []
+        for _ in range(args.runs):
+            timings, stdout = import_profile(module)
+            samples.append(timings[module][1] / 1000)
+        median = statistics.median(samples)
+        print(f"\n{module}: median {median:.1f} ms, min {min(samples):.1f} ms over {args.runs} runs")
+
+        loaded = timings.pop("__loaded__")
+        slowest = sorted(timings.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        for name, (self_us, cumulative_us) in slowest:
+            print(f"  {name:<50}{self_us / 1000:>9.1f} ms self{cumulative_us / 1000:>9.1f} ms total")
+
+        if median > args.max_ms:
+            failures.append(f"{module} took {median:.1f} ms (> {args.max_ms} ms)")
+        if stdout.strip():
+            failures.append(f"{module} printed on import: {stdout.strip().splitlines()[0]!r}")
+        for forbidden in FORBIDDEN:
+            if forbidden in loaded:
+                failures.append(f"{module} imports {forbidden}")
+
+    print()
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: all modules under {args.max_ms} ms with no import side effects")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
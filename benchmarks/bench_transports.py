@@ -0,0 +1,234 @@
+# benchmarks/bench_transports.py
+"""
+Capture and tap latency through Appium (HTTP + base64 PNG, W3C actions) versus
+the direct ADB transport (raw screencap, `input tap`), against a local fake
+device: a minimal WebDriver HTTP server and a minimal ADB server serving the
+same synthetic 1080x2400 frame.
+
+Before timing, punctuation-heavy text is typed through the ADB transport and
+the argv the device shell would run is checked against the input.
+
+The fake device does no real work, so the numbers isolate transport and
+decoding overhead. Pass --encode-png to PNG-encode every Appium screenshot, as
+UiAutomator2 does on a real device.
+
+    python benchmarks/bench_transports.py --calls 30
+"""
+
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import shlex
+import socket
+import socketserver
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from PIL import Image, ImageDraw
+
+from app.adb_transport import AdbTransport, parse_operations
+from app.appium_controller import AppiumController
+
+WIDTH, HEIGHT = 1080, 2400
+SERIAL = "fake-device"
+
+
+def synthetic_frame() -> Image.Image:
+    img = Image.new("RGB", (WIDTH, HEIGHT), (245, 245, 245))
+    draw = ImageDraw.Draw(img)
+    for i in range(0, HEIGHT, 160):
+        draw.rectangle([40, i + 20, WIDTH - 40, i + 140], fill=((i * 7) % 255, 120, 200))
+        draw.text((60, i + 60), f"Row {i // 160}", fill="white")
+    return img
+
+
+class FakeDevice:
+    def __init__(self, encode_png: bool):
+        self.frame = synthetic_frame()
+        self.encode_png = encode_png
+        self._png = self._encode()
+        header = WIDTH.to_bytes(4, "little") + HEIGHT.to_bytes(4, "little") + (1).to_bytes(4, "little") + bytes(4)
+        self.raw = header + self.frame.convert("RGBA").tobytes()
+        self.taps = 0
+        self.shell_commands: list[str] = []
+
+    def _encode(self) -> bytes:
+        buffer = io.BytesIO()
+        self.frame.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def png_base64(self) -> str:
+        return base64.b64encode(self._encode() if self.encode_png else self._png).decode("ascii")
+
+
+def appium_handler(device: FakeDevice):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, value) -> None:
+            body = json.dumps({"value": value}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.endswith("/screenshot"):
+                self._reply(device.png_base64())
+            elif self.path.endswith("/window/rect"):
+                self._reply({"x": 0, "y": 0, "width": WIDTH, "height": HEIGHT})
+            else:
+                self._reply(None)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            if self.path.rstrip("/") == "/session":
+                self._reply({"sessionId": "fake", "capabilities": {"platformName": "Android"}})
+                return
+            if self.path.endswith("/actions"):
+                device.taps += 1
+            self._reply(None)
+
+        def do_DELETE(self):
+            self._reply(None)
+    return Handler
+
+
+def adb_handler(device: FakeDevice):
+    class Handler(socketserver.BaseRequestHandler):
+        def _command(self) -> str:
+            length = int(self._read(4), 16)
+            return self._read(length).decode("utf-8")
+
+        def _read(self, size: int) -> bytes:
+            data = b""
+            while len(data) < size:
+                chunk = self.request.recv(size - len(data))
+                if not chunk:
+                    raise ConnectionError("client closed")
+                data += chunk
+            return data
+
+        def handle(self):
+            try:
+                command = self._command()
+                if command == "host:version":
+                    self.request.sendall(b"OKAY0004" + b"%04x" % 40)
+                    return
+                if command != f"host:transport:{SERIAL}":
+                    message = f"unsupported {command}".encode()
+                    self.request.sendall(b"FAIL" + b"%04x" % len(message) + message)
+                    return
+                self.request.sendall(b"OKAY")
+                shell = self._command()
+                self.request.sendall(b"OKAY")
+                device.shell_commands.append(shell.removeprefix("shell:"))
+                if shell.startswith("shell:screencap"):
+                    self.request.sendall(device.raw)
+                elif shell.startswith("shell:input tap"):
+                    device.taps += 1
+            except ConnectionError:
+                pass
+    return Handler
+
+
+class ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(server) -> None:
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+TEXT_SAMPLES = ["it's", "a&b", "$5!", "(x); y", 'say "hi" `now`', "a|b > c < d", "#tag ~ * ? [1] {2}", "back\\slash"]
+
+
+def check_text_input(device: FakeDevice, transport: AdbTransport) -> None:
+    """Type TEXT_SAMPLES over ADB and check the device shell would pass each to `input text` unchanged."""
+    for text in TEXT_SAMPLES:
+        device.shell_commands.clear()
+        transport.text(text)
+        argv = shlex.split(device.shell_commands[-1])
+        # `input text` turns %s back into spaces.
+        typed = argv[2].replace("%s", " ") if argv[:2] == ["input", "text"] and len(argv) == 3 else None
+        if typed != text:
+            raise SystemExit(f"ADB text input corrupted {text!r}: device argv {argv}")
+    print(f"ADB text input: {len(TEXT_SAMPLES)} samples reach the device unchanged")
+
+
+def time_calls(fn, calls: int) -> dict:
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()  # warm up connections
+        for _ in range(calls):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.mean(samples), 2),
+        "p50_ms": round(samples[len(samples) // 2], 2),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=30)
+    parser.add_argument("--encode-png", action="store_true", help="PNG-encode every Appium screenshot")
+    args = parser.parse_args()
+
+    device = FakeDevice(args.encode_png)
+    http = ThreadingHTTPServer(("127.0.0.1", free_port()), appium_handler(device))
+    serve(http)
+    adb_port = free_port()
+    serve(ThreadingTCPServer(("127.0.0.1", adb_port), adb_handler(device)))
+
+    controller = AppiumController(f"http://127.0.0.1:{http.server_port}", device_name=SERIAL)
+    controller.setup_driver()
+    controller.adb = AdbTransport(SERIAL, port=adb_port)
+    check_text_input(device, controller.adb)
+
+    def capture():
+        # Agents need pixels, so decoding is part of the cost.
+        controller._capture_frame().image
+
+    results = {}
+    for transport, operations in (("appium", ""), ("adb", "screenshot,tap")):
+        controller.adb_operations = parse_operations(operations)
+        results[transport] = {
+            "capture": time_calls(capture, args.calls),
+            "tap": time_calls(lambda: controller.click_coordinates(540, 1200), args.calls)
+        }
+
+    print(f"\n{'operation':<10}{'transport':<10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for operation in ("capture", "tap"):
+        for transport in ("appium", "adb"):
+            stats = results[transport][operation]
+            print(f"{operation:<10}{transport:<10}{stats['mean_ms']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}")
+        speedup = results["appium"][operation]["mean_ms"] / max(results["adb"][operation]["mean_ms"], 1e-6)
+        print(f"{'':<10}{'speedup':<10}{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+# benchmarks/run.py
+"""
+Microbenchmarks of the CPU-bound stages every iteration runs, offline against
+synthetic 1080x2400 screenshots, canned LLM responses and generated chat
+histories (no device, Appium server or API key needed).
+
+    python benchmarks/run.py run                          # all, to benchmarks/results/
+    python benchmarks/run.py run --filter chatroom --output current.json
+    python benchmarks/run.py list
+    python benchmarks/run.py compare baseline.json current.json --threshold 0.1
+
+Each benchmark is timed in `--repeats` rounds of enough calls to last at least
+`--min-time` seconds; the result file holds the per-call median, min, max and
+standard deviation (microseconds) of the rounds, plus the machine and commit.
+
+`compare` flags a regression when both the median and the min per-call time
+grew by more than --threshold (requiring both keeps one noisy round from
+failing a run) and exits with status 1 if there is any.
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import argparse
+import gc
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+from PIL import Image, ImageDraw
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+FORMAT_VERSION = 1
+
+# name -> setup(); setup builds the inputs and returns the function to time.
+BENCHMARKS: dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+# SYNTHETIC INPUTS
+
+def synthetic_screen(size=(1080, 2400), seed: int = 0) -> Image.Image:
+    """An app-like frame: light background, toolbar, list rows and some colored blocks."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (245, 245, 245))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, size[0], 80], fill=(30, 30, 30))
+    draw.rectangle([0, 80, size[0], 240], fill=(0, 121, 107))
+    for row in range(12):
+        top = 280 + row * 170
+        draw.rectangle([40, top, 160, top + 120], fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        draw.text((200, top + 30), f"Conversation {row + 1}", fill=(20, 20, 20))
+        draw.text((200, top + 70), "Last message preview text", fill=(110, 110, 110))
+    for _ in range(20):
+        x, y = rng.randrange(size[0] - 200), rng.randrange(size[1] - 120)
+        draw.rectangle([x, y, x + rng.randrange(40, 200), y + rng.randrange(20, 120)],
+                       fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    return img
+
+
+def png_bytes(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+AGENT_SELECTION_RESPONSE = """Based on the current screen, the app is open but we need the search field.
+```json
+{
+  "next_agents": [
+    {"name": "PageSummarizerAgent", "expectation": "Describe the visible screen and whether the search bar is shown."},
+    {"name": "CoordinateExtractorAgent", "expectation": "Return coordinates for 'the search input field'."},
+    {"name": "CodeGeneratorAgent", "expectation": "Tap the search field and type 'despacito'."},
+    {"name": "UnknownAgent", "expectation": "Ignored."}
+  ]
+}
+```"""
+
+COORDINATES_RESPONSE = """```json
+{"cell_numbers": [101, 102, 115], "coordinates": [540, 1210], "element": "search input field"}
+```"""
+
+CODE_RESPONSE = """Here is the code:
+```python
+driver.tap_and_type(540, 1210, "despacito", clear=True, enter=True)
+time.sleep(1.5)
+driver.swipe(540, 1800, 540, 600, duration=300)
+result = {"status": "typed", "query": "despacito"}
+```"""
+
+APP_SELECTION_RESPONSE = """```json
+{"reasoning": "The task asks to play music on YouTube Music.", "package": "com.google.android.apps.youtube.music"}
+```"""
+
+# One orchestrator turn of a typical run: (sender, type, content)
+TURN = [
+    ("OrchestratorAgent", "agent_selection", AGENT_SELECTION_RESPONSE.split("```json")[1].rstrip("`").strip()),
+    ("Controller", "screen_image", "screenshots/screenshot_20250101_120000_001.png"),
+    ("PageSummarizerAgent", "page_summary",
+     "The YouTube Music home screen is shown with a search icon in the top right, a list of recommended "
+     "playlists (Chill Mix, Workout, Top Hits) and a mini player at the bottom. No dialogs are open."),
+    ("CoordinateExtractorAgent", "screen_coordinates", COORDINATES_RESPONSE),
+    ("CodeGeneratorAgent", "code_snippet", CODE_RESPONSE),
+    ("Controller", "execution_result", "Executed successfully: {'status': 'typed', 'query': 'despacito'}"),
+    ("CodeVerifierAgent", "feedback", "The search results for 'despacito' are visible; continue with the first result."),
+]
+
+
+def synthetic_chatroom(messages: int):
+    """A ChatRoom (no chat log) holding a task followed by `messages` - 1 messages of repeated turns."""
+    from app.chatroom import ChatRoom
+    chatroom = ChatRoom()
+    chatroom.add_message("user", "task", "Play despacito on YouTube Music")
+    for i in range(messages - 1):
+        sender, msg_type, content = TURN[i % len(TURN)]
+        chatroom.add_message(sender, msg_type, content)
+    return chatroom
+
+
+# BENCHMARKS
+
+@benchmark("grid_overlay")
+def bench_grid_overlay():
+    from utils.coordinate_utils import create_grid_overlay
+    image = synthetic_screen()
+    create_grid_overlay(image)  # build the cached grid layer outside the timing
+    return lambda: create_grid_overlay(image)
+
+
+@benchmark("grid_to_coordinates")
+def bench_grid_to_coordinates():
+    from utils.coordinate_utils import create_grid_overlay, grid_to_coordinates
+    grid_data = create_grid_overlay(synthetic_screen())
+    return lambda: grid_to_coordinates(grid_data, [101, 102, 115])
+
+
+@benchmark("annotate_coordinates")
+def bench_annotate_coordinates():
+    """Copy, draw and the background save of the annotated frame (waited for, so writes don't pile up)."""
+    from utils.coordinate_utils import annotate_coordinates
+    from utils.screenshot import Screenshot, wait_for_pending_writes
+    screen = Screenshot(image=synthetic_screen())
+    output_dir = tempfile.mkdtemp(prefix="bench_annotate_")
+
+    def run():
+        annotate_coordinates((540, 1210), screen, output_dir=output_dir)
+        wait_for_pending_writes()
+    return run
+
+
+@benchmark("extract_agent_list")
+def bench_extract_agent_list():
+    from app.orchestrator import extract_agent_list
+    return lambda: extract_agent_list(AGENT_SELECTION_RESPONSE)
+
+
+@benchmark("sanitize_json")
+def bench_sanitize_json():
+    from utils.sanitizer import sanitize_json
+    return lambda: sanitize_json(COORDINATES_RESPONSE)
+
+
+@benchmark("sanitize_code")
+def bench_sanitize_code():
+    from utils.sanitizer import sanitize_code
+    return lambda: sanitize_code(CODE_RESPONSE)
+
+
+@benchmark("sanitize_app_selection")
+def bench_sanitize_app_selection():
+    from utils.sanitizer import sanitize_app_selection
+    return lambda: sanitize_app_selection(APP_SELECTION_RESPONSE)
+
+
+@benchmark("orchestrator_history_render")
+def bench_orchestrator_history_render():
+    """The orchestrator's per-step prompt: compacted history (incremental state warm) filled into its template."""
+    from agents.orchestrator_agent import OrchestratorAgent
+    agent = OrchestratorAgent(api_key="offline")
+    history = synthetic_chatroom(200).get_history()
+    agent.compactor.render(history)
+    return lambda: agent.fill_prompt(task="Play despacito on YouTube Music", history=agent.compactor.render(history))
+
+
+@benchmark("summarizer_history_render")
+def bench_summarizer_history_render():
+    """The summarizer's one-off prompt over a whole run's history (compacted from scratch)."""
+    from agents.summarizer import SummarizerAgent
+    agent = SummarizerAgent(api_key="offline")
+    history = synthetic_chatroom(200).get_history()
+
+    def run():
+        agent.compactor.reset()
+        return agent.fill_prompt(task="Play despacito on YouTube Music", history=agent.compactor.render(history),
+                                 expectation="Summarize the run.")
+    return run
+
+
+def chatroom_lookups(messages: int):
+    def setup():
+        from app.chatroom import latest_content
+        chatroom = synthetic_chatroom(messages)
+        history = chatroom.get_history()
+
+        def run():
+            chatroom.get_latest("task")
+            chatroom.get_latest("page_summary")
+            latest_content(history, "screen_coordinates")
+            chatroom.filter_by_type("code_snippet")
+            chatroom.has_type_from_sender("feedback", "CodeVerifierAgent")
+        return run
+    return setup
+
+
+for _size in (10, 100, 1000):
+    benchmark(f"chatroom_lookups_{_size}")(chatroom_lookups(_size))
+
+
+@benchmark("screenshot_png_decode")
+def bench_screenshot_png_decode():
+    """take_screenshot's Appium path: wrap the PNG bytes, read the size, decode on first use."""
+    from utils.screenshot import Screenshot
+    data = png_bytes(synthetic_screen())
+
+    def run():
+        screen = Screenshot(png=data)
+        screen.size
+        return screen.image
+    return run
+
+
+@benchmark("screenshot_png_encode")
+def bench_screenshot_png_encode():
+    """Re-encoding a decoded frame to PNG, as persisting an ADB capture does."""
+    image = synthetic_screen()
+    return lambda: png_bytes(image)
+
+
+@benchmark("image_prep_summary")
+def bench_image_prep_summary():
+    """Downscale and JPEG-encode a frame with the page summarizer's image policy."""
+    from agents.page_summarizer import PageSummarizerAgent
+    from utils.image_prep import prepare_image
+    image = synthetic_screen()
+    return lambda: prepare_image(image, PageSummarizerAgent.image_policy)
+
+
+@benchmark("image_prep_grid")
+def bench_image_prep_grid():
+    """Downscale and losslessly encode a grid overlay with the coordinate extractor's image policy."""
+    from agents.coordinate_extrator import CoordinateExtractorAgent
+    from utils.coordinate_utils import create_grid_overlay
+    from utils.image_prep import prepare_image
+    image = create_grid_overlay(synthetic_screen())["grid_image"]
+    return lambda: prepare_image(image, CoordinateExtractorAgent.image_policy)
+
+
+# TIMING
+
+def time_benchmark(fn: Callable[[], object], repeats: int, min_time: float, max_calls: int = 100_000) -> dict:
+    """Per-call seconds of `repeats` rounds, each with enough calls to take at least `min_time`."""
+    fn()  # warm-up
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or calls >= max_calls:
+            break
+        calls = min(max_calls, calls * 2 if elapsed <= 0 else max(calls * 2, int(calls * min_time / elapsed * 1.2)))
+
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for _ in range(calls):
+                fn()
+            samples.append((time.perf_counter() - start) / calls)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return {
+        "median_us": round(statistics.median(samples) * 1e6, 3),
+        "min_us": round(min(samples) * 1e6, 3),
+        "max_us": round(max(samples) * 1e6, 3),
+        "stdev_us": round(statistics.stdev(samples) * 1e6, 3) if len(samples) > 1 else 0.0,
+        "calls": calls,
+        "repeats": repeats
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit
+    }
+
+
+def run(args) -> int:
+    names = [name for name in BENCHMARKS if not args.filter or any(part in name for part in args.filter)]
+    if not names:
+        print(f"No benchmark matches {args.filter}")
+        return 1
+
+    results = {}
+    for name in names:
+        fn = BENCHMARKS[name]()
+        results[name] = time_benchmark(fn, args.repeats, args.min_time)
+        stats = results[name]
+        print(f"{name:<32}{stats['median_us']:>12.1f} us median{stats['min_us']:>12.1f} us min"
+              f"  ±{stats['stdev_us']:.1f}  ({stats['calls']} calls x {stats['repeats']})")
+
+    report = {
+        "format": FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": environment(),
+        "settings": {"repeats": args.repeats, "min_time": args.min_time},
+        "benchmarks": results
+    }
+    output = args.output
+    if output is None:
+        commit = report["environment"]["commit"] or "nocommit"
+        output = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+    return 0
+
+
+def load_report(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    if report.get("format") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported results format {report.get('format')!r}")
+    return report
+
+
+def compare(args) -> int:
+    baseline, current = load_report(args.baseline), load_report(args.current)
+    base, cur = baseline["benchmarks"], current["benchmarks"]
+    if baseline["environment"].get("machine") != current["environment"].get("machine") or \
+            baseline["environment"].get("python") != current["environment"].get("python"):
+        print("Note: results come from different machines or Python versions.")
+
+    regressions = []
+    print(f"{'benchmark':<32}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name in sorted(set(base) | set(cur)):
+        if name not in cur or name not in base:
+            print(f"{name:<32}{'only in ' + ('baseline' if name in base else 'current'):>33}")
+            continue
+        ratio = cur[name]["median_us"] / base[name]["median_us"] if base[name]["median_us"] else 1.0
+        min_ratio = cur[name]["min_us"] / base[name]["min_us"] if base[name]["min_us"] else 1.0
+        verdict = ""
+        if ratio > 1 + args.threshold and min_ratio > 1 + args.threshold:
+            verdict = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - args.threshold and min_ratio < 1 - args.threshold:
+            verdict = "faster"
+        print(f"{name:<32}{base[name]['median_us']:>10.1f}us{cur[name]['median_us']:>10.1f}us"
+              f"{(ratio - 1) * 100:>+8.1f}%  {verdict}")
+
+    print()
+    if regressions:
+        print(f"FAIL: {len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"OK: no regression over {args.threshold:.0%}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmarks and write a results file")
+    run_parser.add_argument("--filter", action="append", help="Only benchmarks whose name contains this (repeatable)")
+    run_parser.add_argument("--repeats", type=int, default=5)
+    run_parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per round")
+    run_parser.add_argument("--output", help="Results file (default: benchmarks/results/<time>_<commit>.json)")
+
+    commands.add_parser("list", help="List benchmark names")
+
+    compare_parser = commands.add_parser("compare", help="Compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Allowed slowdown (0.1 = 10%%)")
+
+    args = parser.parse_args()
+    if args.command == "list":
+        print("\n".join(BENCHMARKS))
+        return 0
+    return run(args) if args.command == "run" else compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+# utils/api_usage.py
+
+import asyncio
+import threading
+import time
+from typing import Any, Optional
+
+from app.config import settings
+
+
+class RateLimiter:
+    """
+    Spaces requests to one model at least 60/`requests_per_minute` seconds apart
+    and caps how many are in flight at once (0 disables either limit).
+    Shared by every agent and every thread that calls the model.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, max_concurrent: int = 0):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.max_concurrent = max_concurrent
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Book the next free start time; returns how long the caller has to wait for it."""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+            return start - now
+
+    def acquire(self) -> float:
+        """Block until a request may start. Returns the seconds waited."""
+        start = time.perf_counter()
+        if self._slots is not None:
+            self._slots.acquire()
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return time.perf_counter() - start
+
+    async def aacquire(self) -> float:
+        """Async variant of acquire(); polls for a slot so cancellation never leaks one."""
+        start = time.perf_counter()
+        if self._slots is not None:
+            while not self._slots.acquire(blocking=False):
+                await asyncio.sleep(0.05)
+        delay = self._reserve()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.release()
+                raise
+        return time.perf_counter() - start
+
+    def release(self) -> None:
+        if self._slots is not None:
+            self._slots.release()
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+_limits = {"requests_per_minute": settings.API_REQUESTS_PER_MINUTE, "max_concurrent": settings.API_MAX_CONCURRENT_REQUESTS}
+
+
+def rate_limiter(model: str) -> RateLimiter:
+    """The process-wide RateLimiter for `model`."""
+    with _limiters_lock:
+        if model not in _limiters:
+            _limiters[model] = RateLimiter(**_limits)
+        return _limiters[model]
+
+
+def configure_rate_limits(requests_per_minute: Optional[float] = None, max_concurrent: Optional[int] = None) -> None:
+    """Override API_REQUESTS_PER_MINUTE / API_MAX_CONCURRENT_REQUESTS (per model) for limiters created from now on."""
+    with _limiters_lock:
+        if requests_per_minute is not None:
+            _limits["requests_per_minute"] = requests_per_minute
+        if max_concurrent is not None:
+            _limits["max_concurrent"] = max_concurrent
+        _limiters.clear()
+
+
+class UsageStats:
+    """Per-agent model calls, latency, rate-limit waits and token counts."""
+
+    FIELDS = ("calls", "errors", "seconds", "waited_seconds", "prompt_tokens", "output_tokens")
+
+    def __init__(self):
+        self._agents: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, agent: str, seconds: float, waited: float = 0.0, response: Any = None, ok: bool = True) -> None:
+        metadata = getattr(response, "usage_metadata", None)
+        with self._lock:
+            stats = self._agents.setdefault(agent, dict.fromkeys(self.FIELDS, 0))
+            stats["calls"] += 1
+            stats["errors"] += 0 if ok else 1
+            stats["seconds"] += seconds
+            stats["waited_seconds"] += waited
+            if metadata is not None:
+                stats["prompt_tokens"] += metadata.prompt_token_count or 0
+                stats["output_tokens"] += metadata.candidates_token_count or 0
+
+    def agents(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {agent: dict(stats) for agent, stats in self._agents.items()}
+
+    def snapshot(self) -> dict:
+        per_agent = self.agents()
+        totals = {field: sum(stats[field] for stats in per_agent.values()) for field in self.FIELDS}
+        for stats in (*per_agent.values(), totals):
+            stats["mean_latency_ms"] = round(stats["seconds"] / stats["calls"] * 1000, 1) if stats["calls"] else 0.0
+            stats["seconds"] = round(stats["seconds"], 3)
+            stats["waited_seconds"] = round(stats["waited_seconds"], 3)
+        return {**totals, "agents": per_agent}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._agents.clear()
+
+
+def usage_delta(before: dict[str, dict], after: dict[str, dict]) -> dict[str, dict]:
+    """Per-agent usage between two UsageStats.agents() readings, with mean latency."""
+    delta = {}
+    for agent, stats in after.items():
+        previous = before.get(agent, {})
+        change = {field: stats[field] - previous.get(field, 0) for field in UsageStats.FIELDS}
+        if not change["calls"]:
+            continue
+        change["mean_latency_ms"] = round(change["seconds"] / change["calls"] * 1000, 1)
+        change["seconds"] = round(change["seconds"], 3)
+        change["waited_seconds"] = round(change["waited_seconds"], 3)
+        delta[agent] = change
+    return delta
+
+
+usage_stats = UsageStats()
@@ -0,0 +1,281 @@
+# utils/app_index.py
+
+import re
+import threading
+import time
+from difflib import SequenceMatcher
+from typing import Callable, Optional
+
+from app.config import settings
+
+LAUNCHER_QUERY = "cmd package query-activities -a android.intent.action.MAIN -c android.intent.category.LAUNCHER"
+_PACKAGES_MARKER = "__APP_INDEX_PACKAGES__"
+
+# Package-name segments that say nothing about the app.
+_NOISE = {"com", "org", "net", "android", "google", "apps", "app", "mobile", "client", "lite", "free",
+          "activity", "main", "launcher", "home", "ui", "splash", "default", "alias", "root"}
+_STOPWORDS = {"a", "an", "the", "to", "in", "on", "of", "for", "and", "or", "my", "me", "with", "at", "from",
+              "open", "launch", "start", "use", "using", "app", "application", "please", "then", "go", "it", "is"}
+
+# Well-known packages whose names do not contain the label users say.
+KNOWN_LABELS = {
+    "com.google.android.gm": "gmail",
+    "com.android.vending": "play store",
+    "com.google.android.apps.photos": "photos",
+    "com.google.android.apps.maps": "maps",
+    "com.google.android.apps.messaging": "messages",
+    "com.android.mms": "messages",
+    "com.google.android.dialer": "phone dialer",
+    "com.android.dialer": "phone dialer",
+    "com.google.android.contacts": "contacts",
+    "com.google.android.deskclock": "clock alarm",
+    "com.android.deskclock": "clock alarm",
+    "com.google.android.calendar": "calendar",
+    "com.google.android.apps.docs": "drive",
+    "com.google.android.googlequicksearchbox": "google search",
+    "com.android.chrome": "chrome browser",
+    "com.google.android.GoogleCamera": "camera",
+    "com.android.camera2": "camera",
+    "com.google.android.apps.nexuslauncher": "launcher",
+    "com.zhiliaoapp.musically": "tiktok",
+    "com.facebook.katana": "facebook",
+    "com.facebook.orca": "messenger",
+    "com.twitter.android": "twitter x",
+    "org.telegram.messenger": "telegram",
+}
+
+# What a task asks for -> words found in the names of apps that do it. Matches
+# through these only rank candidates; they never select an app on their own.
+CAPABILITY_HINTS = {
+    "email": ("gmail", "mail", "outlook"), "mail": ("gmail", "mail", "outlook"),
+    "browse": ("chrome", "browser", "firefox"), "web": ("chrome", "browser", "firefox"),
+    "website": ("chrome", "browser"), "search": ("google", "chrome"),
+    "photo": ("camera", "photos", "gallery"), "picture": ("camera", "photos", "gallery"),
+    "selfie": ("camera",), "video": ("youtube", "camera", "photos"),
+    "call": ("dialer", "phone"), "dial": ("dialer", "phone"),
+    "sms": ("messages", "messaging", "mms"), "text": ("messages", "messaging", "whatsapp"),
+    "message": ("messages", "messaging", "whatsapp", "messenger"),
+    "navigate": ("maps",), "directions": ("maps",), "map": ("maps",),
+    "alarm": ("clock", "alarm"), "timer": ("clock",), "calculate": ("calculator",),
+    "wifi": ("settings",), "bluetooth": ("settings",), "install": ("play", "store"),
+    "music": ("music", "spotify", "youtube"), "song": ("music", "spotify"),
+    "event": ("calendar",), "meeting": ("calendar",), "note": ("keep", "notes"),
+    "file": ("files", "documentsui"), "contact": ("contacts",),
+}
+
+
+def _words(text: str, camel_case: bool = True) -> list[str]:
+    """Lower-case words of `text`, split at separators and (optionally) camelCase."""
+    if camel_case:
+        text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    return [word for word in re.split(r"[^a-z0-9]+", text.lower()) if word]
+
+
+class AppEntry:
+    """A launchable app: package, display label and launcher activity."""
+
+    __slots__ = ("package", "label", "activity", "version", "terms", "label_words")
+
+    def __init__(self, package: str, activity: Optional[str], label: Optional[str] = None,
+                 version: Optional[str] = None):
+        self.package = package
+        self.activity = activity
+        self.version = version
+        self.label = label or KNOWN_LABELS.get(package) or self._derived_label()
+        # Searchable words with their weight: label > package > activity.
+        terms: dict[str, float] = {}
+        activity_class = (activity or "").rsplit("/", 1)[-1].rsplit(".", 1)[-1]
+        for words, weight in ((_words(activity_class), 0.5), (_words(package), 0.85), (_words(self.label), 1.0)):
+            for word in words:
+                if word not in _NOISE and len(word) > 1:
+                    terms[word] = max(terms.get(word, 0.0), weight)
+        label_words = _words(self.label)
+        if len(label_words) > 1:
+            terms["".join(label_words)] = 1.0
+        self.terms = terms
+        self.label_words = {word for word in label_words if word not in _NOISE and len(word) > 1}
+
+    def _derived_label(self) -> str:
+        # Drop the reverse-domain prefix: com.spotify.music -> "spotify music".
+        words = [word for word in _words(self.package)[1:] if word not in _NOISE]
+        return " ".join(words) if words else self.package
+
+    def describe(self) -> str:
+        return f"{self.package}: {self.label}"
+
+    def __repr__(self) -> str:
+        return f"<AppEntry {self.describe()}>"
+
+
+def parse_launcher_activities(output: str) -> dict[str, tuple[str, Optional[str]]]:
+    """
+    Parse `cmd package query-activities` output into
+    {package: (launcher component, non-localized label or None)}; first activity per package wins.
+    """
+    apps: dict[str, tuple[str, Optional[str]]] = {}
+    for block in re.split(r"\n\s*Activity #\d+:", "\n" + output):
+        name = re.search(r"ActivityInfo:\s+name=(\S+)", block)
+        package = re.search(r"packageName=(\S+)", block)
+        if not name or not package or package.group(1) in apps:
+            continue
+        label = re.search(r"nonLocalizedLabel=(.+?)\s+icon=", block)
+        label_text = label.group(1).strip() if label and label.group(1).strip() != "null" else None
+        activity = name.group(1)
+        short = activity[len(package.group(1)):] if activity.startswith(package.group(1) + ".") else activity
+        apps[package.group(1)] = (f"{package.group(1)}/{short}", label_text)
+    return apps
+
+
+def parse_package_versions(output: str) -> dict[str, str]:
+    """Parse `pm list packages --show-versioncode` into {package: versionCode}."""
+    versions = {}
+    for match in re.finditer(r"package:(\S+)(?:\s+versionCode:(\S+))?", output):
+        versions[match.group(1)] = match.group(2) or ""
+    return versions
+
+
+class AppIndex:
+    """
+    Launchable apps of one device, searchable by the words of a task.
+
+    `refresh()` lists package versions (one adb call) and re-queries launcher
+    activities only for packages that were added or updated since the last
+    refresh; the first refresh gets everything in a single batched call.
+    `search()` refreshes at most every `refresh_seconds`.
+    """
+
+    def __init__(self, serial: Optional[str] = None, shell: Optional[Callable[[str], str]] = None,
+                 refresh_seconds: float = settings.APP_INDEX_REFRESH_SECONDS):
+        self.serial = serial
+        self.refresh_seconds = refresh_seconds
+        self._shell = shell
+        self.apps: dict[str, AppEntry] = {}
+        self.versions: dict[str, str] = {}
+        self.refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def shell(self, command: str) -> str:
+        if self._shell is None:
+            import adbutils
+            client = adbutils.AdbClient(host=settings.ADB_SERVER_HOST, port=settings.ADB_SERVER_PORT)
+            device = client.device(self.serial)
+            self._shell = lambda cmd: device.shell(cmd, timeout=30)
+        return self._shell(command)
+
+    def refresh(self) -> dict[str, list[str]]:
+        """Bring the index up to date. Returns the packages {"added", "updated", "removed"}."""
+        with self._lock:
+            start = time.perf_counter()
+            if self.refreshed_at is None:
+                output = self.shell(f"{LAUNCHER_QUERY}; echo {_PACKAGES_MARKER}; pm list packages --show-versioncode")
+                activities, _, packages = output.partition(_PACKAGES_MARKER)
+                versions = parse_package_versions(packages)
+                changed = {"added": sorted(versions), "updated": [], "removed": []}
+                launchers = parse_launcher_activities(activities)
+            else:
+                versions = parse_package_versions(self.shell("pm list packages --show-versioncode"))
+                changed = {
+                    "added": sorted(set(versions) - set(self.versions)),
+                    "updated": sorted(p for p in versions if p in self.versions and versions[p] != self.versions[p]),
+                    "removed": sorted(set(self.versions) - set(versions)),
+                }
+                stale = changed["added"] + changed["updated"]
+                launchers = parse_launcher_activities(
+                    self.shell("; ".join(f"{LAUNCHER_QUERY} -p {package}" for package in stale))
+                ) if stale else {}
+
+            for package in changed["removed"] + changed["updated"]:
+                self.apps.pop(package, None)
+            for package, (activity, label) in launchers.items():
+                self.apps[package] = AppEntry(package, activity, label, versions.get(package))
+            self.versions = versions
+            self.refreshed_at = time.monotonic()
+            if any(changed.values()):
+                print(f"App index: {len(self.apps)} launchable apps, {len(changed['added'])} added, "
+                      f"{len(changed['updated'])} updated, {len(changed['removed'])} removed "
+                      f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+            return changed
+
+    def ensure_fresh(self) -> None:
+        if self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.refresh_seconds:
+            self.refresh()
+
+    def search(self, text: str, k: int = settings.APP_INDEX_TOP_K) -> list[tuple[AppEntry, float]]:
+        """
+        The `k` apps that best match `text`, best first, with scores in [0, 1].
+        A word that names the app (label, package or activity word, exactly or
+        fuzzily) scores up to 1; capability words ("email", "selfie") at most 0.5.
+        Apps whose label the task only partly names score lower, and each further
+        word the task shares with the app adds 0.1, so "YouTube Music" prefers
+        the music app and "YouTube" the video one.
+        """
+        self.ensure_fresh()
+        # query -> (weight, kind): whole words, their camelCase parts ("WhatsApp" ->
+        # "whats", "app"), adjacent pairs (multi-word labels typed as one word and
+        # vice versa, exact matches only) and capability hints.
+        queries: dict[str, tuple[float, str]] = {}
+        for word in _words(text, camel_case=False):
+            queries.setdefault(word, (1.0, "word"))
+        all_words = _words(text)
+        for word in all_words:
+            queries.setdefault(word, (1.0, "part"))
+        for a, b in zip(all_words, all_words[1:]):
+            queries.setdefault(a + b, (1.0, "pair"))
+        for word in list(queries):
+            for hint in CAPABILITY_HINTS.get(word.rstrip("s"), ()):
+                queries.setdefault(hint, (0.5, "hint"))
+        queries = {query: spec for query, spec in queries.items() if query not in _STOPWORDS}
+
+        scored = []
+        for app in self.apps.values():
+            best = 0.0
+            named: set[str] = set()
+            naming_queries: set[str] = set()
+            for query, (query_weight, kind) in queries.items():
+                for term, term_weight in app.terms.items():
+                    if query[0] != term[0]:
+                        continue
+                    if query == term:
+                        similarity = 1.0
+                    elif kind == "pair":
+                        continue
+                    elif len(query) >= 4 and len(term) >= 4 and (term.startswith(query) or query.startswith(term)):
+                        similarity = 0.85
+                    elif len(query) >= 4 and abs(len(query) - len(term)) <= 2:
+                        ratio = SequenceMatcher(None, query, term).ratio()
+                        similarity = ratio * 0.9 if ratio >= 0.8 else 0.0
+                    else:
+                        continue
+                    best = max(best, similarity * term_weight * query_weight)
+                    if similarity >= 0.8 and kind != "hint":
+                        named.add(term)
+                        if kind != "part":
+                            naming_queries.add(query)
+            if best > 0:
+                coverage = len(named & app.label_words) / len(app.label_words) if app.label_words else 1.0
+                score = best * (0.7 + 0.3 * coverage) + 0.1 * min(2, max(0, len(naming_queries) - 1))
+                scored.append((app, round(score, 3)))
+        scored.sort(key=lambda item: (-item[1], item[0].package))
+        return scored[:k]
+
+    def resolve(self, text: str, min_score: float = settings.APP_INDEX_MIN_SCORE,
+                min_margin: float = settings.APP_INDEX_MIN_MARGIN) -> Optional[AppEntry]:
+        """The app `text` unambiguously names, or None if there is no clear winner."""
+        matches = self.search(text, k=2)
+        if not matches or matches[0][1] < min_score:
+            return None
+        if len(matches) > 1 and matches[0][1] - matches[1][1] < min_margin:
+            return None
+        return matches[0][0]
+
+
+_indexes: dict[Optional[str], AppIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def app_index(serial: Optional[str] = None) -> AppIndex:
+    """The shared AppIndex of device `serial` (the only attached device if None)."""
+    with _indexes_lock:
+        if serial not in _indexes:
+            _indexes[serial] = AppIndex(serial)
+        return _indexes[serial]
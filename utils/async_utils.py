@@ -0,0 +1,41 @@
+# utils/async_utils.py
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the process-wide event loop, started on a daemon thread on first use.
+
+    The google-genai async client keeps pooled HTTP connections bound to the loop
+    that created them, so every agent call must run on the same long-lived loop
+    instead of a fresh `asyncio.run()` per step.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="agent-event-loop", daemon=True)
+            thread.start()
+        return _loop
+
+
+def submit_coroutine(coro: Coroutine[Any, Any, Any]) -> Future:
+    """Schedule a coroutine on the shared loop without waiting; cancelling the future cancels it."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+
+def run_coroutine(coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the shared loop from synchronous code and return its result."""
+    future = submit_coroutine(coro)
+    try:
+        return future.result(timeout=timeout)
+    except BaseException:
+        future.cancel()
+        raise
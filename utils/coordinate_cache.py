@@ -0,0 +1,189 @@
+# utils/coordinate_cache.py
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+from PIL import Image
+
+from utils.screen_fingerprint import compute_fingerprint, fingerprint_distance
+
+
+VERIFY_OFF = "off"
+VERIFY_PATCH = "patch"
+
+_FILLER_PATTERN = re.compile(r"^(return|get|find|fetch|extract)\s+(the\s+)?(screen\s+)?coordinates?\s+(of|for)\s+")
+_ARTICLES = {"the", "a", "an"}
+
+
+def normalize_expectation(expectation: str) -> str:
+    """
+    Reduce an orchestrator expectation to a stable element description, e.g.
+    "Return coordinates for 'the search input field'." -> "search input field".
+    """
+    text = expectation.lower().strip()
+    text = _FILLER_PATTERN.sub("", text)
+    text = re.sub(r"[^a-z0-9\s]", " ", text)
+    words = [w for w in text.split() if w not in _ARTICLES]
+    return " ".join(words)
+
+
+def patch_fingerprint(image: Image.Image, x: int, y: int, radius: int = 110) -> str:
+    """Fingerprint the square region around (x, y) used to verify cached hits."""
+    width, height = image.size
+    box = (
+        max(x - radius, 0),
+        max(y - radius, 0),
+        min(x + radius, width),
+        min(y + radius, height)
+    )
+    return compute_fingerprint(image.crop(box), hash_size=8, crop_top=0)
+
+
+class CoordinateCache:
+    """
+    Disk-backed (SQLite) cache of resolved element coordinates.
+
+    Entries are keyed by (app package, normalized element expectation) and matched
+    against the current screen fingerprint within `threshold` bits. In
+    VERIFY_PATCH mode a hit is only served when the image region around the
+    cached coordinates still looks like it did when the entry was stored.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = 7 * 24 * 3600, max_entries: int = 5000,
+                 threshold: int = 6, verify_mode: str = VERIFY_PATCH, patch_threshold: int = 10):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.verify_mode = verify_mode
+        self.patch_threshold = patch_threshold
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS coordinates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                app_package TEXT NOT NULL,
+                expectation TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                patch_fingerprint TEXT,
+                cell_numbers TEXT NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_coordinates_key ON coordinates (app_package, expectation)"
+        )
+        self.conn.commit()
+
+    def lookup(self, app_package: str, fingerprint: str, expectation: str,
+               image: Optional[Image.Image] = None) -> Optional[dict[str, Any]]:
+        """
+        Return {"id", "cell_numbers", "coordinates"} for a cached element on a
+        matching screen, or None on a miss.
+        """
+        key = normalize_expectation(expectation)
+        now = time.time()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, fingerprint, patch_fingerprint, cell_numbers, x, y FROM coordinates "
+                "WHERE app_package = ? AND expectation = ? AND created_at >= ?",
+                (app_package, key, now - self.ttl_seconds)
+            ).fetchall()
+
+            candidates = []
+            for row in rows:
+                distance = fingerprint_distance(fingerprint, row[1])
+                if distance <= self.threshold:
+                    candidates.append((distance, row))
+            candidates.sort(key=lambda item: item[0])
+
+            for _, (entry_id, _, stored_patch, cells, x, y) in candidates:
+                if self.verify_mode == VERIFY_PATCH and image is not None and stored_patch:
+                    current_patch = patch_fingerprint(image, x, y)
+                    if fingerprint_distance(current_patch, stored_patch) > self.patch_threshold:
+                        self.rejected += 1
+                        continue
+
+                self.conn.execute(
+                    "UPDATE coordinates SET last_used_at = ?, hits = hits + 1 WHERE id = ?",
+                    (now, entry_id)
+                )
+                self.conn.commit()
+                self.hits += 1
+                return {
+                    "id": entry_id,
+                    "cell_numbers": json.loads(cells),
+                    "coordinates": (x, y)
+                }
+
+            self.misses += 1
+            return None
+
+    def store(self, app_package: str, fingerprint: str, expectation: str, cell_numbers: List[int],
+              coordinates: Tuple[int, int], image: Optional[Image.Image] = None) -> int:
+        """Insert a resolved element and return its entry id."""
+        x, y = int(coordinates[0]), int(coordinates[1])
+        stored_patch = patch_fingerprint(image, x, y) if image is not None else None
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO coordinates (app_package, expectation, fingerprint, patch_fingerprint, "
+                "cell_numbers, x, y, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (app_package, normalize_expectation(expectation), fingerprint, stored_patch,
+                 json.dumps(cell_numbers), x, y, now, now)
+            )
+            self.conn.commit()
+            entry_id = cursor.lastrowid
+        self.evict()
+        return entry_id
+
+    def invalidate(self, entry_id: int) -> None:
+        """Remove an entry, e.g. after a tap at its coordinates failed."""
+        with self._lock:
+            self.conn.execute("DELETE FROM coordinates WHERE id = ?", (entry_id,))
+            self.conn.commit()
+
+    def evict(self) -> None:
+        """Drop expired entries, then the least recently used ones above max_entries."""
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM coordinates WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,)
+            )
+            self.conn.execute(
+                "DELETE FROM coordinates WHERE id NOT IN "
+                "(SELECT id FROM coordinates ORDER BY last_used_at DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the number of stored entries."""
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM coordinates").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected_by_verification": self.rejected,
+            "entries": entries
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
@@ -1,11 +1,12 @@
 import subprocess
-from typing import List
+from typing import List, Optional
 
 
-def get_installed_packages() -> List[str]:
-    """Lists all installed application packages using ADB."""
+def get_installed_packages(serial: Optional[str] = None) -> List[str]:
+    """Lists all installed application packages using ADB (on `serial` if several devices are attached)."""
     try:
-        result = subprocess.run(['adb', 'shell', 'pm', 'list', 'packages'], capture_output=True, text=True, check=True)
+        device = ['-s', serial] if serial else []
+        result = subprocess.run(['adb', *device, 'shell', 'pm', 'list', 'packages'], capture_output=True, text=True, check=True)
         return [line.split(':')[1].strip() for line in result.stdout.splitlines()]
     except Exception:
-        return []
\ No newline at end of file
+        return []
@@ -0,0 +1,189 @@
+# utils/hierarchy_locator.py
+
+import re
+import time
+from difflib import SequenceMatcher
+from typing import Optional, Tuple
+
+from lxml import etree
+
+from app.config import settings
+
+_BOUNDS = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+_WORDS = re.compile(r"[a-z0-9]+")
+_QUOTED = re.compile(r"[\"“'‘]([^\"”'’]{1,80})[\"”'’]")
+_CAMEL = re.compile(r"(?<=[a-z])(?=[A-Z])")
+# Scores are sums of floats; a margin of exactly min_margin must not fail on rounding.
+_MARGIN_TOLERANCE = 1e-6
+
+# Words in an expectation that describe the request rather than the element.
+STOPWORDS = frozenset("""
+    a an the this that of to for on in at into with and or return coordinates coordinate
+    element elements find locate tap click press select open enter type screen page current
+    position location where is which it its please next
+""".split())
+
+# Role words mapped to the widget classes that usually implement them.
+ROLE_CLASSES = {
+    "button": ("Button", "ImageButton", "FloatingActionButton"),
+    "field": ("EditText", "AutoCompleteTextView", "SearchView"),
+    "input": ("EditText", "AutoCompleteTextView", "SearchView"),
+    "box": ("EditText", "AutoCompleteTextView", "SearchView"),
+    "icon": ("ImageView", "ImageButton"),
+    "image": ("ImageView",),
+    "switch": ("Switch", "ToggleButton"),
+    "toggle": ("Switch", "ToggleButton"),
+    "checkbox": ("CheckBox",),
+    "tab": ("TabWidget", "TabView", "TabLayout"),
+}
+
+
+def parse_bounds(bounds: str) -> Optional[Tuple[int, int, int, int]]:
+    """Parse UiAutomator2 bounds "[x1,y1][x2,y2]" into a tuple, or None."""
+    match = _BOUNDS.fullmatch(bounds or "")
+    return tuple(int(v) for v in match.groups()) if match else None
+
+
+def _words(text: str) -> list[str]:
+    return _WORDS.findall(_CAMEL.sub(" ", text or "").lower())
+
+
+class UiElement:
+    """One on-screen node of the accessibility hierarchy."""
+    __slots__ = ("text", "content_desc", "resource_id", "class_name", "bounds",
+                 "clickable", "label", "words")
+
+    def __init__(self, node):
+        self.text = (node.get("text") or "").strip()
+        self.content_desc = (node.get("content-desc") or "").strip()
+        self.resource_id = node.get("resource-id") or ""
+        self.class_name = node.get("class") or node.tag
+        self.bounds = parse_bounds(node.get("bounds"))
+        self.clickable = node.get("clickable") == "true"
+        id_name = self.resource_id.rsplit("/", 1)[-1].replace("_", " ")
+        self.label = " ".join(part for part in (self.text, self.content_desc, id_name) if part)
+        self.words = set(_words(self.label))
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        x1, y1, x2, y2 = self.bounds
+        return (x1 + x2) // 2, (y1 + y2) // 2
+
+    def describe(self) -> str:
+        name = self.text or self.content_desc or self.resource_id or "element"
+        return f"{self.class_name.rsplit('.', 1)[-1]} '{name}' at {self.bounds}"
+
+
+class HierarchyIndex:
+    """
+    Index of the visible, labelled nodes of a UiAutomator2 page source.
+    Built once per screen; lookups are pure Python over a few hundred nodes.
+    """
+
+    def __init__(self, xml: str | bytes):
+        if isinstance(xml, str):
+            xml = xml.encode("utf-8")
+        root = etree.fromstring(xml, parser=etree.XMLParser(recover=True, huge_tree=True))
+        self.elements: list[UiElement] = []
+        self._by_word: dict[str, list[int]] = {}
+        for node in root.iter():
+            if node.get("bounds") is None or node.get("displayed") == "false":
+                continue
+            element = UiElement(node)
+            if element.bounds is None or not element.label:
+                continue
+            x1, y1, x2, y2 = element.bounds
+            if x2 <= x1 or y2 <= y1:
+                continue
+            for word in element.words:
+                self._by_word.setdefault(word, []).append(len(self.elements))
+            self.elements.append(element)
+
+    @staticmethod
+    def _is_exact(element: UiElement, phrases: list[str], words: set[str]) -> bool:
+        """Whether the element's text or content-desc is exactly the target label."""
+        names = [name for name in (element.text, element.content_desc) if name]
+        if phrases:
+            return any(phrase == name.lower() for phrase in phrases for name in names)
+        return bool(words) and any(set(_words(name)) == words for name in names)
+
+    def _score(self, element: UiElement, phrases: list[str], words: set[str], roles: set[str]) -> float:
+        label = element.label.lower()
+        score = 0.0
+        for phrase in phrases:
+            if phrase == element.text.lower() or phrase == element.content_desc.lower():
+                score = max(score, 1.0)
+            else:
+                score = max(score, SequenceMatcher(None, phrase, label).ratio() * (0.9 if phrase in label else 0.75))
+        if words:
+            overlap = len(words & element.words) / len(words)
+            score = max(score, overlap * 0.85)
+        if roles:
+            short_class = element.class_name.rsplit(".", 1)[-1]
+            if any(cls in short_class for role in roles for cls in ROLE_CLASSES[role]):
+                score += 0.1
+        if element.clickable:
+            score += 0.05
+        return min(score, 1.0)
+
+    def locate(self, expectation: str, min_score: float = settings.HIERARCHY_MIN_SCORE,
+               min_margin: float = settings.HIERARCHY_MIN_MARGIN) -> Optional[dict]:
+        """
+        Resolve a natural-language target (e.g. 'the "Send" button') to one element.
+
+        Quoted labels are matched exactly or fuzzily against text/content-desc;
+        the remaining words are matched against text, content-desc and the
+        resource-id name, with role words ("button", "field"...) favouring the
+        matching widget classes. An element whose text or content-desc is exactly
+        the target wins if it is the only one; otherwise returns None unless the
+        best match scores at least `min_score` and beats the runner-up by `min_margin`.
+        """
+        phrases = [p.strip().lower() for p in _QUOTED.findall(expectation) if p.strip()]
+        all_words = _words(expectation)
+        roles = {w for w in all_words if w in ROLE_CLASSES}
+        words = {w for w in all_words if w not in STOPWORDS and w not in ROLE_CLASSES}
+        if not phrases and not words:
+            return None
+
+        candidates = set()
+        for word in words | {w for phrase in phrases for w in _words(phrase)}:
+            candidates.update(self._by_word.get(word, ()))
+        if phrases:
+            # Fuzzy phrase matches may share no exact word with the label.
+            candidates = range(len(self.elements))
+
+        scored = sorted(
+            ((self._score(self.elements[i], phrases, words, roles), i) for i in candidates),
+            reverse=True
+        )
+        if not scored:
+            return None
+        exact = [(s, i) for s, i in scored if self._is_exact(self.elements[i], phrases, words)]
+        # A unique exact label beats near-misses like "Send feedback" for "Send".
+        unique_exact = bool(exact) and len({self.elements[i].bounds for _, i in exact}) == 1
+        best_score, best = exact[0] if unique_exact else scored[0]
+        element = self.elements[best]
+        runner_up = next((s for s, i in scored if self.elements[i].bounds != element.bounds), 0.0)
+        if best_score < min_score:
+            return None
+        if not unique_exact and best_score - runner_up < min_margin - _MARGIN_TOLERANCE:
+            return None
+        return {
+            "element": element,
+            "center": element.center,
+            "bounds": element.bounds,
+            "score": round(best_score, 3),
+            "runner_up": round(runner_up, 3)
+        }
+
+
+def locate_element(xml: str | bytes, expectation: str) -> Optional[dict]:
+    """Index a page source and resolve `expectation` in it, printing the lookup time."""
+    start = time.perf_counter()
+    match = HierarchyIndex(xml).locate(expectation)
+    elapsed = (time.perf_counter() - start) * 1000
+    if match:
+        print(f"Hierarchy locator: {match['element'].describe()} (score {match['score']}) in {elapsed:.1f} ms")
+    else:
+        print(f"Hierarchy locator: no confident match for '{expectation}' in {elapsed:.1f} ms")
+    return match
@@ -1,3 +1,11 @@
+from collections import deque
+from typing import Optional
+
+from app.chatroom import TRANSCRIPT_EXCLUDED_TYPES, ChatHistory
+from app.config import settings
+from utils.token_utils import estimate_tokens
+
+
 def get_recent_updates(history: list[dict], last_marker_type: str = "agent_selection") -> str:
     """
     Extracts messages from history after the last occurrence of a specified type (default: 'agent_selection').
@@ -11,11 +19,141 @@ def get_recent_updates(history: list[dict], last_marker_type: str = "agent_selec
         str: Formatted string of recent history entries.
     """
     last_index = 0
-    for i in reversed(range(len(history))):
-        if history[i]["type"] == last_marker_type:
-            last_index = i + 1
-            break
+    if isinstance(history, ChatHistory):
+        last_index = history.last_index(last_marker_type) + 1
+    else:
+        for i in reversed(range(len(history))):
+            if history[i]["type"] == last_marker_type:
+                last_index = i + 1
+                break
 
     recent = history[last_index:]
 
-    return recent
\ No newline at end of file
+    return recent
+
+
+# How many of the latest messages of each type stay in the compacted history no
+# matter how old they are.
+PINNED_FACTS = {
+    "task": 2,
+    "selected_application": 1,
+    "screen_coordinates": 1,
+    "error": 3,
+    "user_prompt": 1,
+}
+
+
+class HistoryCompactor:
+    """
+    Keeps an agent's view of the history within a token budget.
+
+    The last `recent_turns` turns (a turn starts at each `agent_selection`) are
+    kept verbatim. Older messages are folded, as they fall out of that window,
+    into a rolling digest of one-line entries, each condensed once and never
+    re-rendered. The latest facts of the PINNED_FACTS types (task, selected app,
+    coordinates, errors...) are always kept. When the whole view is over
+    `token_budget`, the oldest digest entries are dropped first and then the
+    longest recent messages are shortened, so the prompt stays roughly flat as a
+    run grows.
+    """
+
+    def __init__(self, token_budget: int, recent_turns: int = settings.HISTORY_RECENT_TURNS,
+                 marker_type: str = "agent_selection", line_chars: int = settings.HISTORY_DIGEST_LINE_CHARS,
+                 pinned: dict[str, int] = PINNED_FACTS):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.marker_type = marker_type
+        self.line_chars = line_chars
+        self.pinned_limits = pinned
+        self.reset()
+
+    def reset(self) -> None:
+        self._source: Optional[int] = None
+        self._seen = 0
+        self._recent: deque = deque()           # (position, message) kept verbatim
+        self._markers: deque = deque()          # positions of recent turn markers
+        self._digest: deque = deque()           # [line, repeat count, tokens]
+        self._digest_tokens = 0
+        self._dropped = 0
+        self._pinned: dict[str, deque] = {t: deque(maxlen=n) for t, n in self.pinned_limits.items()}
+
+    def _condense(self, msg) -> str:
+        content = " ".join(str(msg["content"]).split())
+        if len(content) > self.line_chars:
+            content = content[:self.line_chars - 3] + "..."
+        return f"[{msg['sender']}] ({msg['type']}): {content}"
+
+    def _to_digest(self, msg) -> None:
+        if msg["type"] in TRANSCRIPT_EXCLUDED_TYPES:
+            return
+        line = self._condense(msg)
+        if self._digest and self._digest[-1][0] == line:
+            self._digest[-1][1] += 1
+            return
+        tokens = estimate_tokens(line)
+        self._digest.append([line, 1, tokens])
+        self._digest_tokens += tokens
+
+    def update(self, history: list) -> None:
+        """Fold messages added since the last call into the digest and pinned facts."""
+        total = history.total if isinstance(history, ChatHistory) else len(history)
+        if self._source != id(history) or total < self._seen:
+            self.reset()
+            self._source = id(history)
+
+        if isinstance(history, ChatHistory):
+            # Messages evicted from memory since the last call are read back from the chat log.
+            new = history.evicted_since(self._seen) + history.since(self._seen)
+        else:
+            new = history[self._seen:]
+        for position, msg in enumerate(new, start=total - len(new)):
+            if msg["type"] == self.marker_type:
+                self._markers.append(position)
+            if msg["type"] in self._pinned:
+                self._pinned[msg["type"]].append(self._condense(msg))
+            self._recent.append((position, msg))
+        self._seen = total
+
+        while len(self._markers) > self.recent_turns:
+            self._markers.popleft()
+        start = self._markers[0] if len(self._markers) == self.recent_turns else 0
+        while self._recent and self._recent[0][0] < start:
+            self._to_digest(self._recent.popleft()[1])
+
+    def render(self, history: list) -> str:
+        """Pinned facts, the digest of older turns and the recent turns, within the token budget."""
+        self.update(history)
+
+        facts = [line for lines in self._pinned.values() for line in lines]
+        fact_text = "Key facts so far:\n" + "\n".join(f"- {line}" for line in facts) if facts else ""
+        recent = [msg for _, msg in self._recent if msg["type"] not in TRANSCRIPT_EXCLUDED_TYPES]
+        recent_lines = [f"[{msg['sender']}] ({msg['type']}): {msg['content']}" for msg in recent]
+
+        available = self.token_budget - estimate_tokens(fact_text) - sum(estimate_tokens(line) for line in recent_lines)
+        while self._digest and self._digest_tokens > max(available, 0):
+            self._digest_tokens -= self._digest.popleft()[2]
+            self._dropped += 1
+        if available < 0:
+            recent_lines = self._shorten(recent_lines, -available)
+
+        sections = [fact_text] if fact_text else []
+        if self._digest or self._dropped:
+            digest = [f"({self._dropped} older entries omitted)"] if self._dropped else []
+            digest += [line if count == 1 else f"{line} (x{count})" for line, count, _ in self._digest]
+            sections.append("Earlier steps (condensed):\n" + "\n".join(digest))
+        if recent_lines:
+            sections.append("Recent steps:\n" + "\n".join(recent_lines))
+        return "\n\n".join(sections)
+
+    def _shorten(self, lines: list[str], excess_tokens: int) -> list[str]:
+        """Trim the longest lines until about `excess_tokens` have been removed."""
+        lines = list(lines)
+        excess_chars = excess_tokens * 4
+        for i in sorted(range(len(lines)), key=lambda i: len(lines[i]), reverse=True):
+            if excess_chars <= 0:
+                break
+            keep = max(self.line_chars, len(lines[i]) - excess_chars)
+            if keep < len(lines[i]):
+                excess_chars -= len(lines[i]) - keep
+                lines[i] = lines[i][:keep - 3] + "..."
+        return lines
@@ -0,0 +1,140 @@
+# utils/image_prep.py
+
+import io
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+from PIL import Image, features
+
+FORMATS = {"png": ("PNG", "image/png"), "jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+
+class ImagePolicy:
+    """
+    How an agent's images are prepared before a vision call: downscaled so the
+    long edge is at most `max_long_edge` (0 keeps the size) and encoded as
+    png, jpeg or webp. `lossless` keeps webp lossless (png always is); use it
+    for images whose fine detail matters, like grid labels.
+    """
+
+    def __init__(self, name: str, max_long_edge: int = 0, format: str = "png", quality: int = 85,
+                 lossless: bool = False):
+        format = format.lower().replace("jpg", "jpeg")
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported image format '{format}' (use one of {', '.join(FORMATS)})")
+        if lossless and format == "jpeg":
+            raise ValueError(f"Image policy '{name}' must be lossless; use png or webp instead of jpeg")
+        if format == "webp" and not features.check("webp"):
+            print(f"Pillow has no WebP support; image policy '{name}' falls back to {'png' if lossless else 'jpeg'}")
+            format = "png" if lossless else "jpeg"
+        self.name = name
+        self.max_long_edge = max_long_edge
+        self.format = format
+        self.quality = quality
+        self.lossless = lossless or format == "png"
+
+    @property
+    def key(self) -> str:
+        """Identifies what this policy sends (part of response cache keys)."""
+        quality = "lossless" if self.lossless else f"q{self.quality}"
+        return f"{self.format}:{self.max_long_edge}:{quality}"
+
+    def __repr__(self) -> str:
+        return f"ImagePolicy({self.name!r}, {self.key})"
+
+
+# What the SDK sends for a PIL image: the full-size frame as PNG.
+ORIGINAL = ImagePolicy("original")
+
+
+class PreparedImage:
+    """Encoded image bytes as sent to the model, with the size of the frame they came from."""
+
+    def __init__(self, data: bytes, mime_type: str, size: Tuple[int, int], source_size: Tuple[int, int],
+                 policy: ImagePolicy, encode_seconds: float):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.source_size = source_size
+        self.policy = policy
+        self.encode_seconds = encode_seconds
+
+    def __repr__(self) -> str:
+        return (f"<PreparedImage {self.policy.name}: {self.source_size[0]}x{self.source_size[1]} -> "
+                f"{self.size[0]}x{self.size[1]} {self.mime_type}, {len(self.data)} bytes>")
+
+
+def target_size(size: Tuple[int, int], max_long_edge: int) -> Tuple[int, int]:
+    """`size` scaled down to fit `max_long_edge` on its long side (never scaled up)."""
+    width, height = size
+    long_edge = max(width, height)
+    if not max_long_edge or long_edge <= max_long_edge:
+        return size
+    scale = max_long_edge / long_edge
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def prepare_image(image: Image.Image, policy: ImagePolicy = ORIGINAL) -> PreparedImage:
+    """Downscale and encode `image` according to `policy`."""
+    start = time.perf_counter()
+    size = target_size(image.size, policy.max_long_edge)
+    # Area averaging (BOX) keeps text and grid lines readable and is the cheapest filter for downscaling.
+    prepared = image if size == image.size else image.resize(size, Image.Resampling.BOX)
+
+    pil_format, mime_type = FORMATS[policy.format]
+    options: dict[str, Any] = {}
+    if policy.format == "jpeg":
+        prepared = prepared.convert("RGB") if prepared.mode != "RGB" else prepared
+        options = {"quality": policy.quality, "optimize": False}
+    elif policy.format == "webp":
+        options = {"lossless": True, "quality": 0, "method": 0} if policy.lossless else {"quality": policy.quality}
+
+    buffer = io.BytesIO()
+    prepared.save(buffer, format=pil_format, **options)
+    return PreparedImage(buffer.getvalue(), mime_type, size, image.size, policy, time.perf_counter() - start)
+
+
+class ImagePrepStats:
+    """Images sent per policy: bytes uploaded, encode time and the latency of the model calls carrying them."""
+
+    FIELDS = ("calls", "bytes", "source_pixels", "sent_pixels", "encode_seconds", "model_seconds")
+
+    def __init__(self):
+        self._policies: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, prepared: PreparedImage, model_seconds: Optional[float]) -> None:
+        with self._lock:
+            stats = self._policies.setdefault(prepared.policy.name, dict.fromkeys(self.FIELDS, 0))
+            stats["calls"] += 1
+            stats["bytes"] += len(prepared.data)
+            stats["source_pixels"] += prepared.source_size[0] * prepared.source_size[1]
+            stats["sent_pixels"] += prepared.size[0] * prepared.size[1]
+            stats["encode_seconds"] += prepared.encode_seconds
+            stats["model_seconds"] += model_seconds or 0.0
+            stats["policy"] = prepared.policy.key
+
+    def snapshot(self) -> dict[str, dict]:
+        """Per policy: calls, mean KB sent, pixel reduction, mean encode and model latency (ms)."""
+        with self._lock:
+            policies = {name: dict(stats) for name, stats in self._policies.items()}
+        return {
+            name: {
+                "policy": stats["policy"],
+                "calls": stats["calls"],
+                "mean_kb": round(stats["bytes"] / stats["calls"] / 1024, 1),
+                "total_kb": round(stats["bytes"] / 1024, 1),
+                "pixel_ratio": round(stats["sent_pixels"] / stats["source_pixels"], 3) if stats["source_pixels"] else 1.0,
+                "mean_encode_ms": round(stats["encode_seconds"] / stats["calls"] * 1000, 1),
+                "mean_model_ms": round(stats["model_seconds"] / stats["calls"] * 1000, 1)
+            }
+            for name, stats in policies.items()
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._policies.clear()
+
+
+image_prep_stats = ImagePrepStats()
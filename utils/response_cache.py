@@ -0,0 +1,203 @@
+# utils/response_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.config import settings
+
+STAT_FIELDS = ("memory_hits", "disk_hits", "misses", "stores", "bytes_saved", "tokens_saved")
+
+
+class CachePolicy:
+    """
+    How an agent's model responses are cached.
+
+    `ttl_seconds` and `max_entries` (per agent, on disk) bound what is kept;
+    chat turns depend on the session's history and are only cached when
+    `allow_chat` is set.
+    """
+
+    def __init__(self, enabled: bool = True, ttl_seconds: float = settings.RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries: int = settings.RESPONSE_CACHE_MAX_ENTRIES, allow_chat: bool = False):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.allow_chat = allow_chat
+
+    def __repr__(self) -> str:
+        return (f"CachePolicy(enabled={self.enabled}, ttl_seconds={self.ttl_seconds}, "
+                f"max_entries={self.max_entries}, allow_chat={self.allow_chat})")
+
+
+def image_fingerprint(image: Any) -> str:
+    """Exact content hash of a PIL image (mode, size and pixels), or of raw bytes."""
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(image, (bytes, bytearray)):
+        digest.update(image)
+    else:
+        digest.update(f"{image.mode}:{image.size}".encode("utf-8"))
+        digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def cache_key(model: str, system_instruction: Optional[str], prompt: str,
+              image: Optional[str] = None, schema: Optional[str] = None) -> str:
+    """Content address of one request: model, system instruction, prompt, image fingerprint and output schema."""
+    payload = json.dumps([model, system_instruction or "", prompt, image or "", schema or ""], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Model responses keyed by cache_key(), in a small in-memory LRU in front of
+    a SQLite table, so identical requests in retries and later runs are
+    answered without a model call.
+
+    Entries older than the agent's policy TTL are misses (and removed); each
+    agent keeps at most its policy's `max_entries` on disk, least recently used
+    first out.
+    """
+
+    def __init__(self, path: str = settings.RESPONSE_CACHE_PATH,
+                 memory_entries: int = settings.RESPONSE_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.memory: OrderedDict[str, tuple[str, float, int, int]] = OrderedDict()
+        self._stats: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                agent TEXT NOT NULL,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                output_tokens INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_agent ON responses (agent, last_used_at)")
+        self.conn.commit()
+
+    def _count(self, agent: str, field: str, amount: int = 1) -> None:
+        stats = self._stats.setdefault(agent, dict.fromkeys(STAT_FIELDS, 0))
+        stats[field] += amount
+
+    def get(self, key: str, agent: str, policy: CachePolicy) -> Optional[str]:
+        """The cached response text for `key`, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self.memory.get(key)
+            source = "memory_hits"
+            if entry is not None and now - entry[1] > policy.ttl_seconds:
+                del self.memory[key]
+                entry = None
+            if entry is None:
+                source = "disk_hits"
+                row = self.conn.execute(
+                    "SELECT response, created_at, prompt_tokens, output_tokens FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] > policy.ttl_seconds:
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.conn.commit()
+                    row = None
+                entry = tuple(row) if row is not None else None
+            if entry is None:
+                self._count(agent, "misses")
+                return None
+
+            text, _, prompt_tokens, output_tokens = entry
+            self._remember(key, entry)
+            self.conn.execute("UPDATE responses SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self.conn.commit()
+            self._count(agent, source)
+            self._count(agent, "bytes_saved", len(text.encode("utf-8")))
+            self._count(agent, "tokens_saved", prompt_tokens + output_tokens)
+            return text
+
+    def put(self, key: str, agent: str, model: str, text: str, policy: CachePolicy,
+            prompt_tokens: int = 0, output_tokens: int = 0) -> None:
+        """Store a response, then trim the agent's entries to the policy's max_entries."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, (text, now, prompt_tokens, output_tokens))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, agent, model, response, prompt_tokens, output_tokens, "
+                "created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, agent, model, text, prompt_tokens, output_tokens, now, now)
+            )
+            self.conn.execute(
+                "DELETE FROM responses WHERE agent = ? AND key NOT IN "
+                "(SELECT key FROM responses WHERE agent = ? ORDER BY last_used_at DESC LIMIT ?)",
+                (agent, agent, policy.max_entries)
+            )
+            self.conn.commit()
+            self._count(agent, "stores")
+
+    def _remember(self, key: str, entry: tuple) -> None:
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        """Remove an entry, e.g. a response that failed validation."""
+        with self._lock:
+            self.memory.pop(key, None)
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss counters, bytes and tokens saved (per agent and in total) and the number of stored entries."""
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            per_agent = {agent: dict(stats) for agent, stats in self._stats.items()}
+        totals = {field: sum(stats[field] for stats in per_agent.values()) for field in STAT_FIELDS}
+        lookups = totals["memory_hits"] + totals["disk_hits"] + totals["misses"]
+        totals["hit_rate"] = round((totals["memory_hits"] + totals["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return {**totals, "entries": entries, "agents": per_agent}
+
+    def clear(self) -> None:
+        with self._lock:
+            self.memory.clear()
+            self._stats.clear()
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def response_cache() -> Optional[ResponseCache]:
+    """The process-wide ResponseCache (opened on first use), or None if RESPONSE_CACHE_ENABLED is off."""
+    global _cache
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def cache_enabled_for(agent: str) -> bool:
+    """True if `agent` is in RESPONSE_CACHE_AGENTS (every agent if that is empty)."""
+    names = [name.strip() for name in settings.RESPONSE_CACHE_AGENTS.split(",") if name.strip()]
+    return not names or agent in names
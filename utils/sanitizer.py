@@ -1,6 +1,8 @@
 import re
 import json
 
+from agents.schemas import AppSelection, ResponseParseError, parse_model
+
 
 def sanitize_json(code_block: str) -> str:
     """
@@ -30,16 +32,14 @@ def is_valid_json(sanitized: str) -> bool:
 
 def sanitize_app_selection(selection: str) -> str:
     """
-    Sanitize the app selection string to extract package names.
-    Expected format: "com.example.app/.MainActivity" or "com.example.app"
-    Returns a package_name or None
+    Extract the package name from an ApplicationSelectorAgent response
+    (AppSelection JSON, optionally in a ```json block).
+    Returns a package_name, or None if there is none or the JSON is malformed.
     """
-    match = re.search(r"```(?:json)?\n(.*?)```", selection, re.DOTALL)
-    selection = match.group(1).strip() if match else selection.strip()
-    parsed = json.loads(selection)
-
-    package = parsed.get("package")
-    return package
+    try:
+        return parse_model(AppSelection, selection).package
+    except ResponseParseError:
+        return None
 
 
 if __name__ == "__main__":
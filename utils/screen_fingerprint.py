@@ -0,0 +1,157 @@
+# utils/screen_fingerprint.py
+
+import hashlib
+import io
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+from PIL import Image
+
+
+def _load_grayscale(image: Any) -> np.ndarray:
+    """Decode a screenshot (path, PNG bytes or PIL image) into a float32 grayscale array."""
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("L"), dtype=np.float32)
+    if isinstance(image, (bytes, bytearray)):
+        image = io.BytesIO(image)
+    with Image.open(image) as img:
+        return np.asarray(img.convert("L"), dtype=np.float32)
+
+
+def downsample_tiles(gray: np.ndarray, rows: int, cols: int) -> np.ndarray:
+    """
+    Average a grayscale array into a rows x cols grid of tile means.
+    Edge pixels that do not fill a whole tile are dropped.
+    """
+    height, width = gray.shape
+    tile_h = max(height // rows, 1)
+    tile_w = max(width // cols, 1)
+    trimmed = gray[:tile_h * rows, :tile_w * cols]
+    return trimmed.reshape(rows, tile_h, cols, tile_w).mean(axis=(1, 3))
+
+
+def compute_fingerprint(image: Any, hash_size: int = 16, crop_top: float = 0.04) -> str:
+    """
+    Compute a difference hash (dHash) of a screenshot.
+
+    The image is reduced to a (hash_size + 1) x (hash_size + 1) grid of tile means.
+    Each bit records whether a tile is brighter than its right-hand neighbour
+    (horizontal pass) or the one below it (vertical pass), so changes along
+    either axis move the fingerprint.
+    The top `crop_top` fraction (status bar: clock, battery) is ignored so that
+    it does not change the fingerprint of an otherwise identical screen.
+
+    Returns:
+        Hex string of 2 * hash_size * hash_size bits.
+    """
+    gray = _load_grayscale(image)
+    skip = int(gray.shape[0] * crop_top)
+    tiles = downsample_tiles(gray[skip:], hash_size + 1, hash_size + 1)
+    horizontal = tiles[:-1, 1:] > tiles[:-1, :-1]
+    vertical = tiles[1:, :-1] > tiles[:-1, :-1]
+    bits = np.concatenate([horizontal.flatten(), vertical.flatten()])
+    return np.packbits(bits).tobytes().hex()
+
+
+def content_hash(image: Any, crop_top: float = 0.04) -> str:
+    """
+    Exact hash of a screenshot's grayscale pixels below the status bar. Unlike
+    the fingerprint, any visible change (one typed character, a badge count)
+    changes it.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        image = io.BytesIO(image)
+    with (image if isinstance(image, Image.Image) else Image.open(image)) as img:
+        gray = np.asarray(img.convert("L"))
+    return hashlib.blake2b(gray[int(gray.shape[0] * crop_top):].tobytes(), digest_size=16).hexdigest()
+
+
+def fingerprint_distance(a: str, b: str) -> int:
+    """Hamming distance between two fingerprints of the same size."""
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def low_res_frame(image: Any, factor: int = 8, crop_top: float = 0.04) -> np.ndarray:
+    """Grayscale frame shrunk `factor` times per side, status bar cropped, for cheap change detection."""
+    if isinstance(image, (bytes, bytearray)):
+        image = io.BytesIO(image)
+    with (image if isinstance(image, Image.Image) else Image.open(image)) as img:
+        small = img.convert("L").reduce(max(int(factor), 1))
+    gray = np.asarray(small, dtype=np.int16)
+    return gray[int(gray.shape[0] * crop_top):]
+
+
+def frame_change_ratio(a: np.ndarray, b: np.ndarray, pixel_delta: int = 12) -> float:
+    """Fraction of pixels that differ by more than `pixel_delta` grey levels (1.0 if sizes differ)."""
+    if a.shape != b.shape:
+        return 1.0
+    return float(np.count_nonzero(np.abs(a - b) > pixel_delta)) / a.size
+
+
+class ScreenSummaryCache:
+    """
+    LRU cache of page summaries keyed by screen fingerprint plus task/expectation.
+
+    A lookup hits when an entry with the same task and expectation exists whose
+    fingerprint is within `threshold` bits of the requested one and, if `exact`,
+    whose content hash equals the requested one. The fingerprint alone misses
+    small changes that matter to the planner (a toggled checkbox or a typed
+    character moves it by a bit or two, a badge count often not at all).
+    """
+
+    def __init__(self, max_entries: int = 64, threshold: int = 0, exact: bool = True):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.exact = exact
+        self.entries: OrderedDict[tuple[str, str, str], tuple[Optional[str], str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint: str, task: str, expectation: str, content: Optional[str] = None) -> Optional[str]:
+        """Return a cached summary for a similar (or, if exact, identical) screen, or None."""
+        best_key = None
+        best_distance = self.threshold + 1
+        for key, (cached_content, _) in self.entries.items():
+            cached_fp, cached_task, cached_expectation = key
+            if cached_task != task or cached_expectation != expectation:
+                continue
+            if self.exact and cached_content != content:
+                continue
+            distance = fingerprint_distance(fingerprint, cached_fp)
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+                if distance == 0:
+                    break
+
+        if best_key is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(best_key)
+        return self.entries[best_key][1]
+
+    def put(self, fingerprint: str, task: str, expectation: str, summary: str,
+            content: Optional[str] = None) -> None:
+        """Store a summary (with the screen's content hash), evicting the least recently used entry when full."""
+        key = (fingerprint, task, expectation)
+        self.entries[key] = (content, summary)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,249 @@
+# utils/screenshot.py
+
+import io
+import os
+import struct
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Optional, Tuple
+
+from PIL import Image
+
+from utils.screen_fingerprint import compute_fingerprint, content_hash
+
+
+_writer: Optional[ThreadPoolExecutor] = None
+_writer_lock = threading.Lock()
+_pending: set[Future] = set()
+
+
+def _get_writer() -> ThreadPoolExecutor:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screenshot-writer")
+        return _writer
+
+
+def _submit_write(fn, *args) -> Future:
+    future = _get_writer().submit(fn, *args)
+    with _writer_lock:
+        _pending.add(future)
+    future.add_done_callback(_discard_pending)
+    return future
+
+
+def _discard_pending(future: Future) -> None:
+    with _writer_lock:
+        _pending.discard(future)
+    if future.exception():
+        print(f"Background image write failed: {future.exception()}")
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _write_image(path: str, image: Image.Image) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    image.save(path)
+
+
+def save_image_async(image: Image.Image, path: str) -> Future:
+    """Save a PIL image on the background writer thread."""
+    return _submit_write(_write_image, path, image)
+
+
+def wait_for_pending_writes(timeout: Optional[float] = None) -> None:
+    """Block until every queued screenshot/debug image write has finished."""
+    with _writer_lock:
+        pending = list(_pending)
+    for future in pending:
+        try:
+            future.result(timeout=timeout)
+        except Exception:
+            pass
+
+
+def png_dimensions(png: bytes) -> Tuple[int, int]:
+    """Read (width, height) from the PNG IHDR chunk without decoding pixels."""
+    if png[:8] != b"\x89PNG\r\n\x1a\n" or png[12:16] != b"IHDR":
+        raise ValueError("Not a PNG image")
+    return struct.unpack(">II", png[16:24])
+
+
+class Screenshot:
+    """
+    A single captured frame shared by reference across the chatroom and agents.
+
+    Holds the raw PNG bytes from the device and decodes them at most once, on first
+    access to `image`. Writing to disk is optional and happens on a background
+    thread. `release()` frees the pixels and bytes when the frame is no longer
+    the current screen (a persisted frame can still be re-read from disk).
+    `hierarchy` is the accessibility tree of the frame, if any; a loader attached
+    with `defer_hierarchy()` fetches it on first access instead of at capture.
+    """
+
+    def __init__(self, png: Optional[bytes] = None, path: Optional[str] = None,
+                 image: Optional[Image.Image] = None, timestamp: Optional[str] = None,
+                 hierarchy: Optional[str] = None):
+        if png is None and path is None and image is None:
+            raise ValueError("Screenshot needs PNG bytes, a file path or an image.")
+        self._png = png
+        self._image = image
+        self._fingerprint: Optional[str] = None
+        self._content_hash: Optional[str] = None
+        self._size: Optional[Tuple[int, int]] = image.size if image is not None else None
+        self._lock = threading.Lock()
+        self._write: Optional[Future] = None
+        self._hierarchy = hierarchy
+        self._hierarchy_loader: Optional[Callable[["Screenshot"], Optional[str]]] = None
+        self.path = path
+        self.timestamp = timestamp or datetime.now().isoformat()
+        self.released = False
+
+    @classmethod
+    def from_file(cls, path: str) -> "Screenshot":
+        return cls(path=path)
+
+    @property
+    def png(self) -> bytes:
+        """Raw PNG bytes, re-read from disk or re-encoded if they were released."""
+        with self._lock:
+            if self._png is not None:
+                return self._png
+            if self.path and os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    return f.read()
+            if self._image is not None:
+                buffer = io.BytesIO()
+                self._image.save(buffer, format="PNG")
+                return buffer.getvalue()
+        raise ValueError("Screenshot has been released and was never persisted.")
+
+    @property
+    def image(self) -> Image.Image:
+        """Decoded PIL image, shared by every consumer of this frame. Do not mutate it."""
+        with self._lock:
+            if self._image is None:
+                if self._png is not None:
+                    source = io.BytesIO(self._png)
+                elif self.path:
+                    source = self.path
+                else:
+                    raise ValueError("Screenshot has been released and was never persisted.")
+                with Image.open(source) as img:
+                    img.load()
+                    self._image = img.copy() if img.mode in ("RGB", "RGBA") else img.convert("RGB")
+                self._size = self._image.size
+                self.released = False
+            return self._image
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height), read from the PNG header when pixels are not decoded yet."""
+        if self._size is None:
+            if self._png is not None:
+                self._size = png_dimensions(self._png)
+            else:
+                self._size = self.image.size
+        return self._size
+
+    @property
+    def fingerprint(self) -> str:
+        """Perceptual fingerprint of the frame, computed once."""
+        if self._fingerprint is None:
+            self._fingerprint = compute_fingerprint(self.image)
+        return self._fingerprint
+
+    @property
+    def content_hash(self) -> str:
+        """Exact hash of the frame below the status bar, computed once."""
+        if self._content_hash is None:
+            self._content_hash = content_hash(self.image)
+        return self._content_hash
+
+    @property
+    def hierarchy(self) -> Optional[str]:
+        """The frame's view hierarchy, loaded on first access if it was deferred."""
+        loader, self._hierarchy_loader = self._hierarchy_loader, None
+        if loader is not None and self._hierarchy is None:
+            self._hierarchy = loader(self)
+        return self._hierarchy
+
+    @hierarchy.setter
+    def hierarchy(self, value: Optional[str]) -> None:
+        self._hierarchy_loader = None
+        self._hierarchy = value
+
+    def defer_hierarchy(self, loader: Callable[["Screenshot"], Optional[str]]) -> None:
+        """Fetch the hierarchy with `loader(frame)` only if someone reads it (None if it cannot match the frame)."""
+        self._hierarchy_loader = loader
+
+    @property
+    def source(self) -> Any:
+        """Cheapest decodable form of the frame: the PNG bytes if held, else the decoded image."""
+        if self._png is not None:
+            return self._png
+        if self._image is not None:
+            return self._image
+        return self.png
+
+    def persist(self, path: str) -> Future:
+        """Write the PNG to `path` on the background writer thread (encoding there if needed)."""
+        self.path = path
+        if self._png is None and self._image is not None:
+            self._write = _submit_write(_write_image, path, self._image)
+        else:
+            self._write = _submit_write(_write_bytes, path, self.png)
+        return self._write
+
+    @property
+    def persisted(self) -> bool:
+        return self._write is not None and self._write.done() and self._write.exception() is None
+
+    def release(self) -> None:
+        """
+        Free the frame once it is no longer the current screen: decoded pixels and
+        PNG bytes are dropped, and re-read from disk if the frame was persisted.
+        A frame never persisted cannot be read afterwards (`png` and `image` raise
+        ValueError); one still being written keeps its data until the write is done.
+        """
+        with self._lock:
+            # Keep the size for __str__, which chat history renders long after the release.
+            if self._size is None and self._png is not None:
+                self._size = png_dimensions(self._png)
+            elif self._size is None and self._image is not None:
+                self._size = self._image.size
+            self._hierarchy = self._hierarchy_loader = None
+            if self._write is None or self.persisted:
+                self._png = None
+                self._image = None
+            # Frames captured as raw pixels (no PNG) keep them until they are on disk.
+            elif self._png is not None:
+                self._image = None
+            self.released = True
+
+    def __str__(self) -> str:
+        if self.path:
+            return self.path
+        width, height = self.size
+        return f"<screenshot {width}x{height} {self.timestamp}>"
+
+    __repr__ = __str__
+
+
+def load_screenshot(source: Any) -> Screenshot:
+    """Wrap a screenshot given as a Screenshot, file path, PNG bytes or PIL image."""
+    if isinstance(source, Screenshot):
+        return source
+    if isinstance(source, Image.Image):
+        return Screenshot(image=source)
+    if isinstance(source, (bytes, bytearray)):
+        return Screenshot(png=bytes(source))
+    if isinstance(source, str):
+        return Screenshot.from_file(source)
+    raise TypeError(f"Unsupported screenshot source: {type(source).__name__}")
@@ -1,13 +1,96 @@
-from google import genai
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Iterable, Optional
+
 from app.config import settings
 
-client = genai.Client(api_key=settings.GOOGLE_API_KEY_TOKENIZER)
+if TYPE_CHECKING:
+    from google import genai
 
 DEFAULT_MODEL = settings.DEFAULT_MODEL
 
+_client: Optional["genai.Client"] = None
+_client_lock = threading.Lock()
+
+
+def _get_client() -> "genai.Client":
+    """Create the tokenizer client on first remote call, so importing this module is free."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from google import genai
+            _client = genai.Client(api_key=settings.GOOGLE_API_KEY_TOKENIZER)
+        return _client
+
+
+# Pieces the estimator scores separately: letter runs, single digits, runs of
+# non-ASCII characters, newlines and other symbols. Plain spaces fold into the
+# following word, as they do in Gemini's SentencePiece vocabulary.
+_PIECES = re.compile(r"[A-Za-z]+|\d|[^\x00-\x7f]+|\n+|[^\sA-Za-z\d]")
+
+# Per-model multiplier applied to the raw estimate; `record_prompt_usage()` fits
+# it to the prompt token counts the API reports, `calibrate()` to the remote tokenizer.
+_scale: dict[str, float] = {}
+# Per model: [raw estimate, reported tokens] summed over the prompts seen so far.
+_observed: dict[str, list[float]] = {}
+# Reported prompt tokens needed before the first fit, and the drift that triggers a refit.
+_FIT_MIN_TOKENS = 2000
+_FIT_DRIFT = 0.05
+
+_cache: "OrderedDict[tuple[bytes, str], int]" = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 4096
+
+
+def _content_key(text: str, model: str) -> tuple[bytes, str]:
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest(), model
+
+
+def _raw_estimate(text: str) -> float:
+    tokens = 0.0
+    for piece in _PIECES.findall(text):
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            # Common words are one token; longer or rarer words split every ~4 letters.
+            tokens += 1 if len(piece) <= 7 else math.ceil(len(piece) / 4)
+        elif not first.isascii():
+            # CJK and most other scripts: close to one token per character.
+            tokens += len(piece) * 0.9
+        else:
+            tokens += 1
+    return tokens
+
+
+def estimate_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """
+    Offline token estimate for `text`, memoized by content hash.
+    Scaled by TOKEN_ESTIMATE_SCALE until record_prompt_usage() (fed by every
+    text-only agent call) or calibrate() has fitted a scale for `model`.
+    """
+    if not text:
+        return 0
+    key = _content_key(text, model)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    estimate = max(1, round(_raw_estimate(text) * _scale.get(model, settings.TOKEN_ESTIMATE_SCALE)))
+
+    with _cache_lock:
+        _cache[key] = estimate
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return estimate
+
+
 def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
     """
-    Count tokens used by a string for a given model.
+    Count tokens used by a string for a given model with the remote tokenizer.
+    Prefer estimate_tokens() unless an exact number is required.
 
     Args:
         text: Input text
@@ -17,7 +100,7 @@ def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
         Number of tokens (int)
     """
     try:
-        response = client.models.count_tokens(
+        response = _get_client().models.count_tokens(
             model=model,
             contents=text
         )
@@ -27,34 +110,94 @@ def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
         return 0
 
 
-def trim_text_to_tokens(text: str, max_tokens: int, model: str = DEFAULT_MODEL) -> str:
+def _set_scale(model: str, scale: float) -> None:
+    _scale[model] = scale
+    with _cache_lock:
+        for key in [key for key in _cache if key[1] == model]:
+            del _cache[key]
+
+
+def record_prompt_usage(text: str, prompt_tokens: int, model: str = DEFAULT_MODEL) -> None:
+    """
+    Fit the estimator to the prompt token count the API reported for `text`
+    (usage_metadata.prompt_token_count), without any extra call. The scale is
+    fitted on the running totals once _FIT_MIN_TOKENS have been reported, and
+    refitted whenever it drifts by more than _FIT_DRIFT.
+    """
+    if not text or not prompt_tokens:
+        return
+    estimated = _raw_estimate(text)
+    with _cache_lock:
+        totals = _observed.setdefault(model, [0.0, 0.0])
+        totals[0] += estimated
+        totals[1] += prompt_tokens
+        if totals[1] < _FIT_MIN_TOKENS or not totals[0]:
+            return
+        scale = totals[1] / totals[0]
+    current = _scale.get(model, settings.TOKEN_ESTIMATE_SCALE)
+    if abs(scale - current) > _FIT_DRIFT * current:
+        _set_scale(model, scale)
+
+
+def calibrate(samples: Iterable[str], model: str = DEFAULT_MODEL) -> float:
+    """
+    Fit the estimator to the remote tokenizer with one count_tokens call per sample.
+    Returns the new scale for `model`.
+    """
+    estimated = actual = 0.0
+    for text in samples:
+        counted = count_tokens(text, model)
+        if counted:
+            estimated += _raw_estimate(text)
+            actual += counted
+    if estimated:
+        _set_scale(model, actual / estimated)
+    return _scale.get(model, settings.TOKEN_ESTIMATE_SCALE)
+
+
+def trim_text_to_tokens(text: str, max_tokens: int, model: str = DEFAULT_MODEL,
+                        verify: bool = False) -> str:
     """
     Trim text safely so that it fits within token limits.
 
+    Binary-searches the longest word prefix whose estimate fits. With `verify`,
+    the result is checked once against the remote tokenizer and cut
+    proportionally if the estimate was too optimistic.
+
     Args:
         text: Full text to trim
         max_tokens: Token threshold
         model: Gemini model
+        verify: Confirm the result with a single remote count
 
     Returns:
         Trimmed text
     """
+    if estimate_tokens(text, model) <= max_tokens and not verify:
+        return text
+
     words = text.split()
-    step = 100
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(" ".join(words[:mid]), model) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    trimmed = " ".join(words[:low])
 
-    while count_tokens(" ".join(words), model) > max_tokens:
-        words = words[:-step]
-        if len(words) <= step:
-            break
-        if step > 10:
-            step = step // 2 
+    if verify and trimmed:
+        actual = count_tokens(trimmed, model)
+        if actual > max_tokens:
+            keep = int(low * max_tokens / actual)
+            trimmed = " ".join(words[:keep])
 
-    return " ".join(words)
+    return trimmed
 
 
 def estimate_total_tokens(history: list[dict], model: str = DEFAULT_MODEL) -> int:
     """
-    Estimate total token usage across a history list.
+    Estimate total token usage across a history list, without network calls.
 
     Args:
         history: List of messages (dicts with sender/type/content)
@@ -67,9 +210,9 @@ def estimate_total_tokens(history: list[dict], model: str = DEFAULT_MODEL) -> in
     for msg in history:
         try:
             formatted = f"[{msg['sender']}] ({msg['type']}): {msg['content']}"
-            total += count_tokens(formatted, model)
+            total += estimate_tokens(formatted, model)
         except Exception as e:
             print(f"Skipping token count for message due to error: {e}")
             continue
 
-    return total
\ No newline at end of file
+    return total
@@ -0,0 +1,305 @@
+# utils/tracing.py
+
+import functools
+import inspect
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from app.config import settings
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed operation: an agent's model call ("agent"), a device command
+    ("device"), execution of generated code ("exec"), a loop iteration
+    ("iteration") or a whole task ("task").
+
+    Spans started while another is active in the same context become its
+    children and share its trace id. Use `span()` as a context manager, or
+    `start_span()` and `end()` when the operation doesn't fit one block.
+    """
+
+    __slots__ = ("name", "kind", "attributes", "trace_id", "span_id", "parent_id",
+                 "started_at", "duration_ms", "status", "error", "_start", "_token")
+
+    def __init__(self, name: str, kind: str, attributes: dict[str, Any]):
+        parent = _current_span.get()
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.duration_ms: Optional[float] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException | str] = None) -> None:
+        """Close the span (once), record an error if given and hand it to the exporters."""
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+        if error is not None:
+            self.status = "error"
+            self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Ended from another context (e.g. a different thread); just drop the reference.
+            pass
+        tracer.export(self)
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end(exc)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+    def __repr__(self) -> str:
+        return f"<Span {self.kind}:{self.name} {self.duration_ms} ms {self.status}>"
+
+
+class _NoSpan:
+    """Stand-in returned while tracing is disabled."""
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def end(self, error=None) -> None:
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class JsonlExporter:
+    """Appends every finished span as one JSON line to `path`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of `values` (0 if empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))]
+
+
+class MetricsAggregator:
+    """
+    In-process latency and volume per (kind, name), e.g. ("agent", "PageSummarizerAgent").
+    Percentiles cover the last `max_samples` spans of each; counts and totals cover all.
+    """
+
+    SUMS = ("prompt_tokens", "output_tokens", "image_bytes")
+
+    def __init__(self, max_samples: int = settings.TRACE_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self._series: dict[tuple[str, str], dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            series = self._series.get((span.kind, span.name))
+            if series is None:
+                series = {"count": 0, "errors": 0, "total_ms": 0.0, "samples": deque(maxlen=self.max_samples),
+                          **dict.fromkeys(self.SUMS, 0)}
+                self._series[(span.kind, span.name)] = series
+            series["count"] += 1
+            series["errors"] += span.status != "ok"
+            series["total_ms"] += span.duration_ms
+            series["samples"].append(span.duration_ms)
+            for field in self.SUMS:
+                series[field] += span.attributes.get(field) or 0
+
+    def summary(self, kind: Optional[str] = None) -> list[dict[str, Any]]:
+        """One row per (kind, name), slowest total first, with p50/p95 and its share of its kind's time."""
+        with self._lock:
+            rows = [(key, {**series, "samples": list(series["samples"])}) for key, series in self._series.items()
+                    if kind is None or key[0] == kind]
+        kind_totals: dict[str, float] = {}
+        for (series_kind, _), series in rows:
+            kind_totals[series_kind] = kind_totals.get(series_kind, 0.0) + series["total_ms"]
+        summary = []
+        for (series_kind, name), series in rows:
+            summary.append({
+                "kind": series_kind,
+                "name": name,
+                "count": series["count"],
+                "errors": series["errors"],
+                "p50_ms": round(percentile(series["samples"], 0.5), 1),
+                "p95_ms": round(percentile(series["samples"], 0.95), 1),
+                "mean_ms": round(series["total_ms"] / series["count"], 1),
+                "total_ms": round(series["total_ms"], 1),
+                "share": round(series["total_ms"] / kind_totals[series_kind], 3) if kind_totals[series_kind] else 0.0,
+                **{field: series[field] for field in self.SUMS}
+            })
+        summary.sort(key=lambda row: (row["kind"], -row["total_ms"]))
+        return summary
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class Tracer:
+    """Hands finished spans to its exporters (anything with an `export(span)` method)."""
+
+    def __init__(self, enabled: bool = settings.TRACING_ENABLED):
+        self.enabled = enabled
+        self.exporters: list[Any] = []
+        self._lock = threading.Lock()
+
+    def add_exporter(self, exporter: Any) -> Any:
+        with self._lock:
+            self.exporters.append(exporter)
+        return exporter
+
+    def remove_exporter(self, exporter: Any) -> None:
+        with self._lock:
+            if exporter in self.exporters:
+                self.exporters.remove(exporter)
+
+    def export(self, span: Span) -> None:
+        for exporter in list(self.exporters):
+            try:
+                exporter.export(span)
+            except Exception as e:
+                print(f"Trace exporter {type(exporter).__name__} failed: {e}")
+
+
+metrics = MetricsAggregator()
+tracer = Tracer()
+tracer.add_exporter(metrics)
+if settings.TRACE_FILE:
+    tracer.add_exporter(JsonlExporter(settings.TRACE_FILE))
+
+
+def start_span(name: str, kind: str = "internal", **attributes) -> Span | _NoSpan:
+    """Start a span and make it the current one until its end()."""
+    if not tracer.enabled:
+        return _NO_SPAN
+    return Span(name, kind, attributes)
+
+
+def span(name: str, kind: str = "internal", **attributes) -> Span | _NoSpan:
+    """Context manager timing a block: `with span("exec", "exec", chars=120) as s: ...`."""
+    return start_span(name, kind, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def annotate(**attributes) -> None:
+    """Add attributes (e.g. token counts) to the current span, if any."""
+    active = _current_span.get()
+    if active is not None:
+        active.set(**attributes)
+
+
+def _record_outcome(active: Span | _NoSpan, result: Any) -> Any:
+    # Controller methods report failures as {"success": False, "error": ...} instead of raising.
+    if isinstance(active, Span) and isinstance(result, dict) and result.get("success") is False:
+        active.status = "error"
+        active.error = str(result.get("error") or "failed")
+    return result
+
+
+def traced(kind: str, name: Optional[str] = None, nested: bool = True) -> Callable:
+    """
+    Decorator running each call of a function (sync or async) in a span named
+    `name` or after the function. With nested=False, calls made inside another
+    span of the same kind are not traced separately (they are part of it).
+    """
+    def decorate(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+
+        def open_span() -> Span | _NoSpan:
+            active = _current_span.get()
+            if not nested and active is not None and active.kind == kind:
+                return _NO_SPAN
+            return start_span(span_name, kind)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with open_span() as active:
+                    return _record_outcome(active, await fn(*args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with open_span() as active:
+                return _record_outcome(active, fn(*args, **kwargs))
+        return wrapper
+    return decorate
+
+
+def trace_methods(kind: str, exclude: tuple[str, ...] = ()) -> Callable[[type], type]:
+    """
+    Class decorator tracing every public method the class defines (except
+    `exclude`). A method called by another traced method is part of the caller's span.
+    """
+    def decorate(cls: type) -> type:
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_") or attr in exclude or not inspect.isfunction(value):
+                continue
+            setattr(cls, attr, traced(kind, f"{cls.__name__}.{attr}", nested=False)(value))
+        return cls
+    return decorate